@@ -1,137 +1,195 @@
-from flask import Flask, jsonify, render_template, request, redirect, url_for, flash
-from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from flask import Flask, Blueprint, current_app, jsonify, render_template, request, redirect, url_for, flash, abort, send_file
+from sqlalchemy.orm import joinedload
+from datetime import datetime, timedelta
 import os
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_login import UserMixin, LoginManager, login_user, login_required, logout_user, current_user
+from werkzeug.security import generate_password_hash
+from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from dotenv import load_dotenv
 from itsdangerous import URLSafeTimedSerializer
 from flask_moment import Moment
-from chatbot_config import get_simple_bot_response, faqs_list 
-from classification_engine import carregar_modelos
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail as SendGridMail
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
-import pandas as pd
 import io
-import base64
-
-kmeans_model, scaler_model = carregar_modelos()
+import time
+import click
+from functools import wraps
+from models import (  # Modelos em models.py usados pelas rotas e comandos deste arquivo
+    db, url_banco, Usuario, Produto, Cliente, Venda, ClienteRFM, ProdutoVendas,
+    ProdutoVendasDia, Campanha, PerguntaFaq
+)
 
 load_dotenv()
 
 ######################################
 # Configuração inicial
 ######################################
-app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY') # Chave secreta para proteger sessões
-app.config['SECURITY_PASSWORD_SALT'] = os.getenv('SECURITY_PASSWORD_SALT')
-
-moment = Moment(app)
+# Rotas e comandos ficam no blueprint; create_app (no fim do arquivo) monta cada instância do app
+bp = Blueprint('loja', __name__, cli_group=None)
 
-# Configuração do banco de dados
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///papelaria.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+moment = Moment()
 
 ######################################
 # Sistema de Autenticação
 ######################################
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-
-class Usuario(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    nome = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(100), unique=True, nullable=False)
-    senha = db.Column(db.String(200), nullable=False)
-    tipo = db.Column(db.String(20), default='funcionario')
-
-    def verificar_senha(self, senha):
-        return check_password_hash(self.senha, senha)
+login_manager.login_view = 'loja.login'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
-
-######################################
-# Modelos do Negócio
-######################################
-class Produto(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    nome = db.Column(db.String(100), nullable=False)
-    descricao = db.Column(db.String(200))
-    preco = db.Column(db.Float, nullable=False)
-    quantidade = db.Column(db.Integer, default=0)
-    data_cadastro = db.Column(db.DateTime, default=datetime.utcnow)
-
-class Cliente(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    nome = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(100), unique=True)
-    telefone = db.Column(db.String(20))
-    endereco = db.Column(db.String(200))
-    data_cadastro = db.Column(db.DateTime, default=datetime.utcnow)
-
-class Venda(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'))
-    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'))
-    quantidade = db.Column(db.Integer, nullable=False)
-    data_venda = db.Column(db.DateTime, default=datetime.utcnow)
-    valor_total = db.Column(db.Float, nullable=False)
-    
-    cliente = db.relationship('Cliente', backref='vendas')
-    produto = db.relationship('Produto', backref='vendas')
+    return db.session.get(Usuario, int(user_id))
 
-def enviar_email_sendgrid(para_emails, assunto, html_conteudo):
+def enviar_email(para_emails, assunto, html_conteudo):
     """
-    Função helper para disparar emails usando a API do SendGrid.
+    Coloca um email na fila de saída (ver email_engine.py); a rota não espera
+    o provedor de email. Não faz commit: o email é gravado junto com o
+    commit de quem chamou.
     'para_emails' pode ser um único email (string) ou uma lista de emails.
     """
-    sg = SendGridAPIClient(os.getenv('SENDGRID_API_KEY'))
-    message = SendGridMail(
-        from_email=os.getenv('MAIL_DEFAULT_SENDER'),
-        to_emails=para_emails,
-        subject=assunto,
-        html_content=html_conteudo
-    )
-
-    try:
-        response = sg.send(message)
-        app.logger.info(f"Email enviado para {para_emails}, status: {response.status_code}")
-        return response.status_code
-    except Exception as e:
-        app.logger.error(f"Erro ao enviar email via SendGrid: {e}")
-        return None
+    from email_engine import enfileirar_email
+    enfileirar_email(para_emails, assunto, html_conteudo)
 
 ######################################
-# Inicialização do banco
+# Comandos (flask <comando>)
 ######################################
-with app.app_context():
-    db.create_all()
-    
-    if not Usuario.query.filter_by(email='admin.papelaria@example.com').first():
-        admin = Usuario(
-            nome='Administrador',
-            email='admin.papelaria@example.com',
-            senha=generate_password_hash('admin123'),
-            tipo='admin'
-        )
-        db.session.add(admin)
-        db.session.commit()
+@bp.cli.command('migrar')
+def migrar_command():
+    """Aplica as migrações pendentes do banco de dados."""
+    from migrations import aplicar_migracoes
+    novas = aplicar_migracoes(db.engine)
+    if not novas:
+        print("Banco já está atualizado.")
+
+@bp.cli.command('migracoes')
+def migracoes_command():
+    """Lista as migrações e se já foram aplicadas."""
+    from migrations import MIGRACOES, versoes_aplicadas
+    aplicadas = versoes_aplicadas(db.engine)
+    for versao, descricao, _ in sorted(MIGRACOES, key=lambda m: m[0]):
+        situacao = 'aplicada' if versao in aplicadas else 'pendente'
+        print(f"{versao:>3} [{situacao}] {descricao}")
+
+@bp.cli.command('reconstruir-rfm')
+def reconstruir_rfm_command():
+    """Recalcula do zero a tabela cliente_rfm a partir das vendas."""
+    from classification_engine import reconstruir_rfm_clientes
+    total = reconstruir_rfm_clientes()
+    print(f"Tabela cliente_rfm reconstruída: {total} clientes.")
+
+@bp.cli.command('reconstruir-vendas-produtos')
+def reconstruir_vendas_produtos_command():
+    """Recalcula do zero os totais de vendas por produto (mais vendidos)."""
+    from sales_engine import reconstruir_vendas_produtos
+    total = reconstruir_vendas_produtos()
+    print(f"Tabelas produto_vendas e produto_vendas_dia reconstruídas: {total} produtos.")
+
+@bp.cli.command('construir-indice-itens')
+def construir_indice_itens_command():
+    """Reconstrói o índice de similaridade item a item (rodar todas as noites)."""
+    from recommendation_engine import reconstruir_indice_itens
+    total = reconstruir_indice_itens()
+    print(f"Índice item a item gravado: {total} produtos.")
+
+@bp.cli.command('treinar-classificacao')
+@click.option('--lote', type=int, default=10_000, help='Clientes lidos por lote.')
+@click.option('--epocas', type=int, default=3, help='Passadas do MiniBatchKMeans pelos dados.')
+@click.option('--nao-ativar', is_flag=True, help='Só grava a versão, sem trocar a atual.')
+@click.option('--manter', type=int, default=5, help='Versões mantidas em disco (a atual nunca é apagada).')
+def treinar_classificacao_command(lote, epocas, nao_ativar, manter):
+    """Treina uma versão nova dos modelos de classificação (rodar todas as noites)."""
+    from classification_engine import treinar_modelos, remover_versoes_antigas
+    metadados = treinar_modelos(tamanho_lote=lote, epocas=epocas, ativar=not nao_ativar)
+    if metadados is None:
+        print("Treinamento falhou: poucos clientes com compras.")
+        return
+    situacao = 'gravada' if nao_ativar else 'ativada'
+    print(f"Versão {metadados['versao']} {situacao}: {metadados['linhas']} clientes, "
+          f"inércia {metadados['inercia']:.1f}, {metadados['segundos_treino']:.1f}s.")
+    if 'segmentos' in metadados:
+        print(f"Segmentos gravados: {metadados['segmentos']}")
+    removidas = remover_versoes_antigas(manter)
+    if removidas:
+        print(f"Versões antigas removidas: {', '.join(removidas)}")
+
+@bp.cli.command('modelos-classificacao')
+def modelos_classificacao_command():
+    """Lista as versões dos modelos de classificação e qual está ativa."""
+    from classification_engine import listar_versoes, versao_atual
+    atual = versao_atual()
+    for metadados in listar_versoes():
+        marcador = '*' if metadados['versao'] == atual else ' '
+        print(f"{marcador} {metadados['versao']} {metadados['linhas']} clientes, "
+              f"inércia {metadados['inercia']:.1f}, clusters {metadados['rotulos']} "
+              f"com {metadados['tamanhos_clusters']} clientes")
+
+@bp.cli.command('ativar-modelo-classificacao')
+@click.argument('versao')
+def ativar_modelo_classificacao_command(versao):
+    """Ativa uma versão gravada dos modelos (ex.: voltar para a anterior) e recalcula os segmentos."""
+    from classification_engine import ativar_versao, atualizar_segmentos, modelos_classificacao
+    try:
+        ativar_versao(versao)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    segmentos = atualizar_segmentos(*modelos_classificacao.obter())
+    print(f"Versão {versao} ativada. Segmentos gravados: {segmentos}")
+
+@bp.cli.command('atualizar-segmentos')
+def atualizar_segmentos_command():
+    """Recalcula o segmento de todos os clientes com os modelos atuais."""
+    from classification_engine import atualizar_segmentos, modelos_classificacao
+    kmeans_model, scaler_model = modelos_classificacao.obter()
+    if kmeans_model is None:
+        raise click.ClickException("Modelos de classificação não encontrados: rode `flask treinar-classificacao`.")
+    print(f"Segmentos gravados: {atualizar_segmentos(kmeans_model, scaler_model)}")
+
+@bp.cli.command('processar-emails')
+@click.option('--continuo', is_flag=True, help='Continua rodando e verificando a fila (worker externo).')
+def processar_emails_command(continuo):
+    """Envia os emails pendentes da fila de saída."""
+    from email_engine import processar_fila, INTERVALO_VERIFICACAO
+    while True:
+        totais = processar_fila()
+        if totais['enviados'] or totais['falhas'] or not continuo:
+            print(f"Emails enviados: {totais['enviados']}, falhas: {totais['falhas']}")
+        if not continuo:
+            break
+        time.sleep(INTERVALO_VERIFICACAO)
+
+@bp.cli.command('campanha-recomendacoes')
+@click.option('--segmento', default=None, help="Só clientes desta classificação (ex.: 'Fiel').")
+@click.option('--simular', 'pasta', default=None, help='Grava os emails nesta pasta em vez de enviar.')
+@click.option('--retomar', 'campanha_id', type=int, default=None, help='Continua uma campanha interrompida.')
+@click.option('--lote', type=int, default=500, help='Clientes por lote.')
+def campanha_recomendacoes_command(segmento, pasta, campanha_id, lote):
+    """Envia emails de recomendação para todos os clientes (ou um segmento)."""
+    from campaign_engine import iniciar_campanha, executar_campanha
+
+    if campanha_id is None:
+        campanha_id = iniciar_campanha(segmento, pasta).id
+    print(f"Campanha {campanha_id}")
+
+    def mostrar_progresso(campanha):
+        percentual = 100 * campanha.processados / campanha.total_clientes if campanha.total_clientes else 100
+        print(f"  {campanha.processados}/{campanha.total_clientes} clientes ({percentual:.0f}%), "
+              f"{campanha.enfileirados} emails")
+
+    campanha = executar_campanha(campanha_id, lote, mostrar_progresso)
+    destino = f"gravados em {campanha.pasta_simulacao}" if campanha.pasta_simulacao else "na fila de envio"
+    print(f"Campanha {campanha.id} concluída: {campanha.enfileirados} emails {destino}.")
+
+@bp.cli.command('campanhas')
+def campanhas_command():
+    """Lista as campanhas de recomendação e o progresso de cada uma."""
+    for campanha in Campanha.query.order_by(Campanha.id).all():
+        print(f"{campanha.id:>4} [{campanha.status}] segmento={campanha.segmento or 'todos'} "
+              f"{campanha.processados}/{campanha.total_clientes} clientes, {campanha.enfileirados} emails"
+              f"{' (simulação)' if campanha.pasta_simulacao else ''}")
 
 ######################################
 # Rotas de autenticação
 ######################################
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('loja.home'))
     
     if request.method == 'POST':
         email = request.form['email']
@@ -141,13 +199,13 @@ def login():
         if usuario and usuario.verificar_senha(senha):
             login_user(usuario)
             flash(f'Bem-vindo(a), {usuario.nome}!', 'success')
-            return redirect(url_for('home'))
+            return redirect(url_for('loja.home'))
         
         flash('Credenciais inválidas!', 'danger')
     
     return render_template('auth/login.html')
 
-@app.route('/cadastro', methods=['GET', 'POST'])
+@bp.route('/cadastro', methods=['GET', 'POST'])
 def cadastro():
     if request.method == 'POST':
         try:
@@ -158,13 +216,12 @@ def cadastro():
                 tipo='funcionario'
             )
             db.session.add(novo_usuario)
-            db.session.commit()
-
-            # Chama o envio do email de boas-vindas
+            # Email de boas-vindas entra na fila junto com o cadastro
             enviar_email_boas_vindas(novo_usuario)
+            db.session.commit()
 
             flash('Cadastro realizado! Faça login.', 'success')
-            return redirect(url_for('login'))
+            return redirect(url_for('loja.login'))
         except:
             db.session.rollback()
             flash('Email já cadastrado!', 'danger')
@@ -178,11 +235,11 @@ def enviar_email_boas_vindas(usuario):
         <h2>Olá, {usuario.nome}!</h2>
         <p>Seu cadastro foi realizado com sucesso.</p>
         <p>Seu login é: {usuario.email}</p>
-        <p><a href="{url_for('login', _external=True)}">Clique aqui para acessar o sistema</a></p>
+        <p><a href="{url_for('loja.login', _external=True)}">Clique aqui para acessar o sistema</a></p>
         """
-        enviar_email_sendgrid(usuario.email, assunto, html)
+        enviar_email(usuario.email, assunto, html)
 
-@app.route('/esqueci-minha-senha', methods=['GET', 'POST'])
+@bp.route('/esqueci-minha-senha', methods=['GET', 'POST'])
 def esqueci_minha_senha():
     if request.method == 'POST':
         email = request.form['email']
@@ -190,8 +247,9 @@ def esqueci_minha_senha():
         if usuario:
             # Enviar email com link para redefinir senha
             enviar_email_redefinicao_senha(usuario)
+            db.session.commit()
             flash('Email de redefinição de senha enviado!', 'success')
-            return redirect(url_for('login'))
+            return redirect(url_for('loja.login'))
         flash('Email não encontrado!', 'danger')
     return render_template('auth/esqueci_minha_senha.html')
 
@@ -202,36 +260,36 @@ def enviar_email_redefinicao_senha(usuario):
         <h2>Olá, {usuario.nome}!</h2>
         <p>Recebemos um pedido para redefinir sua senha.</p>
         <p>Para redefinir sua senha, clique no link abaixo:</p>
-        <p><a href="{url_for('redefinir_senha', token=token, _external=True)}">Redefinir Senha</a></p>
+        <p><a href="{url_for('loja.redefinir_senha', token=token, _external=True)}">Redefinir Senha</a></p>
         """
-    enviar_email_sendgrid(usuario.email, assunto, html)
+    enviar_email(usuario.email, assunto, html)
 
 def gerar_token_redefinicao_senha(usuario):
-    s = URLSafeTimedSerializer(app.config['SECRET_KEY'])
-    return s.dumps({'user_id': usuario.id}, salt=app.config['SECURITY_PASSWORD_SALT'])
+    s = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
+    return s.dumps({'user_id': usuario.id}, salt=current_app.config['SECURITY_PASSWORD_SALT'])
 
-@app.route('/redefinir-senha/<token>', methods=['GET', 'POST'])
+@bp.route('/redefinir-senha/<token>', methods=['GET', 'POST'])
 def redefinir_senha(token):
     usuario = verificar_token_redefinicao_senha(token)
     if not usuario:
         flash('O link é inválido ou expirou.', 'danger')
-        return redirect(url_for('login'))
+        return redirect(url_for('loja.login'))
     
     if request.method == 'POST':
         nova_senha = request.form['senha']
         usuario.senha = generate_password_hash(nova_senha)
         db.session.commit()
         flash('Senha alterada com sucesso!', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('loja.login'))
     
     return render_template('auth/redefinir_senha.html', token=token)
 
 def verificar_token_redefinicao_senha(token, tempo_expiracao=900000):
-    s = URLSafeTimedSerializer(app.config['SECRET_KEY'])
+    s = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
     try:
         data = s.loads(
             token,
-            salt=app.config['SECURITY_PASSWORD_SALT'],
+            salt=current_app.config['SECURITY_PASSWORD_SALT'],
             max_age=tempo_expiracao
         )
     except Exception:
@@ -242,139 +300,142 @@ def enviar_email_recomendacao(cliente, produtos, tipo):
     """
     Envia um email de recomendação para um cliente específico.
     """
-    html_lista_produtos = "<ul style='list-style-type: none; padding-left: 0;'>"
-    for p in produtos:
-        preco_formatado = f"R$ {p.preco:.2f}".replace('.', ',')
-        html_lista_produtos += f"""
-        <li style='margin-bottom: 15px; border: 1px solid #ddd; padding: 10px; border-radius: 5px;'>
-            <strong style='font-size: 1.1em;'>{p.nome}</strong><br>
-            <span style='color: #333;'>{p.descricao or 'Sem descrição'}</span><br>
-            <span style='font-size: 1.1em; font-weight: bold; color: #0056b3;'>{preco_formatado}</span>
-        </li>
-        """
-    html_lista_produtos += "</ul>"
-
-    if tipo == 'personalizada':
-        titulo = f"Olá, {cliente.nome}! Vimos que você pode gostar destes produtos:"
-        assunto_base = "Temos sugestões especiais para você!"
-    else:
-        titulo = f"Olá, {cliente.nome}! Confira nossos produtos mais populares:"
-        assunto_base = "Confira os mais vendidos da Papelaria Arte & Papel!"
+    from email_engine import renderizar_email_recomendacao
 
-    assunto_completo = f"{assunto_base} - Papelaria Arte & Papel"
+    assunto_completo, html = renderizar_email_recomendacao(cliente, produtos, tipo)
+    enviar_email(cliente.email, assunto_completo, html)
 
-    html = f"""
-        <div style='font-family: Arial, sans-serif; line-height: 1.6;'>
-            <h2 style='color: #004a99;'>{titulo}</h2>
-            <p>Aqui estão algumas sugestões que separamos para você:</p>
-            {html_lista_produtos}
-            <p>Esperamos te ver em breve!</p>
-            <hr>
-            <p style='font-size: 0.9em; color: #777;'>
-                Atenciosamente,<br>Equipe Arte & Papel
-            </p>
-        </div>
-        """
-    enviar_email_sendgrid(cliente.email, assunto_completo, html)
-
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('Você saiu do sistema.', 'info')
-    return redirect(url_for('login'))
+    return redirect(url_for('loja.login'))
 
 ######################################
 # Rotas principais
 ######################################
 
-def gerar_grafico_vendas():
-    vendas = db.session.query(
-        Venda.data_venda, 
-        Venda.valor_total
-    ).all()
-    
-    if not vendas:
-        return None
-
-    df = pd.DataFrame(vendas, columns=['data', 'valor'])
-    df['data'] = pd.to_datetime(df['data']).dt.date
-    df_agrupado = df.groupby('data')['valor'].sum().reset_index()
-    df_agrupado['data'] = pd.to_datetime(df_agrupado['data']).dt.strftime('%d/%m/%Y')
-
-    sns.set_theme(style="whitegrid")
-    plt.figure(figsize=(10, 5))
-    
-    cores = sns.color_palette("blend:#007bff,#e83e8c", n_colors=len(df_agrupado))
-    
-    grafico = sns.barplot(x='data', y='valor', data=df_agrupado, palette=cores)
-    plt.title('Receita de Vendas por Dia', color='#333333')
-    plt.xlabel('Data')
-    plt.ylabel('Total (R$)')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-
-    img = io.BytesIO()
-    plt.savefig(img, format='png')
-    img.seek(0)
-    plt.close()
-    return base64.b64encode(img.getvalue()).decode('utf8')
-
-def gerar_grafico_produtos_top():
-    resultados = db.session.query(
-        Produto.nome, 
-        db.func.sum(Venda.valor_total).label('total_vendas')
-    ).join(Venda).group_by(Produto.nome).order_by(db.text('total_vendas DESC')).limit(5).all()
-
-    if not resultados:
-        return None
-
-    df = pd.DataFrame(resultados, columns=['produto', 'total'])
-
-    sns.set_theme(style="whitegrid")
-    plt.figure(figsize=(8, 5))
-    
-    cores = sns.color_palette("blend:#e83e8c,#007bff", n_colors=len(df))
-    
-    sns.barplot(x='total', y='produto', data=df, palette=cores, orient='h')
-    plt.title('Top 5 Produtos por Receita', color='#333333')
-    plt.xlabel('Receita Total (R$)')
-    plt.ylabel('')
-    plt.tight_layout()
-
-    img = io.BytesIO()
-    plt.savefig(img, format='png')
-    img.seek(0)
-    plt.close()
-
-    return base64.b64encode(img.getvalue()).decode('utf8')
-
-
-@app.route('/')
+@bp.route('/')
 @login_required
 def home():
     from recommendation_engine import get_best_sellers
+    from dashboard_engine import obter_grafico, resolver_periodo
     
     produtos_mais_vendidos = get_best_sellers(n=6)
+
+    try:
+        periodo = resolver_periodo(request.args)
+    except (KeyError, ValueError):
+        flash('Período inválido. Exibindo os últimos 30 dias.', 'danger')
+        periodo = resolver_periodo({})
     
-    grafico_vendas_img = gerar_grafico_vendas()
-    grafico_top_produtos_img = gerar_grafico_produtos_top()
+    # Os PNGs vêm do cache; a página só aponta para a rota /graficos/<nome>.png
+    grafico_vendas = obter_grafico('vendas', periodo)
+    grafico_top_produtos = obter_grafico('produtos', periodo)
     
     return render_template('index.html', 
                          titulo="Papelaria Arte & Papel",
                          mensagem="Bem-vindo ao sistema de gerenciamento!",
                          produtos_mais_vendidos=produtos_mais_vendidos,
-                         grafico_vendas=grafico_vendas_img,
-                         grafico_produtos=grafico_top_produtos_img)
+                         periodo=periodo,
+                         grafico_vendas=grafico_vendas.png is not None,
+                         grafico_produtos=grafico_top_produtos.png is not None)
+
+@bp.route('/graficos/<nome>.png')
+@login_required
+def grafico_dashboard(nome):
+    from dashboard_engine import obter_grafico, resolver_periodo, GERADORES_GRAFICOS
+
+    if nome not in GERADORES_GRAFICOS:
+        abort(404)
+
+    try:
+        periodo = resolver_periodo(request.args)
+    except (KeyError, ValueError):
+        abort(400)
+
+    grafico = obter_grafico(nome, periodo)
+    if grafico.png is None:
+        abort(404)
+
+    # ETag + Last-Modified: o navegador revalida e recebe 304 enquanto não houver vendas novas
+    resposta = send_file(
+        io.BytesIO(grafico.png),
+        mimetype='image/png',
+        etag=grafico.etag,
+        last_modified=grafico.gerado_em,
+        conditional=True
+    )
+    resposta.cache_control.private = True
+    return resposta
+
+@bp.route('/api/vendas/receita')
+@login_required
+def api_receita_vendas():
+    from dashboard_engine import receita_por_periodo, resolver_periodo
+
+    try:
+        periodo = resolver_periodo(request.args)
+    except (KeyError, ValueError) as e:
+        return jsonify({'erro': f'Parâmetros de período inválidos: {e}'}), 400
+
+    return jsonify({
+        'periodo': periodo.nome,
+        'inicio': periodo.inicio.strftime('%Y-%m-%d'),
+        'fim': (periodo.fim - timedelta(days=1)).strftime('%Y-%m-%d'),
+        'granularidade': periodo.granularidade,
+        'serie': receita_por_periodo(periodo)
+    })
+
+######################################
+# Paginação (keyset)
+######################################
+POR_PAGINA_PADRAO = 50
+POR_PAGINA_MAXIMO = 200
+
+def tamanho_pagina():
+    """Lê ?por_pagina= da URL, limitado a POR_PAGINA_MAXIMO."""
+    try:
+        por_pagina = int(request.args.get('por_pagina', POR_PAGINA_PADRAO))
+    except ValueError:
+        por_pagina = POR_PAGINA_PADRAO
+    return max(1, min(por_pagina, POR_PAGINA_MAXIMO))
+
+def buscar_pagina(query, por_pagina):
+    """
+    Busca uma linha a mais que o tamanho da página só para saber se existe
+    próxima página. Retorna (itens, tem_proxima).
+    """
+    itens = query.limit(por_pagina + 1).all()
+    return itens[:por_pagina], len(itens) > por_pagina
+
+def cursor_por_id():
+    """Cursor ?apos=<id> das listagens ordenadas por id."""
+    try:
+        return int(request.args['apos'])
+    except (KeyError, ValueError):
+        return None
 
 # Rotas de Produtos
-@app.route('/produtos')
+@bp.route('/produtos')
 @login_required
 def listar_produtos():
-    produtos = Produto.query.all()
-    return render_template("produtos/listar.html", produtos=produtos)
+    por_pagina = tamanho_pagina()
+    apos = cursor_por_id()
 
-@app.route('/produtos/novo', methods=['GET', 'POST'])
+    # Paginação por chave (WHERE id > último visto), sem OFFSET
+    query = Produto.query.order_by(Produto.id)
+    if apos is not None:
+        query = query.filter(Produto.id > apos)
+    produtos, tem_proxima = buscar_pagina(query, por_pagina)
+
+    proximo_cursor = produtos[-1].id if tem_proxima else None
+    return render_template("produtos/listar.html", produtos=produtos,
+                           por_pagina=por_pagina, proximo_cursor=proximo_cursor,
+                           primeira_pagina=apos is None)
+
+@bp.route('/produtos/novo', methods=['GET', 'POST'])
 @login_required
 def cadastrar_produto():
     if request.method == 'POST':
@@ -387,11 +448,11 @@ def cadastrar_produto():
         db.session.add(novo_produto)
         db.session.commit()
         flash('Produto cadastrado com sucesso!', 'success')
-        return redirect(url_for('listar_produtos'))
+        return redirect(url_for('loja.listar_produtos'))
     return render_template('produtos/cadastrar.html')
 
 # Editar produtos
-@app.route('/produtos/editar/<int:id>', methods=['GET', 'POST'])
+@bp.route('/produtos/editar/<int:id>', methods=['GET', 'POST'])
 def editar_produto(id):
     produto = Produto.query.get_or_404(id)
     if request.method == 'POST':
@@ -400,38 +461,63 @@ def editar_produto(id):
         produto.preco = float(request.form['preco'])
         produto.quantidade = int(request.form['quantidade'])
         db.session.commit()
+        from dashboard_engine import invalidar_graficos
+        from recommendation_engine import invalidar_recomendacoes
+        invalidar_graficos()
+        invalidar_recomendacoes() # Nome e preço fazem parte das recomendações guardadas
         flash('Produto atualizado com sucesso!', 'success')
-        return redirect(url_for('listar_produtos'))
+        return redirect(url_for('loja.listar_produtos'))
     return render_template('produtos/editar.html', produto=produto)
 
 # Excluir produtos
-@app.route('/produtos/deletar/<int:id>', methods=['POST'])
+@bp.route('/produtos/deletar/<int:id>', methods=['POST'])
 def deletar_produto(id):
     produto = Produto.query.get_or_404(id)
+    ProdutoVendas.query.filter_by(produto_id=id).delete()
+    ProdutoVendasDia.query.filter_by(produto_id=id).delete()
     db.session.delete(produto)
     db.session.commit()
+    from dashboard_engine import invalidar_graficos
+    from recommendation_engine import invalidar_matriz_compras, invalidar_recomendacoes
+    invalidar_graficos()
+    invalidar_matriz_compras() # O produto não pode mais ser recomendado
+    invalidar_recomendacoes()
     flash('Produto excluído com sucesso!', 'success')
-    return redirect(url_for('listar_produtos'))
+    return redirect(url_for('loja.listar_produtos'))
 
 # Rotas de Clientes
-@app.route('/clientes')
+@bp.route('/clientes')
 @login_required
 def listar_clientes():
-    from classification_engine import classificar_cliente
-
-    clientes = Cliente.query.all()
-
-    clientes_com_classificacao = []
-    for cliente in clientes:
-        classificacao = classificar_cliente(cliente.id, kmeans_model, scaler_model)
-        clientes_com_classificacao.append({
-            'cliente': cliente,
-            'classificacao': classificacao
-        })
+    from classification_engine import SEGMENTOS, classificacoes_clientes
+
+    por_pagina = tamanho_pagina()
+    apos = cursor_por_id()
+    segmento = request.args.get('segmento') or None
+    if segmento is not None and segmento not in SEGMENTOS:
+        abort(400)
+
+    query = Cliente.query.order_by(Cliente.id)
+    if segmento is not None:
+        query = query.filter(Cliente.segmento == segmento) # Índice (segmento, id)
+    if apos is not None:
+        query = query.filter(Cliente.id > apos)
+    clientes, tem_proxima = buscar_pagina(query, por_pagina)
+
+    # Segmento gravado no último treino; só clientes ainda sem segmento são classificados na hora
+    classificacoes = classificacoes_clientes(clientes)
+
+    clientes_com_classificacao = [
+        {'cliente': cliente, 'classificacao': classificacoes[cliente.id]}
+        for cliente in clientes
+    ]
 
-    return render_template('clientes/listar.html', clientes_info=clientes_com_classificacao)
+    proximo_cursor = clientes[-1].id if tem_proxima else None
+    return render_template('clientes/listar.html', clientes_info=clientes_com_classificacao,
+                           por_pagina=por_pagina, proximo_cursor=proximo_cursor,
+                           primeira_pagina=apos is None, segmentos=SEGMENTOS, segmento=segmento)
 
-@app.route('/clientes/novo', methods=['GET', 'POST'])
+@bp.route('/clientes/novo', methods=['GET', 'POST'])
 @login_required
 def cadastrar_cliente():
     if request.method == 'POST':
@@ -444,11 +530,11 @@ def cadastrar_cliente():
         db.session.add(novo_cliente)
         db.session.commit()
         flash('Cliente cadastrado com sucesso!', 'success')
-        return redirect(url_for('listar_clientes'))
+        return redirect(url_for('loja.listar_clientes'))
     return render_template('clientes/cadastrar.html')
 
 # Editar Cliente
-@app.route('/clientes/editar/<int:id>', methods=['GET', 'POST'])
+@bp.route('/clientes/editar/<int:id>', methods=['GET', 'POST'])
 def editar_cliente(id):
     cliente = Cliente.query.get_or_404(id)
     if request.method == 'POST':
@@ -458,58 +544,170 @@ def editar_cliente(id):
         cliente.endereco = request.form['endereco']
         db.session.commit()
         flash('Cliente atualizado com sucesso!', 'success')
-        return redirect(url_for('listar_clientes'))
+        return redirect(url_for('loja.listar_clientes'))
     return render_template('clientes/editar.html', cliente=cliente)
 
 # Excluir Cliente
-@app.route('/clientes/deletar/<int:id>', methods=['POST'])
+@bp.route('/clientes/deletar/<int:id>', methods=['POST'])
 def deletar_cliente(id):
     cliente = Cliente.query.get_or_404(id)
+    ClienteRFM.query.filter_by(cliente_id=id).delete()
     db.session.delete(cliente)
     db.session.commit()
+    from recommendation_engine import invalidar_matriz_compras, invalidar_recomendacoes_cliente
+    invalidar_matriz_compras() # O cliente não pode mais ser vizinho de ninguém
+    invalidar_recomendacoes_cliente(id)
     flash('Cliente excluído com sucesso!', 'success')
-    return redirect(url_for('listar_clientes'))
+    return redirect(url_for('loja.listar_clientes'))
 
 # Rotas de Vendas
-@app.route('/vendas')
+@bp.route('/vendas')
 @login_required
 def listar_vendas():
-    vendas = Venda.query.all()
-    return render_template('vendas/listar.html', vendas=vendas)
+    por_pagina = tamanho_pagina()
 
-@app.route('/vendas/nova', methods=['GET', 'POST'])
+    # Mais recentes primeiro. O cursor é "<data_venda ISO>_<id>" da última venda
+    # da página anterior; o id desempata vendas com a mesma data.
+    from search_engine import filtrar_vendas
+
+    query = Venda.query.options(
+        joinedload(Venda.cliente),
+        joinedload(Venda.produto)
+    ).order_by(Venda.data_venda.desc(), Venda.id.desc())
+
+    try:
+        query = filtrar_vendas(query, request.args)
+    except ValueError:
+        flash('Filtro inválido.', 'danger')
+        return redirect(url_for('loja.listar_vendas'))
+
+    cursor = request.args.get('apos')
+    if cursor:
+        try:
+            data_cursor, id_cursor = cursor.rsplit('_', 1)
+            data_cursor, id_cursor = datetime.fromisoformat(data_cursor), int(id_cursor)
+        except ValueError:
+            abort(400)
+        query = query.filter(db.or_(
+            Venda.data_venda < data_cursor,
+            db.and_(Venda.data_venda == data_cursor, Venda.id < id_cursor)
+        ))
+    vendas, tem_proxima = buscar_pagina(query, por_pagina)
+
+    proximo_cursor = None
+    if tem_proxima:
+        ultima = vendas[-1]
+        proximo_cursor = f"{ultima.data_venda.isoformat()}_{ultima.id}"
+    return render_template('vendas/listar.html', vendas=vendas,
+                           por_pagina=por_pagina, proximo_cursor=proximo_cursor,
+                           primeira_pagina=not cursor)
+
+@bp.route('/vendas/nova', methods=['GET', 'POST'])
 @login_required
 def nova_venda():
     if request.method == 'POST':
+        from sales_engine import registrar_pedido
+
+        # Um pedido com um ou mais itens: campos produto_id e quantidade repetidos
+        itens = list(zip(request.form.getlist('produto_id'), request.form.getlist('quantidade')))
         try:
-            produto = Produto.query.get(request.form['produto_id'])
-            if produto.quantidade < int(request.form['quantidade']):
-                flash('Estoque insuficiente!', 'danger')
-                return redirect(url_for('nova_venda'))
-            
-            nova_venda = Venda(
-                cliente_id=request.form['cliente_id'],
-                produto_id=request.form['produto_id'],
-                quantidade=int(request.form['quantidade']),
-                valor_total=float(produto.preco) * int(request.form['quantidade'])
-            )
-            
-            produto.quantidade -= nova_venda.quantidade
-            db.session.add(nova_venda)
-            db.session.commit()
+            registrar_pedido(request.form['cliente_id'], itens)
             flash('Venda registrada!', 'success')
-            return redirect(url_for('listar_vendas'))
+            return redirect(url_for('loja.listar_vendas'))
         except Exception as e:
-            db.session.rollback()
             flash(f'Erro: {str(e)}', 'danger')
-            return redirect(url_for('nova_venda'))
+            return redirect(url_for('loja.nova_venda'))
     
-    clientes = Cliente.query.all()
-    produtos = Produto.query.filter(Produto.quantidade > 0).all()
-    return render_template('vendas/nova.html', clientes=clientes, produtos=produtos)
+    # Cliente e produto são escolhidos por busca (type-ahead), sem carregar o catálogo inteiro
+    return render_template('vendas/nova.html')
+
+@bp.route('/api/pedidos', methods=['POST'])
+@login_required
+def api_criar_pedido():
+    """
+    Checkout em JSON: {"cliente_id": 1, "itens": [{"produto_id": 2, "quantidade": 3}, ...]}.
+    Grava o pedido inteiro numa única transação ou nada.
+    """
+    from sales_engine import registrar_pedido
+
+    dados = request.get_json(silent=True) or {}
+    if not isinstance(dados, dict):
+        return jsonify({'erro': 'O corpo deve ser um objeto JSON'}), 400
+    itens_json = dados.get('itens', [])
+    if not isinstance(itens_json, list) or not all(isinstance(item, dict) for item in itens_json):
+        return jsonify({'erro': "'itens' deve ser uma lista de objetos"}), 400
+    try:
+        itens = [(item['produto_id'], item['quantidade']) for item in itens_json]
+        pedido = registrar_pedido(dados['cliente_id'], itens)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'erro': str(e)}), 400
+
+    return jsonify({
+        'id': pedido.id,
+        'cliente_id': pedido.cliente_id,
+        'valor_total': pedido.valor_total,
+        'data_pedido': pedido.data_pedido.isoformat()
+    }), 201
+
+######################################
+# Rotas de busca
+######################################
+@bp.route('/api/clientes/busca')
+@login_required
+def api_buscar_clientes():
+    from search_engine import buscar_clientes, limite_da_requisicao
+
+    clientes = buscar_clientes(request.args.get('q', ''), limite_da_requisicao(request.args))
+    return jsonify([
+        {'id': c.id, 'nome': c.nome, 'email': c.email}
+        for c in clientes
+    ])
+
+@bp.route('/api/produtos/busca')
+@login_required
+def api_buscar_produtos():
+    from search_engine import buscar_produtos, limite_da_requisicao
+
+    produtos = buscar_produtos(
+        request.args.get('q', ''),
+        limite_da_requisicao(request.args),
+        somente_em_estoque=request.args.get('em_estoque') == '1'
+    )
+    return jsonify([
+        {'id': p.id, 'nome': p.nome, 'descricao': p.descricao, 'preco': p.preco, 'quantidade': p.quantidade}
+        for p in produtos
+    ])
+
+@bp.route('/api/vendas/busca')
+@login_required
+def api_buscar_vendas():
+    from search_engine import filtrar_vendas, limite_da_requisicao
+
+    query = Venda.query.options(
+        joinedload(Venda.cliente),
+        joinedload(Venda.produto)
+    ).order_by(Venda.data_venda.desc(), Venda.id.desc())
+    try:
+        query = filtrar_vendas(query, request.args)
+    except ValueError as e:
+        return jsonify({'erro': f'Filtro inválido: {e}'}), 400
+
+    vendas = query.limit(limite_da_requisicao(request.args)).all()
+    return jsonify([
+        {
+            'id': v.id,
+            'pedido_id': v.pedido_id,
+            'cliente': v.cliente.nome if v.cliente else None,
+            'produto': v.produto.nome if v.produto else None,
+            'quantidade': v.quantidade,
+            'valor_total': v.valor_total,
+            'data_venda': v.data_venda.isoformat()
+        }
+        for v in vendas
+    ])
 
 # Página de Suporte
-@app.route('/suporte', methods=['GET', 'POST'])
+@bp.route('/suporte', methods=['GET', 'POST'])
 def suporte():
     if request.method == 'POST':
         destinatario = request.form['destinatario']
@@ -528,13 +726,14 @@ def suporte():
             <p style='white-space: pre-wrap;'>{mensagem}</p>
         </div>
         """
-        enviar_email_sendgrid(destinatario, assunto_final, html)
-        enviar_email_sendgrid(solicitante, assunto_final, html)
+        enviar_email(destinatario, assunto_final, html)
+        enviar_email(solicitante, assunto_final, html)
+        db.session.commit()
 
         flash('Sua mensagem foi enviada. Entraremos em contato em breve!', 'success')
         if current_user.is_authenticated:
-            return redirect(url_for('home'))
-        return redirect(url_for('login'))
+            return redirect(url_for('loja.home'))
+        return redirect(url_for('loja.login'))
 
     return render_template('support/support.html', data_hora=datetime.now(), mail_owner=os.getenv('MAIL_OWNER'))
 
@@ -560,13 +759,81 @@ def traduzir_assunto(assunto):
 
 
 # Rotas do Chatbot e FAQ
-@app.route('/faq')
+def admin_obrigatorio(funcao):
+    """Só usuários do tipo 'admin' acessam a rota (os demais recebem 403)."""
+    @wraps(funcao)
+    def verificar(*args, **kwargs):
+        if not current_user.is_authenticated or current_user.tipo != 'admin':
+            abort(403)
+        return funcao(*args, **kwargs)
+    return verificar
+
+@bp.route('/faq')
 @login_required
 def faq():
-    return render_template('support/faq.html', faqs=faqs_list)
+    por_pagina = tamanho_pagina()
+    apos = cursor_por_id()
+
+    query = PerguntaFaq.query.order_by(PerguntaFaq.id)
+    if apos is not None:
+        query = query.filter(PerguntaFaq.id > apos)
+    perguntas, tem_proxima = buscar_pagina(query, por_pagina)
+
+    proximo_cursor = perguntas[-1].id if tem_proxima else None
+    return render_template('support/faq.html', perguntas=perguntas,
+                           por_pagina=por_pagina, proximo_cursor=proximo_cursor,
+                           primeira_pagina=apos is None)
+
+def _faq_alterado():
+    # O índice do assistente deste processo é atualizado em segundo plano;
+    # os outros workers percebem a mudança na próxima verificação
+    from chatbot_config import gerenciador_indice_faq
+    gerenciador_indice_faq().avisar_mudanca()
+
+@bp.route('/faq/nova', methods=['GET', 'POST'])
+@login_required
+@admin_obrigatorio
+def cadastrar_pergunta_faq():
+    if request.method == 'POST':
+        db.session.add(PerguntaFaq(
+            pergunta=request.form['pergunta'].strip(),
+            resposta=request.form['resposta'].strip()
+        ))
+        db.session.commit()
+        _faq_alterado()
+        flash('Pergunta cadastrada com sucesso!', 'success')
+        return redirect(url_for('loja.faq'))
+    return render_template('support/faq_form.html', pergunta=None)
 
-@app.route("/chat", methods=["POST"])
+@bp.route('/faq/editar/<int:id>', methods=['GET', 'POST'])
+@login_required
+@admin_obrigatorio
+def editar_pergunta_faq(id):
+    pergunta = PerguntaFaq.query.get_or_404(id)
+    if request.method == 'POST':
+        pergunta.pergunta = request.form['pergunta'].strip()
+        pergunta.resposta = request.form['resposta'].strip()
+        db.session.commit()
+        _faq_alterado()
+        flash('Pergunta atualizada com sucesso!', 'success')
+        return redirect(url_for('loja.faq'))
+    return render_template('support/faq_form.html', pergunta=pergunta)
+
+@bp.route('/faq/deletar/<int:id>', methods=['POST'])
+@login_required
+@admin_obrigatorio
+def deletar_pergunta_faq(id):
+    pergunta = PerguntaFaq.query.get_or_404(id)
+    db.session.delete(pergunta)
+    db.session.commit()
+    _faq_alterado()
+    flash('Pergunta excluída com sucesso!', 'success')
+    return redirect(url_for('loja.faq'))
+
+@bp.route("/chat", methods=["POST"])
 def chat():
+    from chatbot_config import get_simple_bot_response
+
     data = request.get_json()
     user_message = data.get("mensagem")
     if not user_message:
@@ -575,37 +842,51 @@ def chat():
     bot_response = get_simple_bot_response(user_message)
     return jsonify({"resposta": bot_response})
 
+LIMITE_CHAT_LOTE = 500
+
+@bp.route("/chat/batch", methods=["POST"])
+def chat_lote():
+    """
+    Responde várias mensagens numa única chamada vetorizada:
+    {"mensagens": ["...", ...], "k": 3} -> {"respostas": [{"mensagem", "resposta", "melhores": [...]}, ...]}
+    """
+    from chatbot_config import buscar_respostas_lote, resposta_do_bot, TOP_K_PADRAO
+
+    data = request.get_json(silent=True) or {}
+    mensagens = data.get("mensagens")
+    if not isinstance(mensagens, list) or not all(isinstance(m, str) for m in mensagens):
+        return jsonify({"erro": "Envie 'mensagens' como uma lista de textos."}), 400
+    if len(mensagens) > LIMITE_CHAT_LOTE:
+        return jsonify({"erro": f"No máximo {LIMITE_CHAT_LOTE} mensagens por chamada."}), 400
+    try:
+        k = max(1, min(int(data.get("k", TOP_K_PADRAO)), 10))
+    except (TypeError, ValueError):
+        return jsonify({"erro": "'k' deve ser um número."}), 400
+
+    respostas = []
+    for mensagem, melhores in zip(mensagens, buscar_respostas_lote(mensagens, k)):
+        respostas.append({"mensagem": mensagem, "resposta": resposta_do_bot(melhores), "melhores": melhores})
+    return jsonify({"respostas": respostas})
+
 # Rotas de Recomendação
-@app.route('/recomendar/cliente/<int:id>')
+@bp.route('/recomendar/cliente/<int:id>')
 @login_required
 def recomendar_para_cliente(id):
-    from recommendation_engine import recommend_for_client_knn, get_best_sellers
+    from recommendation_engine import recomendacao_para_cliente
     
-    # Tenta obter recomendações personalizadas primeiro
-    produtos_recomendados = recommend_for_client_knn(client_id=id)
-    
-    # Se a lista de recomendações personalizadas estiver vazia...
-    if not produtos_recomendados:
-        # ...busque os produtos mais vendidos como um fallback.
-        produtos_recomendados = get_best_sellers(n=3) # Pega os 3 mais vendidos
-        tipo_recomendacao = 'fallback'
-    else:
-        tipo_recomendacao = 'personalizada'
+    # ?motor=itens usa o índice item a item; o padrão é o KNN por clientes
+    motor = 'itens' if request.args.get('motor') == 'itens' else 'knn'
 
+    # Retorna um objeto JSON com o tipo, o motor e a lista de produtos (do cache, se possível)
+    return jsonify(recomendacao_para_cliente(id, motor))
 
-   # Transforma a lista de produtos em um formato JSON
-    resultado_produtos = [
-        {'id': p.id, 'nome': p.nome, 'preco': p.preco} 
-        for p in produtos_recomendados
-    ]
-    
-    # Retorna um objeto JSON com o tipo e a lista de produtos
-    return jsonify({
-        'tipo': tipo_recomendacao,
-        'produtos': resultado_produtos
-    })
+@bp.route('/api/recomendacoes/cache')
+@login_required
+def estatisticas_cache_recomendacoes():
+    from recommendation_engine import estatisticas_cache_recomendacoes as estatisticas
+    return jsonify(estatisticas())
 
-@app.route('/enviar-recomendacoes/cliente/<int:id>', methods=['POST'])
+@bp.route('/enviar-recomendacoes/cliente/<int:id>', methods=['POST'])
 @login_required
 def enviar_recomendacoes_email(id):
     from recommendation_engine import recommend_for_client_knn, get_best_sellers
@@ -626,13 +907,62 @@ def enviar_recomendacoes_email(id):
 
     try:
         enviar_email_recomendacao(cliente, produtos_recomendados, tipo_recomendacao)
+        db.session.commit()
         return jsonify({'status': 'success', 'message': f'Email de recomendação enviado para {cliente.email}!'})
     except Exception as e:
-        app.logger.error(f"Erro ao enviar email: {str(e)}")
+        db.session.rollback()
+        current_app.logger.error(f"Erro ao enviar email: {str(e)}")
         return jsonify({'status': 'error', 'message': 'Erro interno ao enviar o email.'}), 500
 
 ######################################
 # Inicialização
 ######################################
+def criar_admin():
+    """Cria o usuário administrador padrão, se ainda não existir."""
+    if not Usuario.query.filter_by(email='admin.papelaria@example.com').first():
+        admin = Usuario(
+            nome='Administrador',
+            email='admin.papelaria@example.com',
+            senha=generate_password_hash('admin123'),
+            tipo='admin'
+        )
+        db.session.add(admin)
+        db.session.commit()
+
+def create_app(config=None):
+    """
+    Cria uma instância do app. 'config' (dict) sobrescreve a configuração
+    lida do ambiente, ex.: {'SQLALCHEMY_DATABASE_URI': 'sqlite:///teste.db'};
+    várias instâncias (com bancos diferentes) podem rodar no mesmo processo.
+    Aplica as migrações pendentes (migrations.py) e cria o admin.
+
+    Com o Flask CLI, `flask <comando>` acha esta função sozinho; no
+    gunicorn, use `gunicorn "app:create_app()"`.
+    """
+    app = Flask(__name__)
+    app.secret_key = os.getenv('SECRET_KEY') # Chave secreta para proteger sessões
+    app.config['SECURITY_PASSWORD_SALT'] = os.getenv('SECURITY_PASSWORD_SALT')
+    app.config['SQLALCHEMY_DATABASE_URI'] = url_banco()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['INSTRUMENTACAO'] = os.getenv('INSTRUMENTACAO') == '1' # Ver instrumentation.py
+    if config:
+        app.config.update(config)
+
+    db.init_app(app)
+    moment.init_app(app)
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+
+    with app.app_context():
+        from migrations import aplicar_migracoes
+        aplicar_migracoes(db.engine)
+        criar_admin()
+
+    if app.config['INSTRUMENTACAO']:
+        from instrumentation import instalar_instrumentacao
+        instalar_instrumentacao(app)
+
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
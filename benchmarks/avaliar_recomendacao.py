@@ -0,0 +1,106 @@
+# Avaliação offline dos motores de recomendação (KNN por clientes vs. item a item).
+#
+# Protocolo "leave-one-out": para cada cliente da amostra com 2+ produtos, um
+# produto comprado é escondido da matriz de treino. O acerto (hit-rate@n) é a
+# fração de clientes para os quais o produto escondido aparece entre os 'n'
+# recomendados. Também mede a latência de cada recomendação.
+#
+# Uso:
+#   python benchmarks/avaliar_recomendacao.py                 (vendas do banco)
+#   python benchmarks/avaliar_recomendacao.py --sintetico 20000
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from scipy import sparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sqlalchemy.orm import Session
+from models import criar_engine
+from recommendation_engine import (MatrizCompras, construir_indice_itens, get_purchase_matrix,
+                                   recomendar_ids_itens, recomendar_ids_knn)
+
+def matriz_sintetica(n_clientes, n_produtos=1000, n_grupos=20, semente=42):
+    """Clientes divididos em grupos de interesse, cada grupo com seus produtos preferidos."""
+    rng = np.random.default_rng(semente)
+    preferidos = [rng.choice(n_produtos, size=30, replace=False) for _ in range(n_grupos)]
+    linhas, colunas = [], []
+    for cliente in range(n_clientes):
+        grupo = preferidos[rng.integers(n_grupos)]
+        n_compras = rng.integers(2, 10)
+        # 80% das compras vêm do grupo, o resto é aleatório
+        do_grupo = rng.random(n_compras) < 0.8
+        produtos = np.where(do_grupo, rng.choice(grupo, n_compras), rng.integers(0, n_produtos, n_compras))
+        linhas.extend([cliente] * n_compras)
+        colunas.extend(produtos)
+    matriz = sparse.csr_matrix((np.ones(len(linhas)), (linhas, colunas)), shape=(n_clientes, n_produtos))
+    matriz.data[:] = 1
+    return MatrizCompras(matriz, np.arange(1, n_clientes + 1), np.arange(1, n_produtos + 1))
+
+def separar_treino(matrix, amostra, semente=42):
+    """Esconde um produto de cada cliente da amostra; devolve a matriz de treino e os escondidos."""
+    rng = np.random.default_rng(semente)
+    treino = matrix.matriz.tolil(copy=True)
+    escondidos = {}
+    for cliente_id in amostra:
+        linha = matrix.indice_cliente[cliente_id]
+        produto_id = rng.choice(matrix.produtos_do_cliente(linha))
+        treino[linha, matrix.indice_produto[int(produto_id)]] = 0
+        escondidos[cliente_id] = int(produto_id)
+    treino = treino.tocsr()
+    treino.eliminate_zeros()
+    return MatrizCompras(treino, matrix.cliente_ids, matrix.produto_ids), escondidos
+
+def avaliar(nome, recomendar, escondidos):
+    acertos, tempos = 0, []
+    for cliente_id, produto_id in escondidos.items():
+        inicio = time.perf_counter()
+        recomendados = recomendar(cliente_id)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        acertos += produto_id in recomendados
+    tempos = np.array(tempos)
+    print(f"{nome:>10} | {acertos / len(escondidos):>8.3f} | {np.median(tempos):>8.3f} | "
+          f"{np.percentile(tempos, 95):>8.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Avaliação offline dos motores de recomendação')
+    parser.add_argument('--sintetico', type=int, default=0, help='Número de clientes sintéticos (0 = usa o banco)')
+    parser.add_argument('--amostra', type=int, default=500)
+    parser.add_argument('--n', type=int, default=3)
+    parser.add_argument('--k', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.sintetico:
+        matrix = matriz_sintetica(args.sintetico)
+    else:
+        with Session(criar_engine()) as sessao:
+            matrix = get_purchase_matrix(sessao)
+        if matrix is None:
+            print("Nenhuma venda no banco. Use --sintetico N.")
+            return
+
+    compras_por_cliente = np.diff(matrix.matriz.indptr)
+    elegiveis = matrix.cliente_ids[compras_por_cliente >= 2]
+    rng = np.random.default_rng(0)
+    amostra = rng.choice(elegiveis, size=min(args.amostra, len(elegiveis)), replace=False).tolist()
+    if not amostra:
+        print("Nenhum cliente com 2 ou mais produtos para avaliar.")
+        return
+
+    treino, escondidos = separar_treino(matrix, amostra)
+
+    inicio = time.perf_counter()
+    indice = construir_indice_itens(treino)
+    print(f"Índice item a item construído em {time.perf_counter() - inicio:.2f}s "
+          f"({len(indice.produto_ids)} produtos, {len(treino.cliente_ids)} clientes)")
+
+    print(f"{'motor':>10} | {'hit@' + str(args.n):>8} | {'p50 (ms)':>8} | {'p95 (ms)':>8}")
+    avaliar('knn', lambda cid: recomendar_ids_knn(treino, cid, args.k, args.n), escondidos)
+    avaliar('itens', lambda cid: recomendar_ids_itens(
+        indice, treino.produtos_do_cliente(treino.indice_cliente[cid]), args.n), escondidos)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+# Benchmark do app inteiro, num banco gerado por gerar_dados.py:
+#
+# 1. Caminhos mais usados, um de cada vez, pelo test client do Flask (sem
+#    rede): home, /clientes, /vendas, /recomendar/cliente/<id>, /chat, e as
+#    funções calcular_rfm e get_purchase_matrix (construção e cache).
+#    "primeira" é a primeira chamada (caches frios); p50/p95/p99 são das
+#    seguintes.
+# 2. Teste de carga: vários usuários simultâneos (threads, cada um com a sua
+#    sessão logada) fazendo uma mistura de requisições por HTTP durante um
+#    tempo fixo. Mede p50/p95/p99 por rota e a vazão total. Sem --url, sobe
+#    o app num servidor WSGI local (werkzeug, com threads) neste processo;
+#    com --url, mede um servidor já rodando, por exemplo o gunicorn:
+#        DATABASE_URL=sqlite:////tmp/carga.db gunicorn -w 4 "app:create_app()"
+#    (o servidor local divide o GIL com os usuários simulados: os números
+#    servem para comparar versões, o gunicorn é mais próximo da produção).
+#
+# O resultado é gravado em JSON (--saida) e pode ser comparado com um
+# resultado anterior (--comparar): falha (código de saída 1) se o p95 de
+# algum caminho ou rota piorar mais que a tolerância (e mais que FOLGA_MS),
+# ou se a vazão cair mais que a tolerância.
+#
+# Uso: python benchmarks/bench_app.py [--banco /tmp/carga.db] [--escala media] [--repeticoes 30]
+#          [--usuarios 8] [--duracao 20] [--url http://127.0.0.1:8000]
+#          [--saida resultado.json] [--comparar anterior.json] [--tolerancia 0.25]
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from http.cookiejar import CookieJar
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from gerar_dados import ESCALAS, gerar_dados
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PASTA_RESULTADOS = os.path.join(RAIZ, 'benchmarks', 'resultados')
+
+EMAIL_ADMIN, SENHA_ADMIN = 'admin.papelaria@example.com', 'admin123'
+MENSAGENS_CHAT = [
+    'como cadastro um produto novo?', 'onde vejo a lista de clientes', 'como registrar uma venda',
+    'esqueci minha senha', 'como ver os produtos mais vendidos?', 'posso excluir um cliente?',
+    'como funciona a recomendação', 'qual o horário de atendimento',
+]
+# Mistura do teste de carga: (rota, peso)
+MISTURA_CARGA = [('home', 1), ('clientes', 3), ('vendas', 3), ('recomendar', 4), ('chat', 3)]
+# Percentil usado na comparação com o resultado anterior
+PERCENTIL_COMPARADO = 'p95_ms'
+# Diferenças menores que isto (ms) são ruído, mesmo que passem da tolerância
+FOLGA_MS = 2.0
+
+def resumo(tempos_ms):
+    """p50/p95/p99 (interpolados), média e máximo, em ms."""
+    ordenados = sorted(tempos_ms)
+    if not ordenados:
+        return {'n': 0}
+    if len(ordenados) == 1:
+        p50 = p95 = p99 = ordenados[0]
+    else:
+        cortes = statistics.quantiles(ordenados, n=100, method='inclusive')
+        p50, p95, p99 = cortes[49], cortes[94], cortes[98]
+    return {
+        'n': len(ordenados), 'p50_ms': round(p50, 2), 'p95_ms': round(p95, 2), 'p99_ms': round(p99, 2),
+        'media_ms': round(statistics.fmean(ordenados), 2), 'max_ms': round(ordenados[-1], 2),
+    }
+
+def preparar_banco(caminho, escala):
+    """Usa o banco em 'caminho' ou, se ele não existir, gera um na escala pedida."""
+    from models import criar_engine
+    from migrations import aplicar_migracoes
+
+    if caminho and os.path.exists(caminho):
+        return os.path.abspath(caminho)
+    caminho = os.path.abspath(caminho or os.path.join(tempfile.mkdtemp(), f'carga_{escala}.db'))
+    engine = criar_engine(f"sqlite:///{caminho}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        aplicar_migracoes(engine)
+    inicio = time.perf_counter()
+    print(f"Gerando dados ({escala}) em {caminho}...")
+    totais = gerar_dados(engine, *ESCALAS[escala])
+    engine.dispose()
+    print(f"  {totais['clientes']} clientes, {totais['produtos']} produtos, {totais['pedidos']} pedidos, "
+          f"{totais['vendas']} vendas em {time.perf_counter() - inicio:.0f}s")
+    return caminho
+
+def contagens(app):
+    from models import db
+    with app.app_context():
+        return {
+            tabela: db.session.execute(db.text(f"SELECT COUNT(*) FROM {tabela}")).scalar()
+            for tabela in ('cliente', 'produto', 'pedido', 'venda')
+        }
+
+def ids_com_compras(app, n, semente=42):
+    """Até 'n' clientes com compras, sorteados: cada recomendação pede um cliente diferente."""
+    from models import db
+    with app.app_context():
+        ids = db.session.execute(db.text("SELECT cliente_id FROM cliente_rfm")).scalars().all()
+    random.Random(semente).shuffle(ids)
+    return ids[:n] or [1]
+
+# ==========================================================
+# 1. Caminhos mais usados
+# ==========================================================
+
+def caminhos_quentes(app, clientes):
+    """{nome: função sem argumentos}; cada função faz uma chamada e confere o resultado."""
+    from recommendation_engine import get_purchase_matrix, invalidar_matriz_compras
+    from classification_engine import calcular_rfm
+
+    cliente = app.test_client()
+    resposta = cliente.post('/login', data={'email': EMAIL_ADMIN, 'senha': SENHA_ADMIN})
+    if resposta.status_code != 302:
+        raise RuntimeError("Não foi possível fazer login com o admin padrão.")
+
+    def rota(url):
+        """GET em 'url' (ou na url que 'url()' devolver, a cada chamada)."""
+        def chamar():
+            endereco = url() if callable(url) else url
+            resposta = cliente.get(endereco)
+            if resposta.status_code != 200:
+                raise RuntimeError(f"{endereco}: HTTP {resposta.status_code}")
+        return chamar
+
+    proximo_cliente = itertools.cycle(clientes).__next__
+    proxima_mensagem = itertools.cycle(MENSAGENS_CHAT).__next__
+
+    def chat():
+        resposta = cliente.post('/chat', json={'mensagem': proxima_mensagem()})
+        if resposta.status_code != 200:
+            raise RuntimeError(f"/chat: HTTP {resposta.status_code}")
+
+    def com_app(funcao):
+        def chamar():
+            with app.app_context(), contextlib.redirect_stdout(io.StringIO()):
+                funcao()
+        return chamar
+
+    def matriz_construcao():
+        invalidar_matriz_compras()
+        get_purchase_matrix()
+
+    return {
+        'home': rota('/'),
+        'clientes': rota('/clientes'),
+        'vendas': rota('/vendas'),
+        'recomendar': rota(lambda: f'/recomendar/cliente/{proximo_cliente()}'),
+        'chat': chat,
+        'calcular_rfm': com_app(calcular_rfm),
+        'get_purchase_matrix (construção)': com_app(matriz_construcao),
+        'get_purchase_matrix (cache)': com_app(get_purchase_matrix),
+    }
+
+def medir_caminhos(app, repeticoes, clientes):
+    resultados = {}
+    for nome, funcao in caminhos_quentes(app, clientes).items():
+        tempos = []
+        for _ in range(repeticoes + 1):
+            inicio = time.perf_counter()
+            funcao()
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        resultados[nome] = dict(resumo(tempos[1:]), primeira_ms=round(tempos[0], 2))
+        r = resultados[nome]
+        print(f"  {nome:<34} | {r['primeira_ms']:>9.1f} | {r['p50_ms']:>8.1f} | {r['p95_ms']:>8.1f} | {r['p99_ms']:>8.1f}")
+    return resultados
+
+# ==========================================================
+# 2. Teste de carga
+# ==========================================================
+
+def iniciar_servidor(app):
+    """Sobe o app num servidor WSGI local com threads; retorna (url, servidor)."""
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR) # Sem uma linha de log por requisição
+    servidor = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{servidor.server_port}", servidor
+
+class Usuario:
+    """Um usuário simulado: sessão própria (cookies) e um sorteio de rotas."""
+    def __init__(self, url_base, clientes, semente):
+        self.url_base = url_base
+        self.clientes = clientes
+        self.sorteio = random.Random(semente)
+        self.navegador = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def entrar(self):
+        dados = urllib.parse.urlencode({'email': EMAIL_ADMIN, 'senha': SENHA_ADMIN}).encode()
+        with self.navegador.open(f"{self.url_base}/login", dados, timeout=30) as resposta:
+            resposta.read()
+
+    def requisicao(self, nome):
+        if nome == 'home':
+            return urllib.request.Request(f"{self.url_base}/")
+        if nome in ('clientes', 'vendas'):
+            return urllib.request.Request(f"{self.url_base}/{nome}")
+        if nome == 'recomendar':
+            return urllib.request.Request(f"{self.url_base}/recomendar/cliente/{self.sorteio.choice(self.clientes)}")
+        corpo = json.dumps({'mensagem': self.sorteio.choice(MENSAGENS_CHAT)}).encode()
+        return urllib.request.Request(f"{self.url_base}/chat", corpo, {'Content-Type': 'application/json'})
+
+    def rodar(self, ate, registros):
+        nomes, pesos = zip(*MISTURA_CARGA)
+        while time.perf_counter() < ate:
+            nome = self.sorteio.choices(nomes, pesos)[0]
+            inicio = time.perf_counter()
+            try:
+                with self.navegador.open(self.requisicao(nome), timeout=60) as resposta:
+                    resposta.read()
+                ok = True
+            except (urllib.error.URLError, OSError):
+                ok = False
+            registros.append((nome, (time.perf_counter() - inicio) * 1000, ok))
+
+def teste_carga(url_base, usuarios, duracao, clientes):
+    simulados = [Usuario(url_base, clientes, semente) for semente in range(usuarios)]
+    for usuario in simulados:
+        usuario.entrar()
+        # Aquecimento fora da medição: cada rota uma vez (workers do servidor, caches)
+        for nome, _ in MISTURA_CARGA:
+            with usuario.navegador.open(usuario.requisicao(nome), timeout=60) as resposta:
+                resposta.read()
+
+    registros = [] # list.append é seguro entre threads
+    ate = time.perf_counter() + duracao
+    threads = [threading.Thread(target=usuario.rodar, args=(ate, registros)) for usuario in simulados]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    decorrido = time.perf_counter() - inicio
+
+    rotas = {}
+    for nome, _ in MISTURA_CARGA:
+        tempos = [ms for n, ms, ok in registros if n == nome and ok]
+        rotas[nome] = dict(resumo(tempos), erros=sum(1 for n, _, ok in registros if n == nome and not ok))
+    sucesso = [ms for _, ms, ok in registros if ok]
+    return {
+        'usuarios': usuarios, 'duracao_s': round(decorrido, 2), 'requisicoes': len(registros),
+        'erros': len(registros) - len(sucesso), 'vazao_rps': round(len(sucesso) / decorrido, 1),
+        'total': resumo(sucesso), 'rotas': rotas,
+    }
+
+def imprimir_carga(carga):
+    print(f"  {carga['requisicoes']} requisições em {carga['duracao_s']:.0f}s, {carga['usuarios']} usuários: "
+          f"{carga['vazao_rps']:.1f} req/s, {carga['erros']} erros")
+    print(f"  {'rota':<12} | {'n':>6} | {'p50 (ms)':>8} | {'p95 (ms)':>8} | {'p99 (ms)':>8} | {'erros':>5}")
+    for nome, r in list(carga['rotas'].items()) + [('total', dict(carga['total'], erros=carga['erros']))]:
+        if r['n']:
+            print(f"  {nome:<12} | {r['n']:>6} | {r['p50_ms']:>8.1f} | {r['p95_ms']:>8.1f} | {r['p99_ms']:>8.1f} | {r['erros']:>5}")
+
+# ==========================================================
+# Comparação com um resultado anterior
+# ==========================================================
+
+def comparar(anterior, atual, tolerancia):
+    """Imprime as diferenças de p95 e vazão; retorna a lista de regressões."""
+    linhas = [(f"caminho {nome}", anterior['caminhos'].get(nome), r) for nome, r in atual['caminhos'].items()]
+    if anterior.get('carga') and atual.get('carga'):
+        linhas += [(f"carga {nome}", anterior['carga']['rotas'].get(nome), r) for nome, r in atual['carga']['rotas'].items()]
+
+    regressoes = []
+    print(f"\nComparação com {anterior['gerado_em']} ({PERCENTIL_COMPARADO}, tolerância {tolerancia:.0%}):")
+    for nome, antes, agora in linhas:
+        if not antes or not antes.get('n') or not agora.get('n'):
+            continue
+        variacao = agora[PERCENTIL_COMPARADO] / max(antes[PERCENTIL_COMPARADO], 0.01) - 1
+        piorou = variacao > tolerancia and agora[PERCENTIL_COMPARADO] - antes[PERCENTIL_COMPARADO] > FOLGA_MS
+        marca = ' <- piorou' if piorou else ''
+        print(f"  {nome:<42} {antes[PERCENTIL_COMPARADO]:>9.1f} -> {agora[PERCENTIL_COMPARADO]:>9.1f} ms ({variacao:+.0%}){marca}")
+        if marca:
+            regressoes.append(nome)
+
+    if anterior.get('carga') and atual.get('carga'):
+        antes, agora = anterior['carga']['vazao_rps'], atual['carga']['vazao_rps']
+        variacao = agora / max(antes, 0.01) - 1
+        marca = ' <- piorou' if variacao < -tolerancia else ''
+        print(f"  {'vazão da carga':<42} {antes:>9.1f} -> {agora:>9.1f} req/s ({variacao:+.0%}){marca}")
+        if marca:
+            regressoes.append('vazão da carga')
+    return regressoes
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark e teste de carga do app')
+    parser.add_argument('--banco', help='Banco gerado por gerar_dados.py (gerado aqui se não existir)')
+    parser.add_argument('--escala', choices=ESCALAS, default='media', help='Escala do banco gerado sem --banco')
+    parser.add_argument('--repeticoes', type=int, default=30)
+    parser.add_argument('--usuarios', type=int, default=8)
+    parser.add_argument('--duracao', type=float, default=20, help='Segundos do teste de carga (0 = sem carga)')
+    parser.add_argument('--url', help='Servidor já rodando, com o mesmo banco (senão sobe um local)')
+    parser.add_argument('--saida', help='Arquivo JSON do resultado (padrão: benchmarks/resultados/app-<data>.json)')
+    parser.add_argument('--comparar', help='Resultado anterior (JSON) para comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.25, help='Piora aceita no p95 e na vazão (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    banco = preparar_banco(args.banco, args.escala)
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('SECURITY_PASSWORD_SALT', 'benchmark')
+    import app as modulo_app
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = modulo_app.create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{banco}"})
+    clientes = ids_com_compras(app, max(args.repeticoes + 1, 1000))
+
+    resultado = {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': {'python': platform.python_version(), 'plataforma': platform.platform(), 'cpus': os.cpu_count()},
+        'banco': dict(contagens(app), arquivo=banco),
+        'parametros': {'repeticoes': args.repeticoes, 'usuarios': args.usuarios, 'duracao_s': args.duracao, 'url': args.url},
+    }
+    print(f"Banco: {resultado['banco']}")
+
+    print(f"\nCaminhos mais usados ({args.repeticoes} repetições):")
+    print(f"  {'caminho':<34} | {'primeira':>9} | {'p50 (ms)':>8} | {'p95 (ms)':>8} | {'p99 (ms)':>8}")
+    resultado['caminhos'] = medir_caminhos(app, args.repeticoes, clientes)
+
+    resultado['carga'] = None
+    if args.duracao > 0:
+        servidor = None
+        url = args.url.rstrip('/') if args.url else None
+        if url is None:
+            url, servidor = iniciar_servidor(app)
+        print(f"\nTeste de carga em {url}:")
+        resultado['carga'] = teste_carga(url, args.usuarios, args.duracao, clientes)
+        if servidor is not None:
+            servidor.shutdown()
+        imprimir_carga(resultado['carga'])
+
+    saida = args.saida or os.path.join(PASTA_RESULTADOS, f"app-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+    print(f"\nResultado gravado em {saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            regressoes = comparar(json.load(arquivo), resultado, args.tolerancia)
+        if regressoes:
+            print(f"\nFALHOU: piorou além da tolerância em {', '.join(regressoes)}")
+            sys.exit(1)
+        print("\nOK: nenhuma piora além da tolerância")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# Benchmark do checkout: um carrinho de N produtos gravado como N vendas
+# separadas (fluxo antigo: uma requisição, uma consulta de produto e um commit
+# por item) vs. um pedido com N itens gravado por registrar_pedido() numa
+# única transação. Mostra commits, comandos SQL e tempo por carrinho.
+#
+# Usa um banco SQLite temporário (DATABASE_URL), não toca no papelaria.db.
+#
+# Uso: python benchmarks/bench_checkout.py [--itens 1 5 12 50] [--carrinhos 50]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+pasta_temporaria = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(pasta_temporaria, 'bench.db')}"
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import criar_engine, Cliente, Produto, Venda
+from migrations import aplicar_migracoes
+from classification_engine import atualizar_rfm_cliente
+from sales_engine import registrar_pedido
+
+N_PRODUTOS = 500
+N_CLIENTES = 100
+
+class Contador:
+    def __init__(self, engine):
+        self.commits = 0
+        self.comandos = 0
+        event.listen(engine, 'commit', self._commit)
+        event.listen(engine, 'before_cursor_execute', self._comando)
+
+    def _commit(self, conexao):
+        self.commits += 1
+
+    def _comando(self, conexao, cursor, sql, parametros, contexto, executemany):
+        self.comandos += 1
+
+    def zerar(self):
+        self.commits = 0
+        self.comandos = 0
+
+def popular(sessao):
+    sessao.add_all(
+        Produto(nome=f'Produto {i}', descricao='', preco=1.5 + i % 20, quantidade=10**9)
+        for i in range(N_PRODUTOS)
+    )
+    sessao.add_all(Cliente(nome=f'Cliente {i}', email=f'cliente{i}@example.com') for i in range(N_CLIENTES))
+    sessao.commit()
+
+def checkout_antigo(cliente_id, itens, sessao):
+    """Reprodução do fluxo antigo: cada item é uma venda, com seu próprio commit."""
+    for produto_id, quantidade in itens:
+        produto = sessao.get(Produto, produto_id)
+        if produto.quantidade < quantidade:
+            raise ValueError('Estoque insuficiente!')
+        venda = Venda(
+            cliente_id=cliente_id,
+            produto_id=produto_id,
+            quantidade=quantidade,
+            valor_total=float(produto.preco) * quantidade,
+            data_venda=datetime.utcnow()
+        )
+        produto.quantidade -= quantidade
+        sessao.add(venda)
+        atualizar_rfm_cliente(cliente_id, venda.valor_total, venda.data_venda, sessao)
+        sessao.commit()
+
+def medir(funcao, carrinhos, contador, sessao):
+    contador.zerar()
+    inicio = time.perf_counter()
+    for cliente_id, itens in carrinhos:
+        funcao(cliente_id, itens, sessao)
+    decorrido = time.perf_counter() - inicio
+    n = len(carrinhos)
+    return contador.commits / n, contador.comandos / n, decorrido * 1000 / n
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do checkout de carrinhos')
+    parser.add_argument('--itens', type=int, nargs='+', default=[1, 5, 12, 50])
+    parser.add_argument('--carrinhos', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    engine = criar_engine()
+    aplicar_migracoes(engine)
+    with Session(engine) as sessao:
+        popular(sessao)
+        contador = Contador(engine)
+
+        print(f"{'itens':>6} | {'fluxo':<8} | {'commits':>8} | {'comandos SQL':>12} | {'ms/carrinho':>11}")
+        for n_itens in args.itens:
+            carrinhos = [
+                (rng.randint(1, N_CLIENTES), [(pid, rng.randint(1, 3)) for pid in rng.sample(range(1, N_PRODUTOS + 1), n_itens)])
+                for _ in range(args.carrinhos)
+            ]
+            for nome, funcao in [('antigo', checkout_antigo), ('pedido', registrar_pedido)]:
+                commits, comandos, ms = medir(funcao, carrinhos, contador, sessao)
+                print(f"{n_itens:>6} | {nome:<8} | {commits:>8.1f} | {comandos:>12.1f} | {ms:>11.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# Benchmark dos índices de 'venda': plano de execução (EXPLAIN QUERY PLAN) e
+# tempo das consultas mais usadas antes e depois da migração de índices
+# compostos (migração 5 em migrations.py), num banco SQLite temporário com
+# milhões de vendas geradas.
+#
+# Uso: python benchmarks/bench_indices.py [--vendas 2000000] [--clientes 50000] [--produtos 5000]
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from migrations import INDICES_COMPOSTOS_VENDA, _indices_compostos_venda
+
+ESQUEMA_VENDA = """
+    CREATE TABLE venda (
+        id INTEGER NOT NULL PRIMARY KEY,
+        cliente_id INTEGER,
+        produto_id INTEGER,
+        quantidade INTEGER NOT NULL,
+        data_venda DATETIME,
+        valor_total FLOAT NOT NULL
+    )
+"""
+
+CONSULTAS = {
+    'rfm_cliente': (
+        "SELECT MAX(data_venda), COUNT(*), SUM(valor_total) FROM venda WHERE cliente_id = :cliente",
+    ),
+    'ultimas_vendas_cliente': (
+        "SELECT id, data_venda FROM venda WHERE cliente_id = :cliente ORDER BY data_venda DESC LIMIT 20",
+    ),
+    'mais_vendidos': (
+        "SELECT produto_id, SUM(quantidade) AS total FROM venda GROUP BY produto_id ORDER BY total DESC LIMIT 5",
+    ),
+    'receita_30_dias': (
+        "SELECT date(data_venda), SUM(valor_total) FROM venda WHERE data_venda >= :inicio GROUP BY date(data_venda)",
+    ),
+    'vendas_produto': (
+        "SELECT COUNT(*), SUM(quantidade) FROM venda WHERE produto_id = :produto",
+    ),
+}
+
+def popular(engine, n_vendas, n_clientes, n_produtos, lote=200_000):
+    rng = np.random.default_rng(42)
+    fim = datetime(2025, 12, 31)
+    with engine.begin() as conexao:
+        conexao.execute(text(ESQUEMA_VENDA))
+        for inicio in range(0, n_vendas, lote):
+            tamanho = min(lote, n_vendas - inicio)
+            clientes = rng.integers(1, n_clientes + 1, tamanho)
+            produtos = rng.zipf(1.3, tamanho) % n_produtos + 1
+            quantidades = rng.integers(1, 6, tamanho)
+            minutos = rng.integers(0, 3 * 365 * 24 * 60, tamanho)
+            linhas = [
+                (int(c), int(p), int(q), str(fim - timedelta(minutes=int(m))), float(q) * 9.9)
+                for c, p, q, m in zip(clientes, produtos, quantidades, minutos)
+            ]
+            conexao.exec_driver_sql(
+                "INSERT INTO venda (cliente_id, produto_id, quantidade, data_venda, valor_total) VALUES (?, ?, ?, ?, ?)",
+                linhas
+            )
+
+def medir(engine, parametros, repeticoes):
+    resultados = {}
+    with engine.connect() as conexao:
+        for nome, (sql,) in CONSULTAS.items():
+            plano = [linha[-1] for linha in conexao.execute(text("EXPLAIN QUERY PLAN " + sql), parametros)]
+            tempos = []
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                conexao.execute(text(sql), parametros).all()
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            resultados[nome] = (statistics.median(tempos), plano)
+    return resultados
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dos índices da tabela venda')
+    parser.add_argument('--vendas', type=int, default=2_000_000)
+    parser.add_argument('--clientes', type=int, default=50_000)
+    parser.add_argument('--produtos', type=int, default=5_000)
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        engine = create_engine(f"sqlite:///{os.path.join(pasta, 'bench.db')}")
+
+        inicio = time.perf_counter()
+        popular(engine, args.vendas, args.clientes, args.produtos)
+        print(f"{args.vendas} vendas geradas em {time.perf_counter() - inicio:.1f}s")
+
+        parametros = {'cliente': 4242 % args.clientes + 1, 'produto': 1,
+                      'inicio': str(datetime(2025, 12, 31) - timedelta(days=30))}
+
+        antes = medir(engine, parametros, args.repeticoes)
+
+        inicio = time.perf_counter()
+        with engine.begin() as conexao:
+            _indices_compostos_venda(conexao)
+        print(f"Índices criados em {time.perf_counter() - inicio:.1f}s:")
+        for comando in INDICES_COMPOSTOS_VENDA:
+            print(f"  {comando}")
+
+        depois = medir(engine, parametros, args.repeticoes)
+
+        for nome in CONSULTAS:
+            tempo_antes, plano_antes = antes[nome]
+            tempo_depois, plano_depois = depois[nome]
+            print(f"\n{nome}: {tempo_antes:.2f} ms -> {tempo_depois:.2f} ms "
+                  f"({tempo_antes / max(tempo_depois, 1e-6):.0f}x)")
+            print(f"  antes:  {' | '.join(plano_antes)}")
+            print(f"  depois: {' | '.join(plano_depois)}")
+
+        engine.dispose()
+
+if __name__ == '__main__':
+    main()
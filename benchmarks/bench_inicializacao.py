@@ -0,0 +1,89 @@
+# Tempo de inicialização do app (o que cada worker do gunicorn paga ao subir):
+# roda `python -X importtime -c "import app; app.create_app()"` num processo
+# novo, soma o tempo de importação, lista os módulos mais caros e confere que
+# as dependências pesadas (gráficos, classificação, recomendações, chat) não
+# são importadas nem ao criar o app: elas devem ser carregadas só no primeiro uso.
+#
+# Falha (código de saída 1) se o tempo passar do orçamento ou se algum módulo
+# pesado for importado. O tempo é a mediana de algumas execuções.
+#
+# Usa um banco SQLite temporário (DATABASE_URL) já migrado, não toca no papelaria.db.
+#
+# Uso: python benchmarks/bench_inicializacao.py [--orcamento-ms 1000] [--execucoes 5] [--top 15]
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Orçamento do `import app` (ms, mediana); antes das importações preguiçosas eram ~1900 ms
+ORCAMENTO_MS = 1000
+
+# Nenhum destes pode aparecer ao importar e criar o app
+MODULOS_PESADOS = ['matplotlib', 'seaborn', 'pandas', 'sklearn', 'scipy', 'sendgrid', 'joblib']
+
+def importar_app(ambiente):
+    """Importa e cria o app num processo novo; retorna {módulo: microssegundos acumulados}."""
+    processo = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app; app.create_app()'],
+        cwd=RAIZ, env=ambiente, capture_output=True, text=True
+    )
+    if processo.returncode != 0:
+        raise RuntimeError(f"Falha ao importar o app:\n{processo.stderr[-2000:]}")
+
+    tempos = {}
+    for linha in processo.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not linha.startswith('import time:') or 'cumulative' in linha:
+            continue
+        _, acumulado, modulo = linha[len('import time:'):].split('|')
+        tempos[modulo.strip()] = int(acumulado)
+    return tempos
+
+def main():
+    parser = argparse.ArgumentParser(description='Tempo de inicialização do app')
+    parser.add_argument('--orcamento-ms', type=float, default=ORCAMENTO_MS)
+    parser.add_argument('--execucoes', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    pasta_temporaria = tempfile.mkdtemp()
+    ambiente = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(pasta_temporaria, 'inicializacao.db')}",
+        SECRET_KEY=os.getenv('SECRET_KEY', 'benchmark'),
+        SECURITY_PASSWORD_SALT=os.getenv('SECURITY_PASSWORD_SALT', 'benchmark'),
+        PYTHONPATH=RAIZ,
+    )
+
+    # A primeira execução cria o banco e aplica as migrações; não entra na conta
+    importar_app(ambiente)
+    execucoes = [importar_app(ambiente) for _ in range(args.execucoes)]
+
+    total_ms = statistics.median(tempos['app'] for tempos in execucoes) / 1000
+    ultima = execucoes[-1]
+
+    print(f"import app: {total_ms:.0f} ms (mediana de {args.execucoes}) | orçamento: {args.orcamento_ms:.0f} ms")
+    print(f"\nMódulos de primeiro nível mais caros:")
+    primeiro_nivel = {modulo: us for modulo, us in ultima.items() if '.' not in modulo and modulo != 'app'}
+    for modulo, us in sorted(primeiro_nivel.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {modulo}")
+
+    pesados = sorted({modulo.split('.')[0] for modulo in ultima} & set(MODULOS_PESADOS))
+
+    problemas = []
+    if total_ms > args.orcamento_ms:
+        problemas.append(f"passou do orçamento ({total_ms:.0f} ms > {args.orcamento_ms:.0f} ms)")
+    if pesados:
+        problemas.append(f"módulos pesados importados na inicialização: {', '.join(pesados)}")
+    if problemas:
+        print("\nFALHOU: " + '; '.join(problemas))
+        sys.exit(1)
+    print("\nOK: dentro do orçamento, sem módulos pesados na inicialização")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+# Benchmark de memória do cálculo RFM: pico do tracemalloc e pico de RSS de
+# cada forma de calcular o RFM de todos os clientes, num banco SQLite
+# temporário com milhões de pedidos gerados:
+# - pandas (antigo): a tabela de vendas inteira num DataFrame, três groupbys
+#   e dois merges (o calcular_rfm original);
+# - read_sql cliente_rfm: o calcular_rfm antes da leitura em lotes (o
+#   agregado inteiro num DataFrame de float64/datetime);
+# - lotes (atual): calcular_rfm lendo cliente_rfm em lotes para arrays
+#   int32/float32.
+# O agregado cliente_rfm é montado antes com reconstruir_rfm_clientes (um
+# GROUP BY no banco), também medido.
+#
+# Cada medição roda num processo separado, para que o pico de RSS de uma não
+# esconda o da outra; "RSS base" é o processo já com pandas e sklearn
+# importados, antes de calcular.
+#
+# Uso: python benchmarks/bench_rfm.py [--pedidos 10000000] [--clientes 1000000] [--banco arquivo.db]
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sqlalchemy.orm import Session
+from models import db, criar_engine
+from migrations import aplicar_migracoes
+from classification_engine import calcular_rfm, reconstruir_rfm_clientes
+
+def popular(engine, n_pedidos, n_clientes, lote=500_000):
+    rng = np.random.default_rng(42)
+    fim = datetime(2025, 12, 31)
+    with engine.begin() as conexao:
+        for inicio in range(0, n_pedidos, lote):
+            tamanho = min(lote, n_pedidos - inicio)
+            clientes = rng.zipf(1.2, tamanho) % n_clientes + 1
+            minutos = rng.integers(0, 3 * 365 * 24 * 60, tamanho)
+            valores = np.round(rng.gamma(2, 40, tamanho), 2)
+            linhas = [
+                (int(c), str(fim - timedelta(minutes=int(m))), float(v))
+                for c, m, v in zip(clientes, minutos, valores)
+            ]
+            conexao.exec_driver_sql(
+                "INSERT INTO pedido (cliente_id, data_pedido, valor_total) VALUES (?, ?, ?)", linhas
+            )
+
+def rfm_pandas_antigo(sessao):
+    """O calcular_rfm original: a tabela de vendas inteira num DataFrame."""
+    import pandas as pd
+
+    query = db.text("SELECT cliente_id, data_pedido AS data_venda, valor_total FROM pedido")
+    df_vendas = pd.read_sql(query, sessao.connection(), parse_dates=['data_venda'])
+
+    df_recencia = df_vendas.groupby('cliente_id')['data_venda'].max().reset_index()
+    df_recencia['recencia'] = (datetime.now() - df_recencia['data_venda']).dt.days
+    df_recencia = df_recencia[['cliente_id', 'recencia']]
+    df_frequencia = df_vendas.groupby('cliente_id').size().reset_index(name='frequencia')
+    df_monetario = df_vendas.groupby('cliente_id')['valor_total'].sum().reset_index(name='monetario')
+
+    df_rfm = df_frequencia.merge(df_monetario, on='cliente_id')
+    return df_rfm.merge(df_recencia, on='cliente_id')
+
+def rfm_read_sql(sessao):
+    """O calcular_rfm sobre cliente_rfm antes da leitura em lotes."""
+    import pandas as pd
+
+    query = db.text("""
+        SELECT cliente_id, ultima_compra, total_compras AS frequencia, total_gasto AS monetario
+        FROM cliente_rfm
+    """)
+    df_rfm = pd.read_sql(query, sessao.connection(), parse_dates=['ultima_compra'])
+    df_rfm['recencia'] = (datetime.now() - df_rfm['ultima_compra']).dt.days
+    return df_rfm[['cliente_id', 'frequencia', 'monetario', 'recencia']]
+
+def rfm_lotes(sessao):
+    return calcular_rfm(sessao)
+
+def reconstruir(sessao):
+    return reconstruir_rfm_clientes(sessao)
+
+ETAPAS = {
+    'reconstruir-rfm': reconstruir,
+    'pandas (antigo)': rfm_pandas_antigo,
+    'read_sql cliente_rfm': rfm_read_sql,
+    'lotes (atual)': rfm_lotes,
+}
+
+def _rss_mb():
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maximo / 2**20 if sys.platform == 'darwin' else maximo / 2**10
+
+def medir_etapa(banco, nome):
+    """Roda uma etapa (num processo novo) e imprime o resultado em JSON."""
+    import pandas
+    import sklearn.cluster
+
+    engine = criar_engine(f"sqlite:///{banco}")
+    rss_base = _rss_mb()
+    with Session(engine) as sessao:
+        # Primeiro o tempo e o pico de RSS; o tracemalloc deixa tudo mais lento
+        inicio = time.perf_counter()
+        resultado = ETAPAS[nome](sessao)
+        segundos = time.perf_counter() - inicio
+        rss_pico = _rss_mb()
+        del resultado
+        tracemalloc.start()
+        resultado = ETAPAS[nome](sessao)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    if isinstance(resultado, int):
+        linhas, bytes_resultado = resultado, 0
+    else:
+        linhas, bytes_resultado = len(resultado), int(resultado.memory_usage(index=True, deep=True).sum())
+    print(json.dumps({
+        'segundos': segundos, 'rss_base': rss_base, 'rss_pico': rss_pico,
+        'tracemalloc': pico / 2**20, 'linhas': linhas, 'resultado': bytes_resultado / 2**20,
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de memória do cálculo RFM')
+    parser.add_argument('--pedidos', type=int, default=10_000_000)
+    parser.add_argument('--clientes', type=int, default=1_000_000)
+    parser.add_argument('--banco', help='Reaproveita (ou cria) este arquivo em vez de um banco temporário')
+    parser.add_argument('--etapa', choices=ETAPAS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.etapa:
+        medir_etapa(args.banco, args.etapa)
+        return
+
+    banco = args.banco or os.path.join(tempfile.mkdtemp(), 'rfm.db')
+    if not os.path.exists(banco):
+        engine = criar_engine(f"sqlite:///{banco}")
+        aplicar_migracoes(engine)
+        inicio = time.perf_counter()
+        popular(engine, args.pedidos, args.clientes)
+        engine.dispose()
+        print(f"{args.pedidos} pedidos gerados em {time.perf_counter() - inicio:.0f}s ({banco})")
+
+    print(f"{'etapa':<22} | {'linhas':>9} | {'tempo (s)':>9} | {'RSS base':>8} | {'RSS pico':>8} | "
+          f"{'tracemalloc':>11} | {'resultado':>9}")
+    for nome in ETAPAS:
+        processo = subprocess.run(
+            [sys.executable, __file__, '--banco', banco, '--etapa', nome], capture_output=True, text=True
+        )
+        if processo.returncode != 0:
+            # -9 (SIGKILL) é quase sempre o sistema matando o processo por falta de memória
+            print(f"{nome:<22} | falhou (código {processo.returncode}): {processo.stderr.strip()[-200:]}")
+            continue
+        r = json.loads(processo.stdout.strip().splitlines()[-1])
+        print(f"{nome:<22} | {r['linhas']:>9} | {r['segundos']:>9.2f} | {r['rss_base']:>5.0f} MB | "
+              f"{r['rss_pico']:>5.0f} MB | {r['tracemalloc']:>8.1f} MB | {r['resultado']:>6.1f} MB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# Benchmark do treino da classificação de clientes: tempo e pico de memória
+# (tracemalloc) em função do número de clientes, comparando o treino em
+# lotes (MiniBatchKMeans.partial_fit sobre cliente_rfm lido em lotes, que
+# grava uma versão nova dos modelos) com o treino completo antigo (a tabela
+# inteira num DataFrame + KMeans com n_init=10).
+#
+# Usa um banco SQLite temporário com clientes sintéticos em três grupos de
+# comportamento, não toca no papelaria.db nem nos modelos do projeto.
+#
+# Uso: python benchmarks/bench_treino_classificacao.py [--clientes 10000 100000 500000] [--lote 10000] [--sem-completo]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sqlalchemy.orm import Session
+from models import criar_engine
+from migrations import aplicar_migracoes
+from classification_engine import N_CLUSTERS, calcular_rfm, treinar_modelos
+
+# (recência média em dias, compras médias, gasto médio por compra) de cada grupo
+GRUPOS = [(300, 1.5, 40.0), (20, 12, 60.0), (45, 6, 400.0)]
+
+def popular(engine, n_clientes, lote=200_000):
+    rng = np.random.default_rng(42)
+    hoje = datetime.now()
+    with engine.begin() as conexao:
+        for inicio in range(0, n_clientes, lote):
+            tamanho = min(lote, n_clientes - inicio)
+            grupos = rng.integers(0, len(GRUPOS), tamanho)
+            recencia, compras, ticket = (np.array(coluna)[grupos] for coluna in zip(*GRUPOS))
+            dias = rng.exponential(recencia).astype(int)
+            total_compras = 1 + rng.poisson(compras)
+            total_gasto = total_compras * rng.gamma(4, ticket / 4)
+            linhas = [
+                (inicio + i + 1, str(hoje - timedelta(days=int(d))), int(c), float(g))
+                for i, (d, c, g) in enumerate(zip(dias, total_compras, total_gasto))
+            ]
+            conexao.exec_driver_sql(
+                "INSERT INTO cliente_rfm (cliente_id, ultima_compra, total_compras, total_gasto) VALUES (?, ?, ?, ?)",
+                linhas
+            )
+
+def medir(funcao):
+    """Roda duas vezes: uma para o tempo e outra com tracemalloc (que deixa tudo mais lento) para o pico."""
+    inicio = time.perf_counter()
+    resultado = funcao()
+    decorrido = time.perf_counter() - inicio
+    tracemalloc.start()
+    funcao()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, decorrido, pico / 2**20
+
+def treino_completo(sessao):
+    """Treino antigo: todo o RFM num DataFrame e KMeans sobre a matriz inteira."""
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import StandardScaler
+
+    df_rfm = calcular_rfm(sessao)
+    dados = StandardScaler().fit_transform(df_rfm[['recencia', 'frequencia', 'monetario']])
+    return KMeans(n_clusters=N_CLUSTERS, n_init=10, random_state=42).fit(dados).inertia_
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do treino da classificação de clientes')
+    parser.add_argument('--clientes', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    parser.add_argument('--lote', type=int, default=10_000)
+    parser.add_argument('--epocas', type=int, default=3)
+    parser.add_argument('--sem-completo', action='store_true', help='Não roda o treino completo antigo')
+    args = parser.parse_args()
+
+    # O tempo de importar o sklearn e o pandas não entra na medição
+    import pandas
+    import sklearn.cluster
+
+    pasta_temporaria = tempfile.mkdtemp()
+    print(f"{'clientes':>9} | {'treino':<9} | {'tempo (s)':>9} | {'clientes/s':>10} | {'pico (MB)':>9} | {'inércia':>12}")
+    for n_clientes in args.clientes:
+        engine = criar_engine(f"sqlite:///{os.path.join(pasta_temporaria, f'treino_{n_clientes}.db')}")
+        aplicar_migracoes(engine)
+        popular(engine, n_clientes)
+
+        with Session(engine) as sessao:
+            metadados, segundos, pico = medir(lambda: treinar_modelos(
+                sessao, args.lote, args.epocas, pasta=os.path.join(pasta_temporaria, f'modelos_{n_clientes}')
+            ))
+            print(f"{n_clientes:>9} | {'lotes':<9} | {segundos:>9.2f} | {n_clientes / segundos:>10.0f} | "
+                  f"{pico:>9.1f} | {metadados['inercia']:>12.1f}")
+
+            if not args.sem_completo:
+                inercia, segundos, pico = medir(lambda: treino_completo(sessao))
+                print(f"{n_clientes:>9} | {'completo':<9} | {segundos:>9.2f} | {n_clientes / segundos:>10.0f} | "
+                      f"{pico:>9.1f} | {inercia:>12.1f}")
+        engine.dispose()
+
+if __name__ == '__main__':
+    main()
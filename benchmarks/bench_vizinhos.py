@@ -0,0 +1,126 @@
+# Benchmark da busca de vizinhos do KNN: matriz cliente x cliente completa
+# (implementação antiga) vs. uma única linha de similaridade + argpartition.
+#
+# Com --verificar, compara os vizinhos de todos os clientes com os da
+# implementação antiga (densa, com pandas) e sai com código 1 se divergirem.
+# Os empates ficam de fora da comparação de ids: o sort antigo (quicksort, não
+# estável) os devolvia numa ordem arbitrária, e a implementação nova escolhe
+# intencionalmente o menor id; nesses casos só as similaridades são comparadas.
+#
+# Uso: python benchmarks/bench_vizinhos.py [--clientes 1000 2000 4000 ...] [--verificar]
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.metrics.pairwise import cosine_similarity
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from recommendation_engine import MatrizCompras, vizinhos_mais_proximos, vizinhos_em_lote
+
+N_PRODUTOS = 2000
+COMPRAS_POR_CLIENTE = 8
+# Acima disso a matriz densa cliente x cliente não cabe em memória com folga
+LIMITE_MATRIZ_COMPLETA = 8000
+
+def gerar_matriz(n_clientes, semente=42, n_produtos=N_PRODUTOS, compras_por_cliente=COMPRAS_POR_CLIENTE):
+    rng = np.random.default_rng(semente)
+    linhas = np.repeat(np.arange(n_clientes), compras_por_cliente)
+    colunas = rng.integers(0, n_produtos, size=len(linhas))
+    matriz = sparse.csr_matrix((np.ones(len(linhas)), (linhas, colunas)), shape=(n_clientes, n_produtos))
+    matriz.data[:] = 1
+    return MatrizCompras(matriz, np.arange(1, n_clientes + 1), np.arange(1, n_produtos + 1))
+
+def vizinhos_matriz_completa(matrix, client_id, k):
+    """Reprodução da implementação antiga: similaridade entre TODOS os clientes."""
+    sim_df = pd.DataFrame(cosine_similarity(matrix.matriz), index=matrix.cliente_ids, columns=matrix.cliente_ids)
+    return sim_df[client_id].drop(client_id).sort_values(ascending=False).head(k).index.tolist()
+
+def verificar(n_clientes, k):
+    """
+    Compara, para todos os clientes, os vizinhos de vizinhos_mais_proximos e
+    de vizinhos_em_lote com os da matriz densa do pandas. Retorna
+    (clientes comparados, clientes com empate, divergências).
+    """
+    # Poucos produtos e compras variadas: similaridades mais diversas, menos empates
+    matrix = gerar_matriz(n_clientes, n_produtos=60, compras_por_cliente=12)
+    ids = matrix.cliente_ids
+    sim_df = pd.DataFrame(cosine_similarity(matrix.matriz), index=ids, columns=ids)
+    lote = vizinhos_em_lote(matrix, ids.tolist(), k)
+
+    comparados, com_empate, divergencias = 0, 0, []
+    for client_id in ids.tolist():
+        ordenados = sim_df[client_id].drop(client_id).sort_values(ascending=False)
+        esperado = ordenados.head(k).index.tolist()
+        novo = vizinhos_mais_proximos(matrix, client_id, k)
+
+        # As similaridades dos escolhidos batem sempre, com ou sem empate
+        if not np.allclose(sim_df.loc[client_id, novo].values, ordenados.head(k).values):
+            divergencias.append((client_id, esperado, novo))
+            continue
+        # Ids só são comparáveis se os k+1 primeiros valores forem todos distintos
+        topo = np.round(ordenados.head(k + 1).values, 12)
+        if len(np.unique(topo)) < len(topo):
+            com_empate += 1
+            continue
+        comparados += 1
+        if novo != esperado or lote[client_id] != esperado:
+            divergencias.append((client_id, esperado, novo))
+    return comparados, com_empate, divergencias
+
+def medir(funcao, *args, repeticoes=5):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resultado = funcao(*args)
+    tempo_ms = (time.perf_counter() - inicio) / repeticoes * 1000
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, tempo_ms, pico / 1024 / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da busca de vizinhos do KNN')
+    parser.add_argument('--clientes', type=int, nargs='+', default=[1000, 2000, 4000, 8000, 16000, 32000, 64000])
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--verificar', action='store_true',
+                        help='Compara os vizinhos com a implementação antiga em vez de medir')
+    args = parser.parse_args()
+
+    if args.verificar:
+        falhou = False
+        for n_clientes in args.clientes:
+            if n_clientes > LIMITE_MATRIZ_COMPLETA:
+                continue
+            comparados, com_empate, divergencias = verificar(n_clientes, args.k)
+            print(f"{n_clientes:>9} clientes: {comparados} comparados, {com_empate} com empate (ignorados), "
+                  f"{len(divergencias)} divergências")
+            for client_id, esperado, novo in divergencias[:5]:
+                print(f"    cliente {client_id}: esperado {esperado}, obtido {novo}")
+            falhou = falhou or bool(divergencias) or comparados == 0
+        sys.exit(1 if falhou else 0)
+
+    print(f"{'clientes':>9} | {'completa (ms)':>13} | {'completa (MB)':>13} | {'linha (ms)':>10} | {'linha (MB)':>10}")
+    for n_clientes in args.clientes:
+        matrix = gerar_matriz(n_clientes)
+        alvo = int(matrix.cliente_ids[0])
+
+        novo, tempo_linha, mem_linha = medir(vizinhos_mais_proximos, matrix, alvo, args.k)
+
+        if n_clientes <= LIMITE_MATRIZ_COMPLETA:
+            antigo, tempo_completa, mem_completa = medir(vizinhos_matriz_completa, matrix, alvo, args.k, repeticoes=1)
+            # Compara as similaridades (a ordem entre empates pode variar no sort antigo)
+            sims = (matrix.normalizada @ matrix.normalizada[0].T).toarray().ravel()
+            assert np.allclose(sims[np.array(novo) - 1], sims[np.array(antigo) - 1])
+            completa = f"{tempo_completa:>13.1f} | {mem_completa:>13.1f}"
+        else:
+            completa = f"{'-':>13} | {'-':>13}"
+
+        print(f"{n_clientes:>9} | {completa} | {tempo_linha:>10.2f} | {mem_linha:>10.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+# Teste de carga da baixa de estoque: vários processos (como os workers do
+# gunicorn) vendendo o mesmo produto ao mesmo tempo. Confere que o estoque
+# nunca fica negativo e que o número de unidades vendidas bate com a baixa,
+# e mede a vazão (vendas por segundo).
+#
+# --fluxo antigo reproduz a checagem antiga (lê, compara no Python e grava o
+# valor calculado), para comparar: nela duas vendas podem passar pela mesma
+# checagem e vender além do estoque.
+#
+# Usa um banco SQLite temporário (DATABASE_URL), não toca no papelaria.db.
+#
+# Uso: python benchmarks/carga_estoque.py [--vendas 400] [--estoque 250] [--processos 8] [--fluxo pedido|antigo]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+pasta_temporaria = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(pasta_temporaria, 'carga.db')}"
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import criar_engine, Cliente, Produto, Venda
+from migrations import aplicar_migracoes
+
+# Sem app Flask: cada processo usa o próprio engine, criado em iniciar_worker
+engine = None
+
+def iniciar_worker():
+    # Cada processo abre as próprias conexões (não reaproveita as do pai)
+    global engine
+    engine = criar_engine()
+
+def vender_antigo(sessao, cliente_id, produto_id):
+    """Fluxo antigo: lê o estoque, compara no Python e grava o valor calculado."""
+    produto = sessao.get(Produto, produto_id)
+    if produto.quantidade < 1:
+        return 'sem_estoque'
+    time.sleep(0.001) # A requisição faz outras coisas entre a leitura e a gravação
+    produto.quantidade -= 1
+    sessao.add(Venda(cliente_id=cliente_id, produto_id=produto_id, quantidade=1, valor_total=float(produto.preco)))
+    sessao.commit()
+    return 'vendida'
+
+def vender_pedido(sessao, cliente_id, produto_id):
+    from sales_engine import registrar_pedido, EstoqueInsuficiente
+    try:
+        registrar_pedido(cliente_id, [(produto_id, 1)], sessao=sessao)
+        return 'vendida'
+    except EstoqueInsuficiente:
+        return 'sem_estoque'
+
+FLUXOS = {'antigo': vender_antigo, 'pedido': vender_pedido}
+
+def vender(fluxo, cliente_id, produto_id):
+    with Session(engine) as sessao:
+        try:
+            return FLUXOS[fluxo](sessao, cliente_id, produto_id)
+        except Exception as e:
+            sessao.rollback()
+            return f'erro: {type(e).__name__}: {e}'.splitlines()[0]
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga da baixa de estoque')
+    parser.add_argument('--vendas', type=int, default=400)
+    parser.add_argument('--estoque', type=int, default=250)
+    parser.add_argument('--processos', type=int, default=8)
+    parser.add_argument('--fluxo', choices=sorted(FLUXOS), default='pedido')
+    args = parser.parse_args()
+
+    engine_principal = criar_engine()
+    aplicar_migracoes(engine_principal)
+    with Session(engine_principal) as sessao:
+        produto = Produto(nome='Caderno disputado', descricao='', preco=10.0, quantidade=args.estoque)
+        cliente = Cliente(nome='Cliente de carga', email='carga@example.com')
+        sessao.add_all([produto, cliente])
+        sessao.commit()
+        produto_id, cliente_id = produto.id, cliente.id
+    engine_principal.dispose()
+
+    inicio = time.perf_counter()
+    with ProcessPoolExecutor(args.processos, initializer=iniciar_worker) as executor:
+        resultados = Counter(executor.map(
+            vender, [args.fluxo] * args.vendas, [cliente_id] * args.vendas, [produto_id] * args.vendas
+        ))
+    decorrido = time.perf_counter() - inicio
+
+    with Session(engine_principal) as sessao:
+        estoque_final = sessao.get(Produto, produto_id).quantidade
+        unidades_vendidas = sessao.query(func.sum(Venda.quantidade)).filter(Venda.produto_id == produto_id).scalar() or 0
+
+    print(f"Fluxo '{args.fluxo}': {args.vendas} vendas em {args.processos} processos, estoque inicial {args.estoque}")
+    for resultado, total in resultados.most_common():
+        print(f"  {resultado}: {total}")
+    print(f"Unidades vendidas: {unidades_vendidas} | estoque final: {estoque_final}")
+    print(f"Tempo: {decorrido:.2f}s | vazão: {args.vendas / decorrido:.0f} vendas/s")
+
+    problemas = []
+    if estoque_final < 0:
+        problemas.append("estoque negativo")
+    if unidades_vendidas > args.estoque:
+        problemas.append("vendeu além do estoque")
+    if estoque_final != args.estoque - unidades_vendidas:
+        problemas.append("baixa de estoque não bate com as vendas")
+    if problemas:
+        print("FALHOU: " + ', '.join(problemas))
+        sys.exit(1)
+    print("OK: estoque consistente")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+# Gerador de dados sintéticos para testes de desempenho: clientes, produtos,
+# pedidos e vendas numa escala configurável, com inserts em lote.
+#
+# - Popularidade dos produtos em lei de potência (Zipf): poucos produtos
+#   concentram a maior parte das vendas, como na loja de verdade.
+# - Atividade dos clientes assimétrica (lognormal): a maioria compra pouco,
+#   alguns compram muito.
+# - Datas sazonais: picos na volta às aulas (janeiro/fevereiro e julho) e em
+#   dezembro, menos vendas no domingo, horário comercial e um leve
+#   crescimento ao longo dos anos. Os ids dos pedidos seguem a ordem das datas.
+#
+# Grava direto nas tabelas (sem passar por registrar_pedido) e no fim
+# reconstrói os agregados (cliente_rfm, produto_vendas, produto_vendas_dia).
+# Só escreve num banco sem clientes, produtos nem pedidos: nunca mistura
+# dados sintéticos com os da loja.
+#
+# Uso: python benchmarks/gerar_dados.py --banco /tmp/carga.db [--escala media]
+#          [--clientes N] [--produtos N] [--pedidos N] [--anos 3] [--semente 42]
+# Depois, para usar o banco no app: DATABASE_URL=sqlite:////tmp/carga.db flask run
+
+import argparse
+import os
+import sys
+import time
+import unicodedata
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sqlalchemy.orm import Session
+from models import db, criar_engine, normalizar_busca
+from migrations import aplicar_migracoes
+from classification_engine import reconstruir_rfm_clientes
+from sales_engine import reconstruir_vendas_produtos
+
+# (clientes, produtos, pedidos) de cada escala
+ESCALAS = {
+    'pequena': (2_000, 300, 20_000),
+    'media': (50_000, 2_000, 500_000),
+    'grande': (500_000, 10_000, 5_000_000),
+}
+
+# Expoente da lei de potência da popularidade dos produtos (maior = mais concentrado)
+EXPOENTE_POPULARIDADE = 1.1
+# Peso das vendas por mês (janeiro a dezembro) e por dia da semana (segunda a domingo)
+PESOS_MESES = [1.6, 1.8, 1.1, 0.8, 0.8, 0.8, 1.3, 1.0, 0.8, 0.9, 1.1, 1.5]
+PESOS_DIAS_SEMANA = [1.0, 1.0, 1.0, 1.05, 1.15, 1.2, 0.4]
+HORA_ABERTURA, HORA_FECHAMENTO = 8, 20
+# Crescimento das vendas do primeiro ao último dia do período
+CRESCIMENTO = 0.3
+TAMANHO_LOTE = 100_000 # pedidos por transação
+
+PRIMEIROS_NOMES = [
+    'Ana', 'Bruno', 'Carla', 'Daniel', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique', 'Isabela', 'João',
+    'Juliana', 'Lucas', 'Mariana', 'Nicolas', 'Patrícia', 'Rafael', 'Sofia', 'Thiago', 'Valéria', 'Vinícius',
+]
+SOBRENOMES = [
+    'Almeida', 'Barbosa', 'Cardoso', 'Costa', 'Dias', 'Ferreira', 'Gomes', 'Lima', 'Martins', 'Oliveira',
+    'Pereira', 'Ribeiro', 'Rocha', 'Santos', 'Silva', 'Souza', 'Teixeira', 'Vieira',
+]
+CIDADES = ['São Paulo', 'Campinas', 'Santos', 'Belo Horizonte', 'Curitiba', 'Rio de Janeiro', 'Porto Alegre']
+RUAS = ['Rua das Flores', 'Av. Brasil', 'Rua XV de Novembro', 'Av. Paulista', 'Rua Sete de Setembro', 'Rua da Paz']
+
+# (tipo de produto, preço mediano)
+TIPOS_PRODUTOS = [
+    ('Caderno', 25.0), ('Caneta', 4.5), ('Lápis', 2.0), ('Borracha', 3.0), ('Marca-texto', 6.0),
+    ('Mochila', 150.0), ('Estojo', 35.0), ('Agenda', 45.0), ('Papel sulfite', 30.0), ('Cola', 5.0),
+    ('Tesoura', 12.0), ('Régua', 4.0), ('Fichário', 60.0), ('Lapiseira', 15.0), ('Tinta guache', 18.0),
+    ('Pincel', 8.0), ('Bloco de notas', 10.0), ('Calculadora', 70.0), ('Apontador', 3.5), ('Envelope', 1.5),
+]
+VARIACOES = ['Azul', 'Preto', 'Vermelho', 'Verde', 'Rosa', 'Neon', 'Pastel', 'Kraft', 'Premium', 'Escolar',
+             'Universitário', 'Infantil', 'Metálico', 'Reciclado', 'Colorido', 'Clássico']
+MARCAS = ['Faber', 'Tilibra', 'BIC', 'Pilot', 'Stabilo', 'Maped', 'Acrilex', 'Chamex', 'Foroni', 'Jandaia']
+
+def _sem_acentos(texto):
+    return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+
+def _texto_data(data):
+    """Data no formato em que o SQLAlchemy grava DateTime no SQLite."""
+    return data.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+def _banco_vazio(engine):
+    with engine.connect() as conexao:
+        return not any(
+            conexao.execute(db.text(f"SELECT 1 FROM {tabela} LIMIT 1")).first()
+            for tabela in ('cliente', 'produto', 'pedido')
+        )
+
+def gerar_produtos(rng, n_produtos, data_cadastro):
+    tipos = rng.integers(0, len(TIPOS_PRODUTOS), n_produtos)
+    linhas, precos = [], np.empty(n_produtos)
+    for i, tipo in enumerate(tipos):
+        nome_tipo, preco_mediano = TIPOS_PRODUTOS[tipo]
+        variacao, marca = VARIACOES[i % len(VARIACOES)], MARCAS[(i // len(VARIACOES)) % len(MARCAS)]
+        precos[i] = round(preco_mediano * rng.lognormal(0, 0.35), 2)
+        linhas.append((
+            i + 1, f"{nome_tipo} {variacao} {marca} {i + 1}", f"{nome_tipo} {variacao.lower()} da {marca}",
+            float(precos[i]), int(rng.integers(50, 5_000)), _texto_data(data_cadastro)
+        ))
+    return linhas, precos
+
+def gerar_clientes(rng, n_clientes, inicio, agora):
+    dias = (agora - inicio).days
+    linhas = []
+    for i in range(n_clientes):
+        primeiro = PRIMEIROS_NOMES[rng.integers(len(PRIMEIROS_NOMES))]
+        sobrenome = SOBRENOMES[rng.integers(len(SOBRENOMES))]
+        email = _sem_acentos(f"{primeiro}.{sobrenome}.{i + 1}@example.com").lower()
+        endereco = f"{RUAS[rng.integers(len(RUAS))]}, {rng.integers(1, 3000)} - {CIDADES[rng.integers(len(CIDADES))]}"
+        cadastro = inicio + timedelta(days=int(rng.integers(0, dias)))
+        nome = f"{primeiro} {sobrenome}"
+        linhas.append((
+            i + 1, nome, email, f"(11) 9{rng.integers(1000, 9999)}-{rng.integers(1000, 9999)}",
+            endereco, _texto_data(cadastro), normalizar_busca(nome), normalizar_busca(email)
+        ))
+    return linhas
+
+def pesos_dias(inicio, n_dias):
+    """Probabilidade de cada dia do período receber um pedido (sazonalidade + crescimento)."""
+    dias = [inicio + timedelta(days=d) for d in range(n_dias)]
+    pesos = np.array([PESOS_MESES[dia.month - 1] * PESOS_DIAS_SEMANA[dia.weekday()] for dia in dias])
+    pesos *= 1 + CRESCIMENTO * np.linspace(0, 1, n_dias)
+    return pesos / pesos.sum()
+
+def gerar_dados(engine, n_clientes, n_produtos, n_pedidos, anos=3, semente=42, progresso=None):
+    """
+    Popula um banco vazio (já migrado) com dados sintéticos e reconstrói os
+    agregados. 'progresso', se informado, é chamado com o número de pedidos
+    já gravados. Retorna {'clientes', 'produtos', 'pedidos', 'vendas'}.
+    """
+    if not _banco_vazio(engine):
+        raise ValueError("O banco já tem clientes, produtos ou pedidos: use um banco novo.")
+
+    rng = np.random.default_rng(semente)
+    agora = datetime.now().replace(microsecond=0)
+    inicio = (agora - timedelta(days=365 * anos)).replace(hour=0, minute=0, second=0)
+    n_dias = (agora - inicio).days + 1
+
+    produtos, precos = gerar_produtos(rng, n_produtos, inicio)
+    with engine.begin() as conexao:
+        conexao.exec_driver_sql(
+            "INSERT INTO produto (id, nome, descricao, preco, quantidade, data_cadastro) VALUES (?, ?, ?, ?, ?, ?)",
+            produtos
+        )
+        conexao.exec_driver_sql(
+            "INSERT INTO cliente (id, nome, email, telefone, endereco, data_cadastro, nome_busca, email_busca) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            gerar_clientes(rng, n_clientes, inicio, agora)
+        )
+
+    # Popularidade: o produto na posição k do ranking (embaralhado) tem peso 1/k^s
+    ranking = rng.permutation(n_produtos)
+    popularidade = np.empty(n_produtos)
+    popularidade[ranking] = 1.0 / np.arange(1, n_produtos + 1) ** EXPOENTE_POPULARIDADE
+    popularidade /= popularidade.sum()
+    atividade = rng.lognormal(0, 1.2, n_clientes)
+    atividade /= atividade.sum()
+
+    # Datas de todos os pedidos em ordem, para os ids seguirem o tempo
+    dias = np.sort(rng.choice(n_dias, n_pedidos, p=pesos_dias(inicio, n_dias)))
+    segundos = rng.integers(HORA_ABERTURA * 3600, HORA_FECHAMENTO * 3600, n_pedidos)
+    instantes = np.datetime64(inicio, 's') + dias.astype('timedelta64[D]') + segundos.astype('timedelta64[s]')
+    instantes = np.minimum(np.sort(instantes), np.datetime64(agora, 's'))
+
+    n_vendas = 0
+    for comeco in range(0, n_pedidos, TAMANHO_LOTE):
+        fim = min(comeco + TAMANHO_LOTE, n_pedidos)
+        tamanho = fim - comeco
+        pedido_ids = np.arange(comeco + 1, fim + 1)
+        clientes = rng.choice(n_clientes, tamanho, p=atividade) + 1
+
+        # Itens: 1 + Poisson produtos por pedido, sem repetir produto no mesmo pedido
+        itens_por_pedido = 1 + rng.poisson(1.3, tamanho)
+        dono = np.repeat(np.arange(tamanho), itens_por_pedido)
+        produto_idx = rng.choice(n_produtos, len(dono), p=popularidade)
+        chaves = np.unique(dono.astype(np.int64) * n_produtos + produto_idx)
+        dono, produto_idx = chaves // n_produtos, chaves % n_produtos
+        quantidades = np.minimum(rng.geometric(0.6, len(dono)), 10)
+        valores = np.round(precos[produto_idx] * quantidades, 2)
+        totais = np.bincount(dono, weights=valores, minlength=tamanho)
+
+        datas = np.char.replace(np.datetime_as_string(instantes[comeco:fim], unit='us'), 'T', ' ').tolist()
+        pedidos = [
+            (int(pid), int(cid), data, round(float(total), 2))
+            for pid, cid, data, total in zip(pedido_ids, clientes, datas, totais)
+        ]
+        vendas = [
+            (int(pedido_ids[d]), int(clientes[d]), int(p) + 1, int(q), datas[d], float(v))
+            for d, p, q, v in zip(dono, produto_idx, quantidades, valores)
+        ]
+        with engine.begin() as conexao:
+            conexao.exec_driver_sql(
+                "INSERT INTO pedido (id, cliente_id, data_pedido, valor_total) VALUES (?, ?, ?, ?)", pedidos
+            )
+            conexao.exec_driver_sql(
+                "INSERT INTO venda (pedido_id, cliente_id, produto_id, quantidade, data_venda, valor_total) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                vendas
+            )
+        n_vendas += len(vendas)
+        if progresso:
+            progresso(fim)
+
+    with Session(engine) as sessao:
+        reconstruir_rfm_clientes(sessao)
+        reconstruir_vendas_produtos(sessao)
+    with engine.begin() as conexao:
+        conexao.exec_driver_sql("ANALYZE") # Estatísticas para o planejador do SQLite
+
+    return {'clientes': n_clientes, 'produtos': n_produtos, 'pedidos': n_pedidos, 'vendas': n_vendas}
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera dados sintéticos (clientes, produtos e vendas)')
+    parser.add_argument('--banco', required=True, help='Arquivo SQLite (criado e migrado se não existir)')
+    parser.add_argument('--escala', choices=ESCALAS, default='media')
+    parser.add_argument('--clientes', type=int)
+    parser.add_argument('--produtos', type=int)
+    parser.add_argument('--pedidos', type=int)
+    parser.add_argument('--anos', type=int, default=3)
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+
+    n_clientes, n_produtos, n_pedidos = ESCALAS[args.escala]
+    engine = criar_engine(f"sqlite:///{os.path.abspath(args.banco)}")
+    aplicar_migracoes(engine)
+
+    inicio = time.perf_counter()
+    try:
+        totais = gerar_dados(
+            engine, args.clientes or n_clientes, args.produtos or n_produtos, args.pedidos or n_pedidos,
+            args.anos, args.semente,
+            progresso=lambda feitos: print(f"  {feitos} pedidos gravados ({time.perf_counter() - inicio:.0f}s)")
+        )
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f"{totais['clientes']} clientes, {totais['produtos']} produtos, {totais['pedidos']} pedidos e "
+          f"{totais['vendas']} vendas em {time.perf_counter() - inicio:.0f}s ({args.banco})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# Campanhas de emails de recomendação em lote.
+#
+# Percorre os clientes com email em lotes (ordem de id); numa campanha de um
+# segmento, só os clientes com esse segmento gravado (cliente.segmento, pelo
+# índice). Para cada lote: calcula as recomendações KNN do lote inteiro numa
+# passada pela matriz de compras, busca os produtos com uma consulta, monta
+# os emails e os coloca na fila de saída com um único insert. O progresso (ultimo_cliente_id) é gravado no mesmo commit dos
+# emails do lote, então uma campanha interrompida continua de onde parou sem
+# repetir emails.
+
+import os
+from datetime import datetime
+from models import sessao_padrao, Campanha, Cliente, Produto
+from classification_engine import SEGMENTOS
+from recommendation_engine import get_best_sellers, get_purchase_matrix, recomendar_ids_knn_lote
+
+TAMANHO_LOTE = 500
+
+def _clientes_com_email(sessao, segmento=None):
+    query = sessao.query(Cliente).filter(Cliente.email.isnot(None), Cliente.email != '')
+    if segmento is not None:
+        query = query.filter(Cliente.segmento == segmento)
+    return query
+
+def iniciar_campanha(segmento=None, pasta_simulacao=None, sessao=None):
+    """
+    Cria uma campanha (ainda sem processar nenhum cliente) e faz commit.
+    'segmento' é um nome de classificação (ex.: 'Fiel'); None = todos.
+    Com 'pasta_simulacao', os emails são gravados nessa pasta em vez de enviados.
+    """
+    if segmento is not None and segmento not in SEGMENTOS:
+        raise ValueError(f"Segmento inválido: {segmento}. Use um de: {', '.join(SEGMENTOS)}")
+
+    sessao = sessao_padrao(sessao)
+    if segmento is not None and sessao.query(Cliente.id).filter(Cliente.segmento.isnot(None)).first() is None:
+        raise ValueError("Segmentos ainda não calculados: rode `flask treinar-classificacao` ou `flask atualizar-segmentos`.")
+    campanha = Campanha(
+        segmento=segmento,
+        pasta_simulacao=pasta_simulacao,
+        total_clientes=_clientes_com_email(sessao, segmento).count()
+    )
+    sessao.add(campanha)
+    sessao.commit()
+    return campanha
+
+def _gravar_simulacao(pasta, cliente, assunto, html):
+    with open(os.path.join(pasta, f"cliente_{cliente.id}.html"), 'w', encoding='utf-8') as arquivo:
+        arquivo.write(f"<!-- Para: {cliente.email} -->\n<title>{assunto}</title>\n{html}")
+
+def executar_campanha(campanha_id, tamanho_lote=TAMANHO_LOTE, progresso=None, sessao=None):
+    """
+    Processa a campanha a partir de onde ela parou até o fim.
+    'progresso', se informado, é chamado com a Campanha após cada lote.
+    Retorna a Campanha concluída.
+    """
+    from email_engine import enfileirar_emails, renderizar_email_recomendacao
+
+    sessao = sessao_padrao(sessao)
+    campanha = sessao.get(Campanha, campanha_id)
+    if campanha is None:
+        raise ValueError(f"Campanha {campanha_id} não encontrada.")
+    if campanha.status == 'concluida':
+        return campanha
+    if campanha.pasta_simulacao:
+        os.makedirs(campanha.pasta_simulacao, exist_ok=True)
+
+    # Calculados uma vez para a campanha inteira
+    matrix = get_purchase_matrix(sessao)
+    mais_vendidos = get_best_sellers(n=3, sessao=sessao)
+
+    while True:
+        lote = _clientes_com_email(sessao, campanha.segmento).filter(
+            Cliente.id > campanha.ultimo_cliente_id
+        ).order_by(Cliente.id).limit(tamanho_lote).all()
+        if not lote:
+            break
+
+        recomendacoes = recomendar_ids_knn_lote(matrix, [c.id for c in lote])
+        ids_produtos = {pid for ids in recomendacoes.values() for pid in ids}
+        produtos = {p.id: p for p in sessao.query(Produto).filter(Produto.id.in_(ids_produtos)).all()} if ids_produtos else {}
+
+        mensagens = []
+        gerados = 0
+        for cliente in lote:
+            recomendados = [produtos[pid] for pid in recomendacoes.get(cliente.id, []) if pid in produtos]
+            tipo = 'personalizada'
+            if not recomendados:
+                recomendados, tipo = mais_vendidos, 'fallback'
+            if not recomendados:
+                continue
+
+            assunto, html = renderizar_email_recomendacao(cliente, recomendados, tipo)
+            gerados += 1
+            if campanha.pasta_simulacao:
+                _gravar_simulacao(campanha.pasta_simulacao, cliente, assunto, html)
+            else:
+                mensagens.append((cliente.email, assunto, html))
+
+        enfileirar_emails(mensagens, sessao)
+        campanha.ultimo_cliente_id = lote[-1].id
+        campanha.processados += len(lote)
+        campanha.enfileirados += gerados
+        sessao.commit() # Emails do lote e progresso juntos
+
+        if progresso:
+            progresso(campanha)
+
+    campanha.status = 'concluida'
+    campanha.concluida_em = datetime.utcnow()
+    sessao.commit()
+    return campanha
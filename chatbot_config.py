@@ -1,48 +1,348 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-
-# Nosso "cérebro" do assistente continua o mesmo
-conversa_assistente = {
-    "como faço para cadastrar um novo produto?": "Na página inicial, clique em 'Produtos'. Na tela de listagem, procure e clique no botão para 'Cadastrar Produto'.",
-    "onde posso acessar a lista de produtos disponíveis?": "Acesse pelo botão 'Produtos' na páginas inicial.",
-    "onde eu vejo a lista de clientes?": "Clique no botão 'Clientes' no menu da página inicial para ver, editar ou cadastrar novos clientes.",
-    "como eu vejo a lista de vendas registradas?": "Acesse a seção 'Vendas' na página inicial",
-    "como eu registro uma nova venda no sistema?": "Acesse a seção 'Vendas' a partir do menu inicial e clique em 'Nova Venda'. Você precisará selecionar o cliente e os produtos vendidos.",
-    "é possível saber quais produtos recomendar a um cliente?": "Na página inicial, clique em 'Clientes'. Ao lado do botão 'Editar' você deve encontrar o botão que recomenda ao cleinte com base em suas ultimas compras.",
-    "é possível alterar os dados de um cliente?": "Na lista de clientes, encontre o cliente desejado e clique na opção 'Editar' para atualizar as informações.",
-    "e se eu errar o preço de um produto, posso corrigir?": "Para corrigir os dados de um produto, vá até a lista de 'Produtos', encontre o item e clique em 'Editar' para corrigir o preço e outras informações.",
-    "o que devo fazer se eu esquecer minha senha?": "Na tela de login, clique no link 'Esqueci minha senha'. O sistema te guiará para criar uma nova senha através do seu e--mail.",
-    "como posso contatar o suporte técnico?": "No canto superior direito de qualquer página, você encontrará um link chamado 'Suporte' para enviar uma mensagem à equipe técnica."
-}
-
-# Preparando o modelo de NLP
-perguntas = list(conversa_assistente.keys())
-vectorizer = TfidfVectorizer()
-X = vectorizer.fit_transform(perguntas)
-
-
-def get_simple_bot_response(user_message):
+# Assistente do FAQ: encontra a pergunta cadastrada mais parecida com a
+# mensagem (TF-IDF + similaridade de cosseno) e devolve a resposta dela.
+#
+# As perguntas ficam na tabela 'pergunta_faq' (editável pelo admin em /faq).
+# O índice é incremental:
+# - cada pergunta vira um vetor de contagens de palavras (HashingVectorizer,
+#   que não precisa de vocabulário treinado) guardado por id + atualizado_em;
+# - quando o FAQ muda, só as perguntas novas ou editadas são vetorizadas de
+#   novo; o IDF sai das contagens de documentos, mantidas somando/subtraindo;
+# - o índice novo é montado ao lado do atual e trocado de uma vez (uma
+#   atribuição): quem está respondendo termina com o índice que já pegou.
+# Uma thread em segundo plano confere a cada INTERVALO_VERIFICACAO segundos
+# se o FAQ mudou no banco (contagem + maior atualizado_em), então todos os
+# workers pegam as edições sem reiniciar. O estado é salvo em
+# indice_faq.joblib para o início não vetorizar o FAQ inteiro.
+
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+import joblib
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from sqlalchemy.orm import Session
+from models import db, sessao_padrao, PerguntaFaq, PorBanco
+from instrumentation import cronometrado
+
+# Contagens já vetorizadas de cada pergunta, para não vetorizar de novo a cada
+# início; relativo a este arquivo, não ao diretório de onde o app foi iniciado
+INDICE_FAQ_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'indice_faq.joblib')
+
+CONFIANCA_MINIMA = 0.3 # Abaixo disso, o assistente pede para reformular
+TOP_K_PADRAO = 3
+LIMITE_CACHE_RESPOSTAS = 1024
+INTERVALO_VERIFICACAO = 5 # segundos entre conferências de mudanças no FAQ
+N_ATRIBUTOS = 2 ** 20 # posições do hashing; colisões entre palavras ficam raras
+logger = logging.getLogger(__name__)
+
+RESPOSTA_PADRAO = "Desculpe, não tenho certeza de como responder. Pode tentar reformular sua pergunta?"
+
+# Mesmo pré-processamento do TfidfVectorizer padrão (minúsculas, palavras de 2+ letras)
+_vetorizador = HashingVectorizer(n_features=N_ATRIBUTOS, alternate_sign=False, norm=None)
+
+def _pesar(contagens, idf):
+    """TF-IDF com linhas de norma L2 = 1: a similaridade de cosseno vira um produto escalar."""
+    pesos = contagens.copy()
+    pesos.data = pesos.data * idf[pesos.indices]
+    pesos.eliminate_zeros() # Palavras que não aparecem em nenhuma pergunta não contam
+    return normalize(pesos, norm='l2')
+
+class IndiceFaq:
+    """
+    Índice pronto para consulta, nunca alterado depois de montado: quando o
+    FAQ muda, um índice novo substitui este.
+    """
+    def __init__(self, ids, perguntas, respostas, matriz, idf, assinatura):
+        self.ids = ids
+        self.perguntas = perguntas
+        self.respostas = respostas
+        self.matriz = matriz
+        self.idf = idf
+        self.assinatura = assinatura
+
+    def melhores(self, mensagens, k=TOP_K_PADRAO):
+        """
+        Para cada mensagem, as 'k' perguntas mais parecidas, da mais para a
+        menos parecida: lista (uma por mensagem) de listas de (posição, score).
+        Todas as mensagens são vetorizadas e comparadas numa única operação.
+        """
+        if not mensagens or not self.perguntas:
+            return [[] for _ in mensagens]
+        vetores = _pesar(_vetorizador.transform(mensagens).tocsr(), self.idf)
+        scores = (vetores @ self.matriz.T).toarray()
+
+        k = min(k, scores.shape[1])
+        resultado = []
+        for linha in scores:
+            candidatos = np.argpartition(-linha, k - 1)[:k]
+            # Do maior score para o menor; empate fica com a pergunta cadastrada antes
+            ordem = candidatos[np.lexsort((candidatos, -linha[candidatos]))]
+            resultado.append([(int(i), float(linha[i])) for i in ordem])
+        return resultado
+
+class EstadoIndiceFaq:
+    """
+    O que o índice guarda entre atualizações: por id, a versão
+    (atualizado_em), o texto e as contagens de palavras (posições e valores)
+    de cada pergunta, e em quantas perguntas cada palavra aparece (para o IDF).
+    'banco' diz de qual banco é o estado salvo em disco.
+    """
+    def __init__(self, banco):
+        self.banco = banco
+        self.entradas = {} # id -> (atualizado_em, pergunta, resposta, posicoes, contagens)
+        self.documentos = np.zeros(N_ATRIBUTOS, dtype=np.int32)
+
+    def versao(self, id_):
+        entrada = self.entradas.get(id_)
+        return entrada[0] if entrada else None
+
+    def remover(self, ids):
+        for id_ in ids:
+            posicoes = self.entradas.pop(id_)[3]
+            self.documentos[posicoes] -= 1
+
+    def gravar(self, perguntas):
+        """Vetoriza só as perguntas recebidas [(id, atualizado_em, pergunta, resposta), ...]."""
+        if not perguntas:
+            return
+        self.remover([id_ for id_, *_ in perguntas if id_ in self.entradas])
+        contagens = _vetorizador.transform([pergunta for _, _, pergunta, _ in perguntas]).tocsr()
+        for posicao, (id_, atualizado_em, pergunta, resposta) in enumerate(perguntas):
+            inicio, fim = contagens.indptr[posicao], contagens.indptr[posicao + 1]
+            posicoes = contagens.indices[inicio:fim].astype(np.int32)
+            self.entradas[id_] = (atualizado_em, pergunta, resposta, posicoes, contagens.data[inicio:fim].astype(np.float32))
+            self.documentos[posicoes] += 1
+
+    def _contagens(self, ids):
+        """Matriz esparsa de contagens, uma linha por id, montada direto dos arrays."""
+        tamanhos = [len(self.entradas[id_][3]) for id_ in ids]
+        indptr = np.concatenate(([0], np.cumsum(tamanhos))).astype(np.int64)
+        if not ids:
+            return sparse.csr_matrix((0, N_ATRIBUTOS))
+        posicoes = np.concatenate([self.entradas[id_][3] for id_ in ids])
+        contagens = np.concatenate([self.entradas[id_][4] for id_ in ids]).astype(np.float64)
+        return sparse.csr_matrix((contagens, posicoes, indptr), shape=(len(ids), N_ATRIBUTOS))
+
+    def montar_indice(self, assinatura):
+        ids = sorted(self.entradas)
+        # IDF suavizado, igual ao do TfidfVectorizer; palavra fora do FAQ fica com peso 0
+        n = len(ids)
+        idf = np.where(self.documentos > 0, np.log((1 + n) / (1 + self.documentos)) + 1, 0.0)
+        return IndiceFaq(
+            ids,
+            [self.entradas[id_][1] for id_ in ids],
+            [self.entradas[id_][2] for id_ in ids],
+            _pesar(self._contagens(ids), idf), idf, assinatura
+        )
+
+    def __getstate__(self):
+        # Em disco: algumas listas e uma matriz só, em vez de milhares de objetos pequenos
+        ids = sorted(self.entradas)
+        contagens = self._contagens(ids)
+        return {
+            'n_atributos': N_ATRIBUTOS,
+            'banco': self.banco,
+            'ids': ids,
+            'versoes': [self.entradas[id_][0] for id_ in ids],
+            'perguntas': [self.entradas[id_][1] for id_ in ids],
+            'respostas': [self.entradas[id_][2] for id_ in ids],
+            'indptr': contagens.indptr,
+            'posicoes': contagens.indices.astype(np.int32),
+            'contagens': contagens.data.astype(np.float32),
+        }
+
+    def __setstate__(self, estado):
+        if estado.get('n_atributos') != N_ATRIBUTOS:
+            raise ValueError("Índice salvo com outro número de atributos.")
+        self.banco = estado['banco']
+        indptr, posicoes, contagens = estado['indptr'], estado['posicoes'], estado['contagens']
+        self.entradas = {
+            id_: (versao, pergunta, resposta, posicoes[indptr[i]:indptr[i + 1]], contagens[indptr[i]:indptr[i + 1]])
+            for i, (id_, versao, pergunta, resposta)
+            in enumerate(zip(estado['ids'], estado['versoes'], estado['perguntas'], estado['respostas']))
+        }
+        self.documentos = np.bincount(posicoes, minlength=N_ATRIBUTOS).astype(np.int32)
+
+class GerenciadorIndiceFaq:
+    """
+    Mantém o índice atual do FAQ de um banco (engine) neste processo e o
+    atualiza quando o FAQ muda. A consulta nunca espera uma atualização, a
+    não ser a primeira. A thread em segundo plano abre as próprias sessões
+    no engine, sem depender do app Flask.
+    """
+    def __init__(self, engine, caminho=INDICE_FAQ_PATH):
+        self.engine = engine
+        self.banco = engine.url.render_as_string(hide_password=True)
+        self.caminho = caminho
+        self.respostas = CacheRespostas()
+        self._lock = threading.Lock() # Uma atualização por vez
+        self._lock_thread = threading.Lock()
+        self._indice = None
+        self._estado = None
+        self._thread = None
+        self._acordar = threading.Event()
+
+    def atual(self, sessao=None):
+        """O índice atual. Na primeira chamada, monta o índice com 'sessao'."""
+        indice = self._indice
+        if indice is None:
+            self.atualizar(sessao)
+            indice = self._indice
+        self._iniciar_thread()
+        return indice
+
+    def avisar_mudanca(self):
+        """Chamado depois do commit de uma edição: atualiza já, sem esperar o intervalo."""
+        self._iniciar_thread()
+        self._acordar.set()
+
+    def atualizar(self, sessao=None):
+        """
+        Confere a assinatura do FAQ no banco; se mudou, vetoriza só as
+        perguntas novas ou editadas e troca o índice. Retorna True se trocou.
+        Sem 'sessao', usa uma sessão própria no engine.
+        """
+        if sessao is None:
+            with Session(self.engine) as sessao:
+                return self.atualizar(sessao)
+
+        with self._lock:
+            assinatura = tuple(sessao.query(
+                db.func.count(PerguntaFaq.id), db.func.max(PerguntaFaq.atualizado_em)
+            ).one())
+            if self._indice is not None and self._indice.assinatura == assinatura:
+                return False
+
+            estado = self._estado or self._carregar_estado()
+            versoes = dict(sessao.query(PerguntaFaq.id, PerguntaFaq.atualizado_em))
+            removidas = [id_ for id_ in estado.entradas if id_ not in versoes]
+            mudadas = [id_ for id_, versao in versoes.items() if estado.versao(id_) != versao]
+
+            estado.remover(removidas)
+            for inicio in range(0, len(mudadas), 500):
+                lote = mudadas[inicio:inicio + 500]
+                estado.gravar(sessao.query(
+                    PerguntaFaq.id, PerguntaFaq.atualizado_em, PerguntaFaq.pergunta, PerguntaFaq.resposta
+                ).filter(PerguntaFaq.id.in_(lote)).all())
+
+            self._estado = estado
+            self._indice = estado.montar_indice(assinatura) # Troca atômica
+            if removidas or mudadas:
+                self._salvar_estado(estado)
+            return True
+
+    def _carregar_estado(self):
+        try:
+            estado = joblib.load(self.caminho)
+            if isinstance(estado, EstadoIndiceFaq) and estado.banco == self.banco:
+                return estado
+        except Exception:
+            pass # Arquivo ausente, corrompido, de outra versão ou de outro banco: vetoriza tudo
+        return EstadoIndiceFaq(self.banco)
+
+    def _salvar_estado(self, estado):
+        temporario = f"{self.caminho}.{os.getpid()}.tmp"
+        try:
+            joblib.dump(estado, temporario)
+            os.replace(temporario, self.caminho)
+        except OSError:
+            pass # Sem permissão de escrita: funciona só com o estado em memória
+
+    def _iniciar_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock_thread:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._rodar, name='indice-faq', daemon=True)
+                self._thread.start()
+
+    def _rodar(self):
+        while True:
+            self._acordar.wait(INTERVALO_VERIFICACAO)
+            self._acordar.clear()
+            try:
+                self.atualizar()
+            except Exception as e:
+                logger.error(f"Erro ao atualizar o índice do FAQ: {e}")
+
+def normalizar_mensagem(mensagem):
+    """Minúsculas e espaços simples: perguntas iguais escritas diferente usam a mesma entrada do cache."""
+    return re.sub(r'\s+', ' ', mensagem.strip().lower())
+
+class CacheRespostas:
+    """LRU das respostas por índice, mensagem normalizada e 'k', por processo."""
+    def __init__(self, limite=LIMITE_CACHE_RESPOSTAS):
+        self.limite = limite
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()
+
+    def obter(self, chave):
+        with self._lock:
+            valor = self._itens.get(chave)
+            if valor is not None:
+                self._itens.move_to_end(chave)
+            return valor
+
+    def guardar(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.limite:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+_gerenciadores = PorBanco(GerenciadorIndiceFaq)
+
+def gerenciador_indice_faq(sessao=None):
+    """O gerenciador do índice do FAQ do banco de 'sessao' (ou de db.session)."""
+    return _gerenciadores.obter(sessao_padrao(sessao).get_bind())
+
+def buscar_respostas_lote(mensagens, k=TOP_K_PADRAO, sessao=None):
+    """
+    Para cada mensagem, as 'k' melhores perguntas do FAQ com a resposta e o
+    score: lista de listas de {'pergunta', 'resposta', 'score'}. Mensagens
+    já vistas vêm do cache; as demais são respondidas numa única chamada.
+    Usa o FAQ do banco de 'sessao' (ou de db.session).
+    """
+    gerenciador = gerenciador_indice_faq(sessao)
+    indice = gerenciador.atual(sessao)
+    # A assinatura do índice entra na chave: respostas de um índice antigo nunca são usadas
+    chaves = [(indice.assinatura, normalizar_mensagem(mensagem), k) for mensagem in mensagens]
+    resultados = [gerenciador.respostas.obter(chave) for chave in chaves]
+
+    faltando = list(dict.fromkeys(chave for chave, resultado in zip(chaves, resultados) if resultado is None))
+    if not faltando:
+        return resultados
+
+    calculados = {}
+    for chave, melhores in zip(faltando, indice.melhores([texto for _, texto, _ in faltando], k)):
+        calculados[chave] = [
+            {'pergunta': indice.perguntas[i], 'resposta': indice.respostas[i], 'score': score}
+            for i, score in melhores
+        ]
+        gerenciador.respostas.guardar(chave, calculados[chave])
+    return [resultado if resultado is not None else calculados[chave] for chave, resultado in zip(chaves, resultados)]
+
+def buscar_respostas(mensagem, k=TOP_K_PADRAO, sessao=None):
+    """As 'k' melhores perguntas do FAQ para uma mensagem (ver buscar_respostas_lote)."""
+    return buscar_respostas_lote([mensagem], k, sessao)[0]
+
+def resposta_do_bot(melhores):
+    """Resposta final a partir dos melhores resultados: a melhor, se a confiança for suficiente."""
+    if melhores and melhores[0]['score'] > CONFIANCA_MINIMA: # Se a confiança for maior que 30%
+        return melhores[0]['resposta']
+    return RESPOSTA_PADRAO
+
+@cronometrado('chatbot')
+def get_simple_bot_response(user_message, sessao=None):
     """
     Usa um modelo TF-IDF e similaridade de cosseno para encontrar a pergunta mais relevante.
     """
-    # Converte a mensagem do usuário em um vetor com o mesmo padrão
-    user_vec = vectorizer.transform([user_message])
-    
-    # Calcula a similaridade entre a pergunta do usuário e todas as perguntas conhecidas
-    similarities = cosine_similarity(user_vec, X)
-    
-    # Encontra o índice da pergunta mais similar
-    most_similar_index = similarities.argmax()
-    
-    # Pega o score de similaridade (de 0.0 a 1.0)
-    confidence_score = similarities[0, most_similar_index]
-    
-    if confidence_score > 0.3: # Se a confiança for maior que 30%
-        # Retorna a resposta da pergunta mais similar
-        best_question = perguntas[most_similar_index]
-        return conversa_assistente[best_question]
-    else:
-        return "Desculpe, não tenho certeza de como responder. Pode tentar reformular sua pergunta?"
-
-# Para a página de FAQ, a exportação continua a mesma
-faqs_list = conversa_assistente.items()
\ No newline at end of file
+    return resposta_do_bot(buscar_respostas(user_message, k=1, sessao=sessao))
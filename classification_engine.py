@@ -1,115 +1,310 @@
-# Script para treinar o modelo de classificação de clientes, rodar no terminal uma vez para treinar e depois comentar o if __name__ == "__main__"
+# Classificação de clientes (RFM + K-Means): treino em lotes com versões dos
+# modelos e previsão. Treinar: `flask treinar-classificacao` (ou
+# `python classification_engine.py`), por exemplo todas as noites no cron.
 
-import pandas as pd
-import joblib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import Counter
 from datetime import datetime
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
+from models import db, Cliente, ClienteRFM, sessao_padrao
+from instrumentation import cronometrado
+
+# pandas, joblib e sklearn são importados dentro das funções que os usam:
+# o app importa este módulo (via sales_engine) e não deve pagar por eles ao iniciar
 
 # --- Constantes ---
-MODELO_CLUSTER_PATH = 'modelo_cluster.pkl'
-MODELO_SCALER_PATH = 'scaler_cluster.pkl'
+# Caminhos relativos a este arquivo, não ao diretório de onde o app (ou o
+# `flask treinar-classificacao`) foi iniciado: treino e workers usam os mesmos
+PASTA_PROJETO = os.path.dirname(os.path.abspath(__file__))
+# Modelos antigos (treino completo, sobrescritos no lugar): usados só enquanto não houver versão em PASTA_MODELOS
+MODELO_CLUSTER_PATH = os.path.join(PASTA_PROJETO, 'modelo_cluster.pkl')
+MODELO_SCALER_PATH = os.path.join(PASTA_PROJETO, 'scaler_cluster.pkl')
 N_CLUSTERS = 3
 
-def calcular_rfm(app_context):
+def calcular_rfm(sessao=None, tamanho_lote=None):
     """
-    Busca todos os dados de vendas e calcula as métricas RFM
-    (Recência, Frequência, Valor Monetário) para cada cliente.
+    Lê o agregado da tabela cliente_rfm (uma linha por cliente) e calcula as
+    métricas RFM (Recência, Frequência, Valor Monetário) para cada cliente.
+    A tabela é lida em lotes (_lotes_rfm) e cada lote é copiado para arrays
+    compactos já alocados: cliente_id, recencia e frequencia em int32,
+    monetario em float32. O pico de memória é o DataFrame final mais um lote.
     """
     print("Iniciando cálculo RFM...")
-    from app import db
-    
-    with app_context:
-        query = db.text("SELECT cliente_id, data_venda, valor_total FROM venda")
-        df_vendas = pd.read_sql(query, db.engine, parse_dates=['data_venda'])
-
-        if df_vendas.empty:
-            print("Nenhum dado de venda encontrado. Abortando.")
-            return None
-
-        df_recencia = df_vendas.groupby('cliente_id')['data_venda'].max().reset_index()
-        df_recencia['recencia'] = (datetime.now() - df_recencia['data_venda']).dt.days
-        df_recencia = df_recencia[['cliente_id', 'recencia']]
+    import numpy as np
+    import pandas as pd
+
+    sessao = sessao_padrao(sessao)
+    # Limite superior: clientes gravados entre a contagem e a leitura ficam de fora
+    total = sessao.execute(db.text("SELECT COUNT(*) FROM cliente_rfm")).scalar()
+    if not total:
+        print("Nenhum dado de venda encontrado. Abortando.")
+        return None
+
+    ids = np.empty(total, dtype=np.int32)
+    recencia = np.empty(total, dtype=np.int32)
+    frequencia = np.empty(total, dtype=np.int32)
+    monetario = np.empty(total, dtype=np.float32)
+    lidos = 0
+    for ids_lote, dados in _lotes_rfm(sessao, datetime.now(), tamanho_lote or TAMANHO_LOTE_TREINO):
+        fim = min(lidos + len(ids_lote), total)
+        tamanho = fim - lidos
+        ids[lidos:fim] = ids_lote[:tamanho]
+        recencia[lidos:fim] = dados[:tamanho, 0]
+        frequencia[lidos:fim] = dados[:tamanho, 1]
+        monetario[lidos:fim] = dados[:tamanho, 2]
+        lidos = fim
+        if lidos == total:
+            break
+
+    df_rfm = pd.DataFrame({
+        'cliente_id': ids[:lidos],
+        'frequencia': frequencia[:lidos],
+        'monetario': monetario[:lidos],
+        'recencia': recencia[:lidos],
+    }, copy=False)
+
+    print(f"Cálculo RFM concluído. {len(df_rfm)} clientes processados.")
+    return df_rfm
 
-        df_frequencia = df_vendas.groupby('cliente_id').size().reset_index(name='frequencia')
-
-        df_monetario = df_vendas.groupby('cliente_id')['valor_total'].sum().reset_index(name='monetario')
-
-        df_rfm = df_frequencia.merge(df_monetario, on='cliente_id')
-        df_rfm = df_rfm.merge(df_recencia, on='cliente_id')
-
-        print(f"Cálculo RFM concluído. {len(df_rfm)} clientes processados.")
-        return df_rfm
+# ==========================================================
+# Treino incremental (MiniBatchKMeans) com versões dos modelos
+# ==========================================================
+# O treino lê cliente_rfm em lotes (por cliente_id), então a memória fica
+# limitada ao tamanho do lote mesmo com milhões de clientes:
+# 1. uma passada ajusta o StandardScaler (partial_fit);
+# 2. 'epocas' passadas ajustam o MiniBatchKMeans (partial_fit);
+# 3. uma última passada mede a inércia e o tamanho de cada cluster.
+# Cada treino grava uma pasta nova em PASTA_MODELOS (modelos.joblib +
+# metadados.json) e depois troca o ponteiro ATUAL com um os.replace: os
+# workers percebem a troca e carregam a versão nova sem reiniciar.
+
+PASTA_MODELOS = os.path.join(PASTA_PROJETO, 'modelos_classificacao')
+PONTEIRO_ATUAL = os.path.join(PASTA_MODELOS, 'ATUAL')
+TAMANHO_LOTE_TREINO = 10_000
+EPOCAS_TREINO = 3
+VERSOES_MANTIDAS = 5
+COLUNAS_RFM = ['recencia', 'frequencia', 'monetario']
+
+def _expressao_recencia(dialeto):
+    """Dias inteiros entre ultima_compra e :agora, calculados no banco."""
+    if dialeto == 'sqlite':
+        return "CAST(julianday(:agora) - julianday(ultima_compra) AS INTEGER)"
+    return "EXTRACT(DAY FROM (:agora - ultima_compra))"
+
+def _lotes_rfm(sessao, agora, tamanho_lote):
+    """
+    Lê cliente_rfm em lotes ordenados por cliente_id (keyset, sem OFFSET).
+    Gera (cliente_ids, dados), com 'dados' em float64 e colunas COLUNAS_RFM.
+    A recência sai pronta do banco: converter milhões de datas no Python
+    custaria mais do que o treino.
+    """
+    import numpy as np
+
+    query = db.text(f"""
+        SELECT cliente_id, {_expressao_recencia(sessao.get_bind().dialect.name)},
+               total_compras, total_gasto
+        FROM cliente_rfm
+        WHERE cliente_id > :ultimo
+        ORDER BY cliente_id
+        LIMIT :limite
+    """).bindparams(db.bindparam('agora', type_=db.DateTime))
+    ultimo_id = 0
+    while True:
+        linhas = sessao.execute(query, {'agora': agora, 'ultimo': ultimo_id, 'limite': tamanho_lote}).all()
+        if not linhas:
+            return
+        matriz = np.array([tuple(linha) for linha in linhas], dtype=np.float64)
+        yield matriz[:, 0].astype(np.int64), matriz[:, 1:]
+        ultimo_id = linhas[-1][0]
+
+def _quadro_rfm(dados):
+    """
+    Lote de _lotes_rfm como DataFrame com as colunas RFM: o scaler é ajustado
+    e usado sempre com os nomes das colunas, como nos modelos antigos.
+    """
+    import pandas as pd
+    return pd.DataFrame(dados, columns=COLUNAS_RFM, copy=False)
 
-def treinar_e_salvar_modelo(df_rfm):
+def treinar_modelos(sessao=None, tamanho_lote=TAMANHO_LOTE_TREINO, epocas=EPOCAS_TREINO,
+                    pasta=PASTA_MODELOS, ativar=True):
     """
-    Recebe o DataFrame RFM, treina o modelo K-Means e salva
-    o modelo e o normalizador (scaler) em arquivos .pkl.
+    Treina o scaler e o MiniBatchKMeans em lotes sobre cliente_rfm e grava
+    uma versão nova em 'pasta'. Com 'ativar', a versão passa a ser a atual
+    e o segmento de todos os clientes é recalculado (atualizar_segmentos).
+    Retorna os metadados da versão, ou None se houver menos clientes com
+    compras do que clusters.
     """
-    if df_rfm is None or df_rfm.empty:
-        print("DataFrame RFM está vazio. Não é possível treinar.")
-        return False
-        
-    print("Iniciando treinamento do modelo...")
+    import numpy as np
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.preprocessing import StandardScaler
 
-    df_dados_cluster = df_rfm[['recencia', 'frequencia', 'monetario']]
+    sessao = sessao_padrao(sessao)
+    tamanho_lote = max(tamanho_lote, N_CLUSTERS) # O primeiro lote inicializa os centros
+    agora = datetime.now() # Mesma data de referência em todas as passadas
+    inicio = time.perf_counter()
 
     scaler = StandardScaler()
-    dados_normalizados = scaler.fit_transform(df_dados_cluster)
-
-    kmeans = KMeans(n_clusters=N_CLUSTERS, n_init=10, random_state=42)
-    kmeans.fit(dados_normalizados)
-
-    joblib.dump(kmeans, MODELO_CLUSTER_PATH)
-    print(f"Modelo K-Means salvo em: {MODELO_CLUSTER_PATH}")
-    joblib.dump(scaler, MODELO_SCALER_PATH)
-    print(f"Modelo Scaler salvo em: {MODELO_SCALER_PATH}")
-    
-    print("\n--- Interpretação dos Clusters ---")
-    centros_originais = scaler.inverse_transform(kmeans.cluster_centers_)
-    df_centros = pd.DataFrame(centros_originais, columns=['Recência Média', 'Frequência Média', 'Valor Monetário Médio'])
-    print(df_centros)
-    print("\nLembre-se:")
-    print(" -> 'Bom Comprador': Baixa Recência, Alta Frequência, Alto Valor")
-    print(" -> 'Mau Comprador': Alta Recência, Baixa Frequência, Baixo Valor")
-
-    return True
-
-if __name__ == "__main__":
-    print("Executando o script de treinamento de classificação de clientes...")
-    from app import app
-    
-    app_context = app.app_context()
-    
-    rfm = calcular_rfm(app_context)
-    
-    if rfm is not None:
-        treinar_e_salvar_modelo(rfm)
-        print("\nTreinamento concluído com sucesso!")
-    else:
-        print("\nTreinamento falhou. Verifique se há dados de vendas no banco.")
+    linhas = 0
+    for _, dados in _lotes_rfm(sessao, agora, tamanho_lote):
+        scaler.partial_fit(_quadro_rfm(dados))
+        linhas += len(dados)
+    if linhas < N_CLUSTERS:
+        return None
+
+    kmeans = MiniBatchKMeans(n_clusters=N_CLUSTERS, random_state=42, n_init=3)
+    for _ in range(epocas):
+        for _, dados in _lotes_rfm(sessao, agora, tamanho_lote):
+            kmeans.partial_fit(scaler.transform(_quadro_rfm(dados)))
+
+    inercia = 0.0
+    tamanhos = np.zeros(N_CLUSTERS, dtype=np.int64)
+    for _, dados in _lotes_rfm(sessao, agora, tamanho_lote):
+        normalizados = scaler.transform(_quadro_rfm(dados))
+        inercia -= kmeans.score(normalizados)
+        tamanhos += np.bincount(kmeans.predict(normalizados), minlength=N_CLUSTERS)
+
+    centros = scaler.inverse_transform(kmeans.cluster_centers_)
+    metadados = {
+        'criado_em': datetime.utcnow().isoformat(timespec='seconds'),
+        'referencia_recencia': agora.isoformat(timespec='seconds'),
+        'linhas': linhas,
+        'n_clusters': N_CLUSTERS,
+        'epocas': epocas,
+        'tamanho_lote': tamanho_lote,
+        'inercia': float(inercia),
+        'segundos_treino': round(time.perf_counter() - inicio, 3),
+        'colunas': COLUNAS_RFM,
+        'centros': [dict(zip(COLUNAS_RFM, map(float, centro))) for centro in centros],
+        'tamanhos_clusters': tamanhos.tolist(),
+        'rotulos': rotulos_clusters(centros.tolist()),
+    }
+    metadados['versao'] = salvar_versao_modelos(kmeans, scaler, metadados, pasta, ativar)
+    if ativar:
+        metadados['segmentos'] = atualizar_segmentos(kmeans, scaler, sessao, tamanho_lote)
+    return metadados
+
+def salvar_versao_modelos(kmeans, scaler, metadados, pasta=PASTA_MODELOS, ativar=True):
+    """
+    Grava os modelos e os metadados numa pasta nova (nome = data/hora UTC)
+    e, com 'ativar', troca o ponteiro ATUAL. Retorna o nome da versão.
+    """
+    import joblib
+
+    versao = datetime.utcnow().strftime('%Y%m%d-%H%M%S-%f')
+    destino = os.path.join(pasta, versao)
+    temporaria = f"{destino}.{os.getpid()}.tmp"
+    os.makedirs(temporaria)
+    joblib.dump({'kmeans': kmeans, 'scaler': scaler}, os.path.join(temporaria, 'modelos.joblib'))
+    with open(os.path.join(temporaria, 'metadados.json'), 'w', encoding='utf-8') as arquivo:
+        json.dump(dict(metadados, versao=versao), arquivo, ensure_ascii=False, indent=2)
+    os.replace(temporaria, destino) # A versão só aparece completa
+
+    if ativar:
+        ativar_versao(versao, pasta)
+    return versao
+
+def ativar_versao(versao, pasta=PASTA_MODELOS):
+    """Aponta ATUAL para 'versao' (troca atômica); também serve para voltar a uma versão anterior."""
+    if not os.path.exists(os.path.join(pasta, versao, 'modelos.joblib')):
+        raise ValueError(f"Versão de modelos não encontrada: {versao}")
+    ponteiro = os.path.join(pasta, 'ATUAL')
+    temporario = f"{ponteiro}.{os.getpid()}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        arquivo.write(versao)
+    os.replace(temporario, ponteiro)
+
+def versao_atual(pasta=PASTA_MODELOS):
+    """Nome da versão apontada por ATUAL, ou None se nenhum treino foi ativado."""
+    try:
+        with open(os.path.join(pasta, 'ATUAL'), encoding='utf-8') as arquivo:
+            return arquivo.read().strip() or None
+    except OSError:
+        return None
+
+def listar_versoes(pasta=PASTA_MODELOS):
+    """Metadados de todas as versões gravadas, da mais antiga para a mais nova."""
+    if not os.path.isdir(pasta):
+        return []
+    versoes = []
+    for nome in sorted(os.listdir(pasta)):
+        try:
+            with open(os.path.join(pasta, nome, 'metadados.json'), encoding='utf-8') as arquivo:
+                versoes.append(json.load(arquivo))
+        except (OSError, ValueError):
+            continue # Ponteiro, pasta temporária ou versão incompleta
+    return versoes
+
+def remover_versoes_antigas(manter=VERSOES_MANTIDAS, pasta=PASTA_MODELOS):
+    """Apaga as versões mais antigas, mantendo as 'manter' mais novas e a atual. Retorna as apagadas."""
+    atual = versao_atual(pasta)
+    versoes = [metadados['versao'] for metadados in listar_versoes(pasta)]
+    removidas = [versao for versao in versoes[:max(len(versoes) - manter, 0)] if versao != atual]
+    for versao in removidas:
+        shutil.rmtree(os.path.join(pasta, versao), ignore_errors=True)
+    return removidas
 
 # ==========================================================
 # Código de Previsão
 # ==========================================================
-import os
 
-MAPA_CLUSTER_NOMES = {
-    0: 'Em Risco',
-    1: 'Fiel',
-    2: 'Alto Valor'
-}
+# Os ids de cluster do K-Means são arbitrários e mudam a cada treino: o nome
+# de cada cluster sai dos centros (rotulos_clusters), não do id.
+SEGMENTOS = ['Em Risco', 'Fiel', 'Alto Valor', 'Novo']
 
-MAPA_CLUSTER_CORES = {
-    0: '#dc3545',  # Vermelho (Danger)
-    1: '#198754',  # Verde (Success)
-    2: '#0d6efd'   # Azul (Primary)
+CORES_SEGMENTOS = {
+    'Em Risco': '#dc3545',  # Vermelho (Danger)
+    'Fiel': '#198754',  # Verde (Success)
+    'Alto Valor': '#0d6efd',  # Azul (Primary)
 }
+COR_PADRAO = '#6c757d' # Cinza ('Novo' e 'Indefinido')
+
+def rotulos_clusters(centros):
+    """
+    Nome de cada cluster a partir dos centros (em unidades originais, colunas
+    COLUNAS_RFM): o de maior recência é 'Em Risco'; dos outros, o de maior
+    valor monetário é 'Alto Valor' e o resto é 'Fiel'. Lista com um nome
+    por cluster, na ordem dos ids do K-Means.
+    """
+    recencias = [centro[0] for centro in centros]
+    em_risco = recencias.index(max(recencias))
+    rotulos = ['Fiel'] * len(centros)
+    rotulos[em_risco] = 'Em Risco'
+    outros = [i for i in range(len(centros)) if i != em_risco]
+    if outros:
+        rotulos[max(outros, key=lambda i: centros[i][2])] = 'Alto Valor'
+    return rotulos
+
+def rotulos_modelos(kmeans_model, scaler_model):
+    """rotulos_clusters dos centros do modelo (o treino grava o mesmo resultado nos metadados)."""
+    return rotulos_clusters(scaler_model.inverse_transform(kmeans_model.cluster_centers_).tolist())
+
+def classificacao(nome):
+    """{'nome', 'cor'} de um segmento, como as rotas e os templates usam."""
+    return {'nome': nome, 'cor': CORES_SEGMENTOS.get(nome, COR_PADRAO)}
+
+def carregar_modelos(pasta=PASTA_MODELOS):
+    """
+    Carrega (kmeans, scaler) da versão atual (ponteiro ATUAL em 'pasta');
+    sem versão ativada, dos arquivos .pkl antigos. (None, None) se não houver modelos.
+    """
+    import joblib
+
+    versao = versao_atual(pasta)
+    if versao is not None:
+        try:
+            modelos = joblib.load(os.path.join(pasta, versao, 'modelos.joblib'))
+            print(f"Modelos de classificação carregados (versão {versao}).")
+            return modelos['kmeans'], modelos['scaler']
+        except Exception as e:
+            print(f"Erro ao carregar modelos da versão {versao}: {e}")
+            return None, None
 
-def carregar_modelos():
     if not os.path.exists(MODELO_CLUSTER_PATH) or not os.path.exists(MODELO_SCALER_PATH):
-        print("ERRO: Arquivos de modelo (.pkl) não encontrados.")
-        print("Execute `python classification_engine.py` primeiro para treinar.")
+        print("ERRO: Modelos de classificação não encontrados.")
+        print("Execute `flask treinar-classificacao` primeiro para treinar.")
         return None, None
         
     try:
@@ -121,27 +316,109 @@ def carregar_modelos():
         print(f"Erro ao carregar modelos: {e}")
         return None, None
 
-def calcular_rfm_cliente_unico(cliente_id):
+def _marca_ponteiro(pasta=PASTA_MODELOS):
+    """Muda quando o ponteiro ATUAL é trocado (novo treino ou ativar_versao)."""
+    try:
+        return os.stat(os.path.join(pasta, 'ATUAL')).st_mtime_ns
+    except OSError:
+        return None
+
+class ModelosClassificacao:
+    """
+    Carrega os modelos só na primeira classificação, e uma única vez mesmo
+    com várias threads pedindo ao mesmo tempo. Guarda também a falha
+    (None, None), para não tentar ler os arquivos a cada requisição.
+    A cada leitura confere o ponteiro ATUAL (um stat): quando um treino
+    ativa uma versão nova, os workers a carregam sem reiniciar.
+    """
+    def __init__(self, pasta=PASTA_MODELOS):
+        self.pasta = pasta
+        self._lock = threading.Lock()
+        self._carregados = None # (marca do ponteiro, (kmeans, scaler))
+
+    def obter(self):
+        """Retorna (kmeans, scaler); (None, None) se os modelos não existirem."""
+        marca = _marca_ponteiro(self.pasta)
+        carregados = self._carregados
+        if carregados is None or carregados[0] != marca:
+            with self._lock:
+                if self._carregados is None or self._carregados[0] != marca:
+                    self._carregados = (marca, carregar_modelos(self.pasta))
+                carregados = self._carregados
+        return carregados[1]
+
+    def recarregar(self):
+        """Descarta os modelos carregados; a próxima classificação lê os arquivos de novo."""
+        with self._lock:
+            self._carregados = None
+
+modelos_classificacao = ModelosClassificacao()
+
+# ==========================================================
+# Agregado RFM (tabela cliente_rfm)
+# ==========================================================
+
+def atualizar_rfm_cliente(cliente_id, valor_total, data_venda, sessao=None):
+    """
+    Soma um pedido (uma compra, com todos os seus itens) ao agregado RFM do
+    cliente, usando a sessão informada (ou db.session). A frequência conta
+    pedidos, não itens. Não faz commit: deve rodar na mesma transação que
+    grava o pedido.
+    """
+    sessao = sessao_padrao(sessao)
+    resultado = sessao.execute(
+        db.update(ClienteRFM)
+        .where(ClienteRFM.cliente_id == cliente_id)
+        .values(
+            total_compras=ClienteRFM.total_compras + 1,
+            total_gasto=ClienteRFM.total_gasto + valor_total,
+            ultima_compra=db.case(
+                (ClienteRFM.ultima_compra < data_venda, data_venda),
+                else_=ClienteRFM.ultima_compra
+            )
+        )
+    )
+
+    if resultado.rowcount == 0:
+        sessao.add(ClienteRFM(
+            cliente_id=cliente_id,
+            ultima_compra=data_venda,
+            total_compras=1,
+            total_gasto=valor_total
+        ))
+
+def reconstruir_rfm_clientes(sessao=None):
+    """
+    Recria a tabela cliente_rfm do zero com uma única agregação sobre 'pedido'
+    e faz commit. Retorna o número de clientes gravados.
+    """
+    sessao = sessao_padrao(sessao)
+    sessao.execute(db.text("DELETE FROM cliente_rfm"))
+    sessao.execute(db.text("""
+        INSERT INTO cliente_rfm (cliente_id, ultima_compra, total_compras, total_gasto)
+        SELECT cliente_id, MAX(data_pedido), COUNT(*), SUM(valor_total)
+        FROM pedido
+        WHERE cliente_id IS NOT NULL
+        GROUP BY cliente_id
+    """))
+    sessao.commit()
+    return sessao.execute(db.text("SELECT COUNT(*) FROM cliente_rfm")).scalar()
+
+def calcular_rfm_cliente_unico(cliente_id, sessao=None):
     """
     Calcula o RFM para um ÚNICO cliente.
     Retorna um DataFrame com uma linha ou None se não houver vendas.
     """
-    from app import app, db
+    import pandas as pd
 
-    with app.app_context():
-        query = db.text("""
-            SELECT data_venda, valor_total 
-            FROM venda 
-            WHERE cliente_id = :cid
-        """)
-        df_vendas = pd.read_sql(query, db.engine, params={'cid': cliente_id}, parse_dates=['data_venda'])
+    rfm = sessao_padrao(sessao).get(ClienteRFM, cliente_id)
 
-    if df_vendas.empty:
+    if rfm is None:
         return None # Cliente não tem compras
 
-    recencia = (datetime.now() - df_vendas['data_venda'].max()).days
-    frequencia = len(df_vendas)
-    monetario = df_vendas['valor_total'].sum()
+    recencia = (datetime.now() - rfm.ultima_compra).days
+    frequencia = rfm.total_compras
+    monetario = rfm.total_gasto
 
     df_rfm_cliente = pd.DataFrame({
         'recencia': [recencia],
@@ -151,27 +428,167 @@ def calcular_rfm_cliente_unico(cliente_id):
     
     return df_rfm_cliente
 
-def classificar_cliente(cliente_id, kmeans_model, scaler_model):
+def calcular_rfm_clientes(cliente_ids=None, sessao=None):
     """
-    Classifica um único cliente usando os modelos carregados.
-    Retorna um dicionário com o nome e a cor da classificação.
+    Calcula o RFM de VÁRIOS clientes com uma única consulta na tabela cliente_rfm.
+    Se 'cliente_ids' for None, calcula para todos os clientes com vendas.
+    Retorna um DataFrame indexado por cliente_id; clientes sem compras não aparecem.
+    """
+    import pandas as pd
+
+    colunas = ['recencia', 'frequencia', 'monetario']
+    if cliente_ids is not None and len(cliente_ids) == 0:
+        return pd.DataFrame(columns=colunas)
+
+    sql = """
+        SELECT cliente_id,
+               ultima_compra,
+               total_compras AS frequencia,
+               total_gasto AS monetario
+        FROM cliente_rfm
+    """
+    params = {}
+    if cliente_ids is not None:
+        sql += " WHERE cliente_id IN :ids"
+        params['ids'] = list(cliente_ids)
+
+    query = db.text(sql)
+    if cliente_ids is not None:
+        query = query.bindparams(db.bindparam('ids', expanding=True))
+
+    df_rfm = pd.read_sql(query, sessao_padrao(sessao).connection(), params=params, parse_dates=['ultima_compra'])
+
+    df_rfm['recencia'] = (datetime.now() - df_rfm['ultima_compra']).dt.days
+    return df_rfm.set_index('cliente_id')[colunas]
+
+@cronometrado('classificacao')
+def classificar_clientes(cliente_ids, kmeans_model, scaler_model, sessao=None):
+    """
+    Classifica vários clientes de uma vez: uma consulta RFM e uma
+    única chamada de transform/predict sobre a matriz inteira.
+    Retorna um dicionário {cliente_id: {'nome': ..., 'cor': ...}}.
+    Se 'cliente_ids' for None, classifica todos os clientes com vendas.
     """
     if kmeans_model is None or scaler_model is None:
-        return { 'nome': 'Indefinido', 'cor': '#6c757d' } # Cinza
+        ids = cliente_ids if cliente_ids is not None else []
+        return {cid: classificacao('Indefinido') for cid in ids}
 
-    df_rfm = calcular_rfm_cliente_unico(cliente_id)
+    df_rfm = calcular_rfm_clientes(cliente_ids, sessao)
 
-    if df_rfm is None:
-        return { 'nome': 'Novo', 'cor': '#6c757d' } # Cinza
+    classificacoes = {}
+    if not df_rfm.empty:
+        rotulos = rotulos_modelos(kmeans_model, scaler_model)
+        dados_normalizados = scaler_model.transform(df_rfm)
+        clusters_preditos = kmeans_model.predict(dados_normalizados)
 
-    dados_normalizados = scaler_model.transform(df_rfm)
+        for cid, cluster_predito in zip(df_rfm.index, clusters_preditos):
+            classificacoes[int(cid)] = classificacao(rotulos[cluster_predito])
 
-    cluster_predito = kmeans_model.predict(dados_normalizados)[0]
+    # Clientes sem compras não têm linha em cliente_rfm
+    for cid in (cliente_ids or []):
+        classificacoes.setdefault(cid, classificacao('Novo'))
 
-    nome_classificacao = MAPA_CLUSTER_NOMES.get(cluster_predito, 'Indefinido')
-    cor_classificacao = MAPA_CLUSTER_CORES.get(cluster_predito, '#6c757d')
+    return classificacoes
 
-    return {
-        'nome': nome_classificacao,
-        'cor': cor_classificacao
-    }
\ No newline at end of file
+def classificar_cliente(cliente_id, kmeans_model, scaler_model, sessao=None):
+    """
+    Classifica um único cliente usando os modelos carregados.
+    Retorna um dicionário com o nome e a cor da classificação.
+    """
+    return classificar_clientes([cliente_id], kmeans_model, scaler_model, sessao)[cliente_id]
+
+# ==========================================================
+# Segmento gravado por cliente (coluna cliente.segmento)
+# ==========================================================
+# Calculado para todos os clientes a cada treino ativado (ou com
+# `flask atualizar-segmentos`): listagens e campanhas filtram por segmento
+# com uma consulta no índice (segmento, id), sem prever nada na hora.
+
+def atualizar_segmentos(kmeans_model, scaler_model, sessao=None, tamanho_lote=TAMANHO_LOTE_TREINO):
+    """
+    Grava o segmento de todos os clientes: lê cliente_rfm em lotes, prevê o
+    lote inteiro e grava com um UPDATE em lote e um commit por lote. Clientes
+    sem compras ficam 'Novo'. Retorna {segmento: número de clientes}.
+    """
+    sessao = sessao_padrao(sessao)
+    rotulos = rotulos_modelos(kmeans_model, scaler_model)
+    agora = datetime.now()
+    contagem = Counter()
+
+    for ids, dados in _lotes_rfm(sessao, agora, max(tamanho_lote, 1)):
+        clusters = kmeans_model.predict(scaler_model.transform(_quadro_rfm(dados)))
+        frequencias = dados[:, COLUNAS_RFM.index('frequencia')]
+        linhas = [
+            {'id': int(cid), 'segmento': rotulos[cluster], 'total_compras': int(frequencia)}
+            for cid, cluster, frequencia in zip(ids, clusters, frequencias)
+        ]
+        # Só grava se o cliente não comprou desde a leitura do lote: a compra
+        # já gravou o segmento calculado com o RFM novo (reclassificar_cliente)
+        sessao.execute(db.text("""
+            UPDATE cliente SET segmento = :segmento
+            WHERE id = :id
+              AND (SELECT total_compras FROM cliente_rfm WHERE cliente_id = :id) = :total_compras
+        """), linhas)
+        sessao.commit()
+        contagem.update(linha['segmento'] for linha in linhas)
+
+    novos = sessao.execute(
+        db.update(Cliente)
+        .where(Cliente.id.not_in(db.select(ClienteRFM.cliente_id)))
+        .values(segmento='Novo')
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    sessao.commit()
+    contagem['Novo'] += novos
+    return dict(contagem)
+
+def reclassificar_cliente(cliente_id, sessao=None):
+    """
+    Segmento do cliente agora, pelos modelos carregados e pelo cliente_rfm
+    lido na sessão (inclui o pedido ainda não commitado). None sem modelos.
+    Usado pelo registro do pedido para gravar o segmento na mesma transação:
+    lê uma linha com a mesma recência do treino, sem pandas.read_sql.
+    """
+    import numpy as np
+
+    kmeans_model, scaler_model = modelos_classificacao.obter()
+    if kmeans_model is None or scaler_model is None:
+        return None
+    sessao = sessao_padrao(sessao)
+    sessao.flush() # Na primeira compra o ClienteRFM ainda está só na sessão
+    query = db.text(f"""
+        SELECT {_expressao_recencia(sessao.get_bind().dialect.name)}, total_compras, total_gasto
+        FROM cliente_rfm
+        WHERE cliente_id = :cliente
+    """).bindparams(db.bindparam('agora', type_=db.DateTime))
+    linha = sessao.execute(query, {'agora': datetime.now(), 'cliente': cliente_id}).first()
+    if linha is None:
+        return 'Novo'
+    dados = np.array([tuple(linha)], dtype=np.float64)
+    cluster = kmeans_model.predict(scaler_model.transform(_quadro_rfm(dados)))[0]
+    return rotulos_modelos(kmeans_model, scaler_model)[cluster]
+
+def classificacoes_clientes(clientes, sessao=None):
+    """
+    {cliente_id: {'nome', 'cor'}} de uma lista de Clientes: usa o segmento
+    gravado; só os clientes ainda sem segmento (cadastrados depois do último
+    cálculo, ou sem modelos quando compraram) são classificados na hora.
+    """
+    classificacoes = {cliente.id: classificacao(cliente.segmento) for cliente in clientes if cliente.segmento}
+    sem_segmento = [cliente.id for cliente in clientes if not cliente.segmento]
+    if sem_segmento:
+        kmeans_model, scaler_model = modelos_classificacao.obter()
+        classificacoes.update(classificar_clientes(sem_segmento, kmeans_model, scaler_model, sessao))
+    return classificacoes
+
+if __name__ == "__main__":
+    # Mesmo treino do `flask treinar-classificacao`, sem app Flask
+    from sqlalchemy.orm import Session
+    from models import criar_engine
+
+    with Session(criar_engine()) as sessao:
+        metadados = treinar_modelos(sessao)
+    if metadados is None:
+        print("Treinamento falhou. Verifique se há dados de vendas no banco.")
+    else:
+        print(f"Versão {metadados['versao']} ativada: {metadados['linhas']} clientes, inércia {metadados['inercia']:.1f}.")
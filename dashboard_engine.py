@@ -0,0 +1,261 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+from models import db, sessao_padrao, Pedido, Venda, PorBanco
+from instrumentation import cronometrado
+
+_lock_bibliotecas = threading.Lock()
+_bibliotecas = None
+
+def _bibliotecas_graficos():
+    """
+    (pandas, Figure, seaborn), importados só quando um gráfico é gerado de
+    fato: páginas servidas do cache e o início do app não pagam por eles.
+    """
+    global _bibliotecas
+    if _bibliotecas is None:
+        with _lock_bibliotecas:
+            if _bibliotecas is None:
+                import matplotlib
+                matplotlib.use('Agg')
+                from matplotlib.figure import Figure
+                import seaborn as sns
+                import pandas as pd
+                # O tema é global no matplotlib: aplica uma vez só
+                sns.set_theme(style="whitegrid")
+                _bibliotecas = (pd, Figure, sns)
+    return _bibliotecas
+
+def versao_vendas(sessao=None):
+    """
+    "Versão" atual das vendas: o maior id da tabela 'venda' (consulta pela
+    chave primária, não varre a tabela). Muda sempre que entra uma venda nova.
+    Retorna None se ainda não houver vendas.
+    """
+    return sessao_padrao(sessao).query(db.func.max(Venda.id)).scalar()
+
+def _figura_para_png(figura):
+    img = io.BytesIO()
+    figura.savefig(img, format='png')
+    return img.getvalue()
+
+# ==========================================================
+# Receita por período (agregada no banco)
+# ==========================================================
+PERIODOS_DIAS = {'30': 30, '90': 90, '365': 365}
+PERIODO_PADRAO = '30'
+
+# Até quantos dias cada granularidade é usada; acima disso, agrupa por mês
+LIMITE_DIARIO = 45
+LIMITE_SEMANAL = 180
+
+FORMATOS_ROTULO = {'dia': '%d/%m/%Y', 'semana': '%d/%m/%Y', 'mes': '%m/%Y'}
+TITULOS_GRANULARIDADE = {'dia': 'Dia', 'semana': 'Semana', 'mes': 'Mês'}
+
+class Periodo:
+    """
+    Janela de datas [inicio, fim) usada no gráfico e na API de receita.
+    'nome' é '30', '90', '365' ou 'personalizado'.
+    """
+    def __init__(self, nome, inicio, fim, granularidade=None):
+        self.nome = nome
+        self.inicio = inicio
+        self.fim = fim
+        self.granularidade = granularidade or self._granularidade_automatica()
+
+    def _granularidade_automatica(self):
+        dias = (self.fim - self.inicio).days
+        if dias <= LIMITE_DIARIO:
+            return 'dia'
+        if dias <= LIMITE_SEMANAL:
+            return 'semana'
+        return 'mes'
+
+    @property
+    def chave(self):
+        return (self.nome, self.inicio, self.fim, self.granularidade)
+
+    def parametros(self):
+        """Parâmetros de URL que reproduzem este período."""
+        if self.nome != 'personalizado':
+            return {'periodo': self.nome}
+        return {
+            'periodo': 'personalizado',
+            'inicio': self.inicio.strftime('%Y-%m-%d'),
+            'fim': (self.fim - timedelta(days=1)).strftime('%Y-%m-%d')
+        }
+
+def resolver_periodo(args):
+    """
+    Monta o Periodo a partir dos parâmetros da requisição:
+    ?periodo=30|90|365 ou ?periodo=personalizado&inicio=AAAA-MM-DD&fim=AAAA-MM-DD
+    (fim incluído) e, opcionalmente, ?granularidade=dia|semana|mes.
+    Levanta ValueError para datas ou valores inválidos.
+    """
+    nome = args.get('periodo', PERIODO_PADRAO)
+    granularidade = args.get('granularidade') or None
+    if granularidade is not None and granularidade not in FORMATOS_ROTULO:
+        raise ValueError(f"Granularidade inválida: {granularidade}")
+
+    if nome == 'personalizado':
+        inicio = datetime.strptime(args['inicio'], '%Y-%m-%d')
+        fim = datetime.strptime(args['fim'], '%Y-%m-%d') + timedelta(days=1)
+        if fim <= inicio:
+            raise ValueError("A data final deve ser igual ou posterior à inicial.")
+        return Periodo(nome, inicio, fim, granularidade)
+
+    if nome not in PERIODOS_DIAS:
+        raise ValueError(f"Período inválido: {nome}")
+    # As vendas são gravadas em UTC; a janela inclui o dia de hoje
+    amanha = datetime.combine(datetime.utcnow().date(), time.min) + timedelta(days=1)
+    return Periodo(nome, amanha - timedelta(days=PERIODOS_DIAS[nome]), amanha, granularidade)
+
+def _expressao_agrupamento(granularidade, dialeto):
+    """Expressão SQL que leva 'data_pedido' para o início do dia, semana ou mês."""
+    coluna = Pedido.data_pedido
+    if dialeto == 'postgresql':
+        unidade = {'dia': 'day', 'semana': 'week', 'mes': 'month'}[granularidade]
+        return db.cast(db.func.date_trunc(unidade, coluna), db.Date)
+    # SQLite: datas são texto ISO
+    if granularidade == 'semana':
+        return db.func.date(coluna, 'weekday 0', '-6 days') # Segunda-feira da semana
+    if granularidade == 'mes':
+        return db.func.strftime('%Y-%m-01', coluna)
+    return db.func.date(coluna)
+
+def receita_por_periodo(periodo, sessao=None):
+    """
+    Soma a receita e conta as vendas (pedidos) por dia/semana/mês dentro da
+    janela, com GROUP BY no banco: só a série agregada chega ao Python.
+    Retorna uma lista de dicionários {'periodo': 'AAAA-MM-DD', 'receita', 'vendas'}.
+    """
+    sessao = sessao_padrao(sessao)
+    agrupamento = _expressao_agrupamento(periodo.granularidade, sessao.get_bind().dialect.name).label('periodo')
+    resultados = sessao.query(
+        agrupamento,
+        db.func.sum(Pedido.valor_total),
+        db.func.count(Pedido.id)
+    ).filter(
+        Pedido.data_pedido >= periodo.inicio,
+        Pedido.data_pedido < periodo.fim
+    ).group_by(agrupamento).order_by(agrupamento).all()
+
+    return [
+        {'periodo': str(inicio_bucket), 'receita': float(receita), 'vendas': int(vendas)}
+        for inicio_bucket, receita, vendas in resultados
+    ]
+
+@cronometrado('grafico_vendas')
+def gerar_grafico_vendas(periodo, sessao=None):
+    serie = receita_por_periodo(periodo, sessao)
+
+    if not serie:
+        return None
+
+    pd, Figure, sns = _bibliotecas_graficos()
+    df_agrupado = pd.DataFrame(serie)
+    df_agrupado['data'] = pd.to_datetime(df_agrupado['periodo']).dt.strftime(FORMATOS_ROTULO[periodo.granularidade])
+
+    # Figure em vez de pyplot: não usa o estado global do plt, que não é thread-safe
+    figura = Figure(figsize=(10, 5))
+    ax = figura.subplots()
+
+    cores = sns.color_palette("blend:#007bff,#e83e8c", n_colors=len(df_agrupado))
+
+    sns.barplot(x='data', y='receita', data=df_agrupado, hue='data', palette=cores, legend=False, ax=ax)
+    ax.set_title(f'Receita de Vendas por {TITULOS_GRANULARIDADE[periodo.granularidade]}', color='#333333')
+    ax.set_xlabel('Data')
+    ax.set_ylabel('Total (R$)')
+    ax.tick_params(axis='x', rotation=45)
+    figura.tight_layout()
+
+    return _figura_para_png(figura)
+
+@cronometrado('grafico_produtos')
+def gerar_grafico_produtos_top(periodo=None, sessao=None):
+    """Top 5 produtos por receita no período (ou em todas as vendas, sem período)."""
+    from sales_engine import mais_vendidos
+
+    if periodo is None:
+        resultados = mais_vendidos(5, por='receita', sessao=sessao)
+    else:
+        resultados = mais_vendidos(5, inicio=periodo.inicio.date(), fim=periodo.fim.date(), por='receita', sessao=sessao)
+
+    if not resultados:
+        return None
+
+    pd, Figure, sns = _bibliotecas_graficos()
+    df = pd.DataFrame([(produto.nome, total) for produto, total in resultados], columns=['produto', 'total'])
+
+    figura = Figure(figsize=(8, 5))
+    ax = figura.subplots()
+
+    cores = sns.color_palette("blend:#e83e8c,#007bff", n_colors=len(df))
+
+    sns.barplot(x='total', y='produto', data=df, hue='produto', palette=cores, legend=False, orient='h', ax=ax)
+    ax.set_title('Top 5 Produtos por Receita', color='#333333')
+    ax.set_xlabel('Receita Total (R$)')
+    ax.set_ylabel('')
+    figura.tight_layout()
+
+    return _figura_para_png(figura)
+
+GERADORES_GRAFICOS = {
+    'vendas': gerar_grafico_vendas,
+    'produtos': gerar_grafico_produtos_top,
+}
+
+class GraficoRenderizado:
+    def __init__(self, versao, png, gerado_em):
+        self.versao = versao
+        self.png = png
+        self.gerado_em = gerado_em
+        # ETag pelo conteúdo: muda se o desenho mudar, mesmo com a mesma versão
+        self.etag = hashlib.sha1(png).hexdigest() if png else None
+
+class CacheGraficos:
+    """
+    Guarda o PNG de cada gráfico (por nome e período) junto com a versão das
+    vendas usada para gerá-lo. O gráfico só é desenhado de novo quando entram
+    vendas novas (ou após invalidar()). Um lock garante um desenho por vez no
+    processo. Mantém no máximo 'limite' gráficos, descartando os mais antigos.
+    """
+    def __init__(self, limite=32):
+        self._lock = threading.Lock()
+        self._graficos = OrderedDict()
+        self.limite = limite
+
+    def invalidar(self):
+        with self._lock:
+            self._graficos.clear()
+
+    def obter(self, nome, periodo, sessao):
+        versao = versao_vendas(sessao)
+        chave = (nome, periodo.chave)
+        with self._lock:
+            grafico = self._graficos.get(chave)
+            if grafico is None or grafico.versao != versao:
+                png = GERADORES_GRAFICOS[nome](periodo, sessao) if versao is not None else None
+                grafico = GraficoRenderizado(versao, png, datetime.utcnow().replace(microsecond=0))
+                self._graficos[chave] = grafico
+            self._graficos.move_to_end(chave)
+            while len(self._graficos) > self.limite:
+                self._graficos.popitem(last=False)
+            return grafico
+
+_caches_graficos = PorBanco(lambda engine: CacheGraficos())
+
+def obter_grafico(nome, periodo, sessao=None):
+    """
+    Retorna o GraficoRenderizado do cache (desenhando só se as vendas mudaram).
+    'png' é None quando não há dados para o gráfico.
+    """
+    sessao = sessao_padrao(sessao)
+    return _caches_graficos.obter(sessao.get_bind()).obter(nome, periodo, sessao)
+
+def invalidar_graficos():
+    """Descarta os gráficos deste processo (ex.: após renomear ou excluir produtos)."""
+    for cache in _caches_graficos.todos():
+        cache.invalidar()
@@ -0,0 +1,362 @@
+# Fila de saída de emails.
+#
+# As rotas só gravam o email na tabela 'email_saida' (enfileirar_email) e
+# seguem em frente; quem fala com o provedor é o worker, fora da requisição:
+# - por padrão, uma thread em segundo plano no próprio processo, iniciada no
+#   primeiro email enfileirado;
+# - com EMAIL_WORKER=externo, um processo separado: `flask processar-emails --continuo`.
+# O limite de EMAIL_POR_SEGUNDO vale para o banco inteiro, somando todos os
+# processos que enviam (ex.: uma thread em cada worker do gunicorn).
+#
+# Transporte (EMAIL_TRANSPORTE):
+# - sendgrid: API do SendGrid (padrão quando SENDGRID_API_KEY está definida);
+# - arquivo:  grava cada email como .eml em EMAIL_PASTA (padrão sem chave; para testes offline);
+# - smtp:     servidor SMTP em EMAIL_SMTP_HOST:EMAIL_SMTP_PORTA (ex.: um servidor de debug local).
+
+import logging
+import os
+import random
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from sqlalchemy.orm import Session
+from models import db, sessao_padrao, EmailLimite, EmailSaida, PorBanco
+
+logger = logging.getLogger(__name__)
+
+MAX_TENTATIVAS = 6
+ESPERA_INICIAL = timedelta(seconds=30) # dobra a cada falha
+ESPERA_MAXIMA = timedelta(hours=1)
+# Tempo que um email fica reservado para um worker; se o worker morrer no
+# meio do envio, outro pode pegar o email depois disso
+PRAZO_RESERVA = timedelta(minutes=5)
+TAMANHO_LOTE = 50
+INTERVALO_VERIFICACAO = 2 # segundos entre consultas à fila quando ela está vazia
+
+class ErroPermanente(Exception):
+    """Falha que não adianta tentar de novo (ex.: destinatário recusado)."""
+
+######################################
+# Conteúdo
+######################################
+
+def renderizar_email_recomendacao(cliente, produtos, tipo):
+    """
+    Monta o assunto e o HTML do email de recomendação (sem enviar).
+    Usado pelo envio individual (app.py) e pelas campanhas em lote (campaign_engine.py).
+    """
+    html_lista_produtos = "<ul style='list-style-type: none; padding-left: 0;'>"
+    for p in produtos:
+        preco_formatado = f"R$ {p.preco:.2f}".replace('.', ',')
+        html_lista_produtos += f"""
+        <li style='margin-bottom: 15px; border: 1px solid #ddd; padding: 10px; border-radius: 5px;'>
+            <strong style='font-size: 1.1em;'>{p.nome}</strong><br>
+            <span style='color: #333;'>{p.descricao or 'Sem descrição'}</span><br>
+            <span style='font-size: 1.1em; font-weight: bold; color: #0056b3;'>{preco_formatado}</span>
+        </li>
+        """
+    html_lista_produtos += "</ul>"
+
+    if tipo == 'personalizada':
+        titulo = f"Olá, {cliente.nome}! Vimos que você pode gostar destes produtos:"
+        assunto_base = "Temos sugestões especiais para você!"
+    else:
+        titulo = f"Olá, {cliente.nome}! Confira nossos produtos mais populares:"
+        assunto_base = "Confira os mais vendidos da Papelaria Arte & Papel!"
+
+    assunto_completo = f"{assunto_base} - Papelaria Arte & Papel"
+
+    html = f"""
+        <div style='font-family: Arial, sans-serif; line-height: 1.6;'>
+            <h2 style='color: #004a99;'>{titulo}</h2>
+            <p>Aqui estão algumas sugestões que separamos para você:</p>
+            {html_lista_produtos}
+            <p>Esperamos te ver em breve!</p>
+            <hr>
+            <p style='font-size: 0.9em; color: #777;'>
+                Atenciosamente,<br>Equipe Arte & Papel
+            </p>
+        </div>
+        """
+    return assunto_completo, html
+
+######################################
+# Transportes
+######################################
+
+class TransporteSendGrid:
+    """Reaproveita o mesmo cliente da API em todos os envios do processo."""
+    def __init__(self, api_key, remetente):
+        from sendgrid import SendGridAPIClient
+        self.cliente = SendGridAPIClient(api_key)
+        self.remetente = remetente
+
+    def enviar(self, destinatarios, assunto, html):
+        from sendgrid.helpers.mail import Mail as SendGridMail
+        from python_http_client.exceptions import HTTPError
+
+        mensagem = SendGridMail(
+            from_email=self.remetente,
+            to_emails=destinatarios,
+            subject=assunto,
+            html_content=html
+        )
+        try:
+            self.cliente.send(mensagem)
+        except HTTPError as e:
+            # 4xx (menos 429, limite de taxa) é erro no próprio email: não tenta de novo
+            if 400 <= e.status_code < 500 and e.status_code != 429:
+                raise ErroPermanente(f"SendGrid {e.status_code}: {e.body}") from e
+            raise
+
+class TransporteArquivo:
+    """Grava cada email como arquivo .eml numa pasta, em vez de enviar."""
+    def __init__(self, pasta, remetente):
+        self.pasta = pasta
+        self.remetente = remetente or 'papelaria@localhost'
+        os.makedirs(pasta, exist_ok=True)
+
+    def enviar(self, destinatarios, assunto, html):
+        mensagem = _mensagem_mime(self.remetente, destinatarios, assunto, html)
+        nome = f"{datetime.utcnow():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:8]}.eml"
+        with open(os.path.join(self.pasta, nome), 'wb') as arquivo:
+            arquivo.write(bytes(mensagem))
+
+class TransporteSMTP:
+    """Envia por SMTP mantendo uma conexão aberta entre os emails do lote."""
+    def __init__(self, host, porta, remetente):
+        self.host = host
+        self.porta = porta
+        self.remetente = remetente or 'papelaria@localhost'
+        self._conexao = None
+
+    def enviar(self, destinatarios, assunto, html):
+        mensagem = _mensagem_mime(self.remetente, destinatarios, assunto, html)
+        try:
+            if self._conexao is None:
+                self._conexao = smtplib.SMTP(self.host, self.porta, timeout=10)
+            self._conexao.send_message(mensagem)
+        except smtplib.SMTPRecipientsRefused as e:
+            raise ErroPermanente(str(e)) from e
+        except (smtplib.SMTPException, OSError):
+            self._conexao = None # Reconecta no próximo envio
+            raise
+
+def _mensagem_mime(remetente, destinatarios, assunto, html):
+    mensagem = EmailMessage()
+    mensagem['From'] = remetente
+    mensagem['To'] = ', '.join(destinatarios)
+    mensagem['Subject'] = assunto
+    mensagem.set_content(html, subtype='html')
+    return mensagem
+
+def criar_transporte():
+    """Escolhe o transporte pelas variáveis de ambiente (ver topo do arquivo)."""
+    remetente = os.getenv('MAIL_DEFAULT_SENDER')
+    tipo = os.getenv('EMAIL_TRANSPORTE') or ('sendgrid' if os.getenv('SENDGRID_API_KEY') else 'arquivo')
+    if tipo == 'sendgrid':
+        return TransporteSendGrid(os.getenv('SENDGRID_API_KEY'), remetente)
+    if tipo == 'smtp':
+        return TransporteSMTP(os.getenv('EMAIL_SMTP_HOST', 'localhost'), int(os.getenv('EMAIL_SMTP_PORTA', 1025)), remetente)
+    if tipo == 'arquivo':
+        return TransporteArquivo(os.getenv('EMAIL_PASTA', 'emails_enviados'), remetente)
+    raise ValueError(f"EMAIL_TRANSPORTE inválido: {tipo}")
+
+class LimiteTaxa:
+    """
+    Garante no máximo 'por_segundo' envios por segundo somando todos os
+    processos e threads que enviam pelo mesmo banco: cada envio reserva o
+    próximo horário livre na tabela 'email_limite' e espera até ele. Um limite
+    só do processo deixaria N workers do gunicorn enviarem N vezes a taxa.
+    """
+    def __init__(self, por_segundo):
+        self.intervalo = 1.0 / por_segundo if por_segundo > 0 else 0
+        # Uma reserva por vez neste processo: as threads esperam aqui, não no lock do banco
+        self._lock = threading.Lock()
+
+    def aguardar(self, sessao=None):
+        """Reserva um horário de envio (com commit em 'sessao' ou db.session) e espera até ele."""
+        if not self.intervalo:
+            return
+        sessao = sessao_padrao(sessao)
+        with self._lock:
+            # Relógio de parede, não time.monotonic(): o horário é comparado entre processos
+            agora = time.time()
+            proximo = db.case((EmailLimite.proximo_envio > agora, EmailLimite.proximo_envio), else_=agora)
+            sessao.execute(
+                db.update(EmailLimite).where(EmailLimite.id == 1)
+                .values(proximo_envio=proximo + self.intervalo)
+                .execution_options(synchronize_session=False)
+            )
+            # Lido na mesma transação do UPDATE, que segura a linha até o commit
+            horario = sessao.query(EmailLimite.proximo_envio).filter_by(id=1).scalar() - self.intervalo
+            sessao.commit()
+            espera = horario - time.time()
+            if espera > 0:
+                time.sleep(espera)
+
+######################################
+# Fila
+######################################
+
+def enfileirar_email(para_emails, assunto, html_conteudo, sessao=None):
+    """
+    Coloca um email na fila de saída usando 'sessao' (ou db.session). Não faz commit:
+    o email só entra na fila junto com a transação de quem chamou (se ela
+    for desfeita, o email também é). 'para_emails' pode ser um único email
+    (string) ou uma lista de emails.
+    """
+    enfileirar_emails([(para_emails, assunto, html_conteudo)], sessao)
+
+def enfileirar_emails(mensagens, sessao=None):
+    """
+    Versão em lote de enfileirar_email: 'mensagens' é uma lista de
+    (para_emails, assunto, html) gravada com um único insert. Não faz commit.
+    """
+    sessao = sessao_padrao(sessao)
+    agora = datetime.utcnow()
+    linhas = [
+        {
+            'destinatarios': para if isinstance(para, str) else ','.join(para),
+            'assunto': assunto,
+            'html': html,
+            'status': 'pendente',
+            'tentativas': 0,
+            'proxima_tentativa': agora,
+            'criado_em': agora
+        }
+        for para, assunto, html in mensagens
+    ]
+    if linhas:
+        sessao.execute(db.insert(EmailSaida), linhas)
+        acordar_worker(sessao.get_bind())
+
+def _espera_apos_falha(tentativas):
+    espera = min(ESPERA_INICIAL * 2 ** (tentativas - 1), ESPERA_MAXIMA)
+    return espera * random.uniform(0.8, 1.2)
+
+def _reservar_lote(sessao, tamanho):
+    """
+    Reserva para este worker até 'tamanho' emails prontos para envio. Vários
+    workers podem rodar juntos: o UPDATE só pega emails ainda livres, e cada
+    um fica com os que têm a sua marca de reserva.
+    """
+    agora = datetime.utcnow()
+    livre = db.and_(
+        EmailSaida.status.in_(['pendente', 'enviando']), # 'enviando' com prazo vencido: worker morreu
+        EmailSaida.proxima_tentativa <= agora
+    )
+    ids = [id_ for (id_,) in sessao.query(EmailSaida.id).filter(livre).order_by(EmailSaida.id).limit(tamanho)]
+    if not ids:
+        return []
+
+    marca = uuid.uuid4().hex
+    sessao.execute(
+        db.update(EmailSaida)
+        .where(EmailSaida.id.in_(ids), livre)
+        .values(status='enviando', reserva=marca, proxima_tentativa=agora + PRAZO_RESERVA)
+        .execution_options(synchronize_session=False)
+    )
+    sessao.commit()
+    return sessao.query(EmailSaida).filter_by(reserva=marca).order_by(EmailSaida.id).all()
+
+def processar_fila(transporte=None, limite=None, tamanho_lote=TAMANHO_LOTE, sessao=None):
+    """
+    Envia os emails prontos da fila, em lotes, respeitando o limite de taxa.
+    Em caso de falha, o email volta para a fila com espera crescente; depois
+    de MAX_TENTATIVAS (ou em erro permanente) fica com status 'falhou'.
+    Roda até a fila não ter mais emails prontos. Usa 'sessao' (ou db.session).
+    Retorna {'enviados': n, 'falhas': n}.
+    """
+    sessao = sessao_padrao(sessao)
+    transporte = transporte or _envio.transporte()
+    limite = limite or _envio.limite
+    totais = {'enviados': 0, 'falhas': 0}
+
+    while True:
+        lote = _reservar_lote(sessao, tamanho_lote)
+        if not lote:
+            return totais
+
+        for email in lote:
+            limite.aguardar(sessao)
+            try:
+                transporte.enviar(email.destinatarios.split(','), email.assunto, email.html)
+                email.status = 'enviado'
+                email.enviado_em = datetime.utcnow()
+                email.erro = None
+                totais['enviados'] += 1
+            except Exception as e:
+                email.tentativas += 1
+                email.erro = str(e)[:500]
+                if isinstance(e, ErroPermanente) or email.tentativas >= MAX_TENTATIVAS:
+                    email.status = 'falhou'
+                else:
+                    email.status = 'pendente'
+                    email.proxima_tentativa = datetime.utcnow() + _espera_apos_falha(email.tentativas)
+                totais['falhas'] += 1
+                logger.warning(f"Falha ao enviar email {email.id} (tentativa {email.tentativas}): {e}")
+            email.reserva = None
+            # Commit por email: se o processo cair, o que já saiu não é enviado de novo
+            sessao.commit()
+
+class Envio:
+    """
+    Transporte e limite de taxa do processo. O transporte (e a conexão
+    dele) é criado uma vez e reaproveitado em todos os lotes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._transporte = None
+        self.limite = LimiteTaxa(float(os.getenv('EMAIL_POR_SEGUNDO', 5)))
+
+    def transporte(self):
+        with self._lock:
+            if self._transporte is None:
+                self._transporte = criar_transporte()
+            return self._transporte
+
+_envio = Envio()
+
+class WorkerEmails:
+    """
+    Thread em segundo plano que esvazia a fila de um banco. Usa uma sessão
+    própria sobre o engine do banco: não depende do app Flask.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._thread = None
+        self._acordar = threading.Event()
+
+    def acordar(self):
+        """Avisa que há email novo; inicia a thread na primeira vez."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._rodar, name='worker-emails', daemon=True)
+                self._thread.start()
+        self._acordar.set()
+
+    def _rodar(self):
+        while True:
+            # Espera um aviso ou o intervalo: o aviso pode chegar antes do
+            # commit de quem enfileirou, então a fila é consultada de novo depois
+            self._acordar.wait(INTERVALO_VERIFICACAO)
+            self._acordar.clear()
+            try:
+                with Session(self.engine) as sessao:
+                    processar_fila(sessao=sessao)
+            except Exception as e:
+                logger.error(f"Erro no worker de emails: {e}")
+
+# Um worker por banco (várias instâncias do app no mesmo processo podem usar bancos diferentes)
+_workers = PorBanco(WorkerEmails)
+
+def acordar_worker(engine):
+    """Acorda (ou inicia) o worker do banco de 'engine', se EMAIL_WORKER=thread."""
+    if os.getenv('EMAIL_WORKER', 'thread') != 'thread':
+        return
+    _workers.obter(engine).acordar()
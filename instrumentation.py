@@ -0,0 +1,297 @@
+# Instrumentação opcional do app (INSTRUMENTACAO=1), para ver onde vai o tempo
+# de cada requisição:
+# - conta as consultas SQL e o tempo no banco (eventos do SQLAlchemy);
+# - cronometra as etapas pesadas (funções marcadas com @cronometrado:
+#   classificação, recomendação, chatbot, gráficos);
+# - devolve tudo no cabeçalho Server-Timing (aparece na aba Network do navegador);
+# - detector de N+1: avisa no log quando uma requisição roda a mesma consulta
+#   (mesmo formato, com outros parâmetros) mais de INSTRUMENTACAO_LIMITE_REPETICOES vezes;
+# - perfil amostrado: uma fração das requisições (INSTRUMENTACAO_AMOSTRA_PERFIL)
+#   roda com cProfile (ou pyinstrument) e o perfil é gravado em
+#   INSTRUMENTACAO_PASTA_PERFIS/<rota>/;
+# - /metrics: contadores e histogramas do processo no formato de texto do Prometheus.
+#
+# Desligada, sobra só um "if" em cada função cronometrada. As métricas são
+# por processo: com vários workers do gunicorn, cada um responde as suas.
+
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import wraps
+from flask import Response, abort, g, has_request_context, request
+from sqlalchemy import event
+from models import db, PorBanco
+
+logger = logging.getLogger(__name__)
+
+LIMITE_REPETICOES = 10
+PASTA_PERFIS = 'perfis'
+PERFILADORES = ('cprofile', 'pyinstrument')
+# Limites (segundos) dos baldes dos histogramas de /metrics
+BALDES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_ativa = False # Ligada por instalar_instrumentacao
+
+# ==========================================================
+# Medição por requisição
+# ==========================================================
+
+class Medicao:
+    """O que uma requisição gastou: consultas, tempo no banco e etapas cronometradas."""
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.segundos_banco = 0.0
+        self.formas = Counter() # formato da consulta -> vezes
+        self.etapas = {} # etapa -> segundos (somados se ela rodar mais de uma vez)
+        self.inicio_consulta = None
+
+def medicao_atual():
+    """A Medicao da requisição em andamento, ou None (fora de requisição ou sem instrumentação)."""
+    if not _ativa or not has_request_context():
+        return None
+    return g.get('medicao')
+
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS_PARAMETROS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ESPACOS = re.compile(r"\s+")
+
+def forma_consulta(sql):
+    """
+    O formato de uma consulta, sem os valores: literais viram '?' e listas
+    de parâmetros (IN com qualquer número de itens) viram '(?)'. Duas
+    consultas com o mesmo formato só diferem nos parâmetros.
+    """
+    sql = _LITERAIS.sub('?', sql)
+    sql = _LISTAS_PARAMETROS.sub('(?)', sql)
+    return _ESPACOS.sub(' ', sql).strip()
+
+def _antes_consulta(conexao, cursor, sql, parametros, contexto, executemany):
+    medicao = medicao_atual()
+    if medicao is not None:
+        medicao.inicio_consulta = time.perf_counter()
+
+def _depois_consulta(conexao, cursor, sql, parametros, contexto, executemany):
+    medicao = medicao_atual()
+    if medicao is None or medicao.inicio_consulta is None:
+        return
+    medicao.segundos_banco += time.perf_counter() - medicao.inicio_consulta
+    medicao.inicio_consulta = None
+    medicao.consultas += 1
+    medicao.formas[forma_consulta(sql)] += 1
+
+def _ouvir_engine(engine):
+    event.listen(engine, 'before_cursor_execute', _antes_consulta)
+    event.listen(engine, 'after_cursor_execute', _depois_consulta)
+    return engine
+
+# Um par de listeners por engine, mesmo com vários apps no mesmo banco
+_engines_ouvidos = PorBanco(_ouvir_engine)
+
+def cronometrado(etapa):
+    """
+    Decorador: com a instrumentação ligada, mede cada chamada da função como
+    'etapa' (no Server-Timing da requisição e no histograma de /metrics).
+    """
+    def decorador(funcao):
+        @wraps(funcao)
+        def medir(*args, **kwargs):
+            if not _ativa:
+                return funcao(*args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                registrar_etapa(etapa, time.perf_counter() - inicio)
+        return medir
+    return decorador
+
+def registrar_etapa(etapa, segundos):
+    metricas.registrar_etapa(etapa, segundos)
+    medicao = medicao_atual()
+    if medicao is not None:
+        medicao.etapas[etapa] = medicao.etapas.get(etapa, 0.0) + segundos
+
+def server_timing(medicao, segundos_total):
+    """Valor do cabeçalho Server-Timing: banco, etapas e total, em ms."""
+    partes = [f'db;dur={medicao.segundos_banco * 1000:.1f};desc="{medicao.consultas} consultas"']
+    partes += [f'{etapa};dur={segundos * 1000:.1f}' for etapa, segundos in medicao.etapas.items()]
+    partes.append(f'total;dur={segundos_total * 1000:.1f}')
+    return ', '.join(partes)
+
+# ==========================================================
+# Métricas do processo (/metrics)
+# ==========================================================
+
+class Histograma:
+    def __init__(self):
+        self.baldes = [0] * len(BALDES_SEGUNDOS)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, segundos):
+        for i, limite in enumerate(BALDES_SEGUNDOS):
+            if segundos <= limite:
+                self.baldes[i] += 1
+        self.soma += segundos
+        self.total += 1
+
+def _rotulos(**rotulos):
+    def escapar(valor):
+        return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{nome}="{escapar(valor)}"' for nome, valor in rotulos.items()) + '}'
+
+class Metricas:
+    """Contadores e histogramas do processo, no formato de texto do Prometheus."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requisicoes = Counter() # (rota, método, status) -> requisições
+        self.duracoes = {} # rota -> Histograma
+        self.consultas = Counter() # rota -> consultas SQL
+        self.segundos_banco = Counter() # rota -> segundos no banco
+        self.suspeitas_n_mais_um = Counter() # rota -> consultas repetidas acima do limite
+        self.etapas = {} # etapa -> Histograma
+
+    def registrar_requisicao(self, rota, metodo, status, medicao, segundos, suspeitas):
+        with self._lock:
+            self.requisicoes[(rota, metodo, status)] += 1
+            self.duracoes.setdefault(rota, Histograma()).observar(segundos)
+            self.consultas[rota] += medicao.consultas
+            self.segundos_banco[rota] += medicao.segundos_banco
+            self.suspeitas_n_mais_um[rota] += suspeitas
+
+    def registrar_etapa(self, etapa, segundos):
+        with self._lock:
+            self.etapas.setdefault(etapa, Histograma()).observar(segundos)
+
+    def texto(self):
+        linhas = []
+
+        def histograma(nome, ajuda, por_rotulo, rotulo):
+            linhas.extend([f"# HELP {nome} {ajuda}", f"# TYPE {nome} histogram"])
+            for valor, hist in sorted(por_rotulo.items()):
+                for limite, quantidade in zip(BALDES_SEGUNDOS, hist.baldes):
+                    linhas.append(f"{nome}_bucket{_rotulos(**{rotulo: valor, 'le': limite})} {quantidade}")
+                linhas.append(f"{nome}_bucket{_rotulos(**{rotulo: valor, 'le': '+Inf'})} {hist.total}")
+                linhas.append(f"{nome}_sum{_rotulos(**{rotulo: valor})} {hist.soma:.6f}")
+                linhas.append(f"{nome}_count{_rotulos(**{rotulo: valor})} {hist.total}")
+
+        def contador(nome, ajuda, valores):
+            linhas.extend([f"# HELP {nome} {ajuda}", f"# TYPE {nome} counter"])
+            for rota, valor in sorted(valores.items()):
+                linhas.append(f"{nome}{_rotulos(rota=rota)} {valor:g}")
+
+        with self._lock:
+            linhas.extend(["# HELP papelaria_requisicoes_total Requisições atendidas.",
+                           "# TYPE papelaria_requisicoes_total counter"])
+            for (rota, metodo, status), quantidade in sorted(self.requisicoes.items()):
+                linhas.append(f"papelaria_requisicoes_total{_rotulos(rota=rota, metodo=metodo, status=status)} {quantidade}")
+            histograma('papelaria_requisicao_segundos', 'Duração das requisições.', self.duracoes, 'rota')
+            contador('papelaria_consultas_sql_total', 'Consultas SQL feitas pelas requisições.', self.consultas)
+            contador('papelaria_banco_segundos_total', 'Tempo das requisições no banco.', self.segundos_banco)
+            contador('papelaria_n_mais_um_total', 'Consultas repetidas acima do limite numa requisição (possível N+1).',
+                     self.suspeitas_n_mais_um)
+            histograma('papelaria_etapa_segundos', 'Duração das etapas cronometradas.', self.etapas, 'etapa')
+        return '\n'.join(linhas) + '\n'
+
+metricas = Metricas()
+
+# ==========================================================
+# Perfil amostrado
+# ==========================================================
+
+def _iniciar_perfil(perfilador):
+    if perfilador == 'pyinstrument':
+        from pyinstrument import Profiler
+        perfil = Profiler(async_mode='disabled')
+        perfil.start()
+        return perfil
+    import cProfile
+    perfil = cProfile.Profile()
+    perfil.enable()
+    return perfil
+
+def _gravar_perfil(perfil, perfilador, pasta, rota, segundos):
+    """Grava o perfil em pasta/<rota>/<data>-<ms>ms.prof (ou .html, com pyinstrument)."""
+    destino = os.path.join(pasta, re.sub(r'[^\w.-]+', '_', rota).strip('_') or 'raiz')
+    os.makedirs(destino, exist_ok=True)
+    nome = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{segundos * 1000:.0f}ms"
+    if perfilador == 'pyinstrument':
+        perfil.stop()
+        with open(os.path.join(destino, nome + '.html'), 'w', encoding='utf-8') as arquivo:
+            arquivo.write(perfil.output_html())
+    else:
+        perfil.disable()
+        perfil.dump_stats(os.path.join(destino, nome + '.prof'))
+
+# ==========================================================
+# Instalação no app
+# ==========================================================
+
+def _config(app, nome, padrao):
+    return app.config.get(nome, os.getenv(nome, padrao))
+
+def instalar_instrumentacao(app):
+    """
+    Liga a instrumentação no app: listeners no engine do banco, medição de
+    cada requisição (before/after_request), Server-Timing, detector de N+1,
+    perfil amostrado e a rota /metrics. Configuração (app.config ou ambiente):
+    INSTRUMENTACAO_LIMITE_REPETICOES, INSTRUMENTACAO_AMOSTRA_PERFIL (0 a 1),
+    INSTRUMENTACAO_PERFILADOR ('cprofile' ou 'pyinstrument'),
+    INSTRUMENTACAO_PASTA_PERFIS e INSTRUMENTACAO_TOKEN_METRICAS (se definido,
+    /metrics exige "Authorization: Bearer <token>").
+    """
+    global _ativa
+
+    limite = int(_config(app, 'INSTRUMENTACAO_LIMITE_REPETICOES', LIMITE_REPETICOES))
+    amostra = float(_config(app, 'INSTRUMENTACAO_AMOSTRA_PERFIL', 0))
+    perfilador = _config(app, 'INSTRUMENTACAO_PERFILADOR', 'cprofile')
+    pasta = _config(app, 'INSTRUMENTACAO_PASTA_PERFIS', PASTA_PERFIS)
+    token = _config(app, 'INSTRUMENTACAO_TOKEN_METRICAS', None)
+    if perfilador not in PERFILADORES:
+        raise ValueError(f"INSTRUMENTACAO_PERFILADOR inválido: {perfilador}")
+    if amostra and perfilador == 'pyinstrument':
+        import pyinstrument # Falha já na inicialização se não estiver instalado
+
+    with app.app_context():
+        _engines_ouvidos.obter(db.engine)
+
+    @app.before_request
+    def iniciar_medicao():
+        g.medicao = Medicao()
+        if amostra and random.random() < amostra:
+            g.perfil = _iniciar_perfil(perfilador)
+
+    @app.after_request
+    def encerrar_medicao(resposta):
+        medicao = g.pop('medicao', None)
+        if medicao is None:
+            return resposta
+        segundos = time.perf_counter() - medicao.inicio
+        rota = request.url_rule.rule if request.url_rule else 'sem_rota'
+
+        perfil = g.pop('perfil', None)
+        if perfil is not None:
+            _gravar_perfil(perfil, perfilador, pasta, rota, segundos)
+
+        suspeitas = {forma: vezes for forma, vezes in medicao.formas.items() if vezes > limite}
+        for forma, vezes in suspeitas.items():
+            logger.warning("Possível N+1 em %s %s: a mesma consulta rodou %d vezes: %s",
+                           request.method, rota, vezes, forma[:300])
+
+        metricas.registrar_requisicao(rota, request.method, resposta.status_code, medicao, segundos, len(suspeitas))
+        resposta.headers['Server-Timing'] = server_timing(medicao, segundos)
+        return resposta
+
+    def exportar_metricas():
+        if token and request.headers.get('Authorization') != f"Bearer {token}":
+            abort(401)
+        return Response(metricas.texto(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metricas', exportar_metricas)
+    _ativa = True
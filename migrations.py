@@ -0,0 +1,408 @@
+# Migrações do banco de dados.
+#
+# Cada migração roda uma única vez, em ordem de versão, dentro da sua própria
+# transação, e fica registrada na tabela 'schema_migracao'. Para mudar o
+# esquema, adicione uma função nova no fim do arquivo com o decorador
+# @migracao(<próxima versão>, '<descrição>'); nunca altere uma migração que já
+# foi aplicada em produção.
+#
+# As tabelas criadas por uma migração são descritas nela mesma (uma cópia
+# congelada, com Table/Column), nunca lidas dos modelos atuais: mudar um
+# modelo depois não muda o que uma migração antiga cria, e cada mudança de
+# esquema fica na migração que a introduziu.
+#
+# Aplicadas automaticamente ao iniciar o app, ou à mão com `flask migrar`.
+
+import json
+import os
+from datetime import datetime
+from sqlalchemy import (
+    Column, Date, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text, text
+)
+from sqlalchemy.exc import SQLAlchemyError
+
+MIGRACOES = []
+
+def migracao(versao, descricao):
+    def registrar(funcao):
+        MIGRACOES.append((versao, descricao, funcao))
+        return funcao
+    return registrar
+
+def _criar_tabela_controle(conexao):
+    conexao.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migracao (
+            versao INTEGER PRIMARY KEY,
+            descricao VARCHAR(200) NOT NULL,
+            aplicada_em TIMESTAMP NOT NULL
+        )
+    """))
+
+def versoes_aplicadas(engine):
+    with engine.begin() as conexao:
+        _criar_tabela_controle(conexao)
+        return {versao for (versao,) in conexao.execute(text("SELECT versao FROM schema_migracao"))}
+
+def aplicar_migracoes(engine, log=print):
+    """
+    Aplica as migrações pendentes. Se outro processo (ex.: outro worker do
+    gunicorn) aplicar a mesma versão ao mesmo tempo, a falha deste é ignorada.
+    Retorna a lista de versões aplicadas por esta chamada.
+    """
+    aplicadas = versoes_aplicadas(engine)
+    novas = []
+
+    for versao, descricao, funcao in sorted(MIGRACOES, key=lambda m: m[0]):
+        if versao in aplicadas:
+            continue
+        try:
+            with engine.begin() as conexao:
+                funcao(conexao)
+                conexao.execute(
+                    text("INSERT INTO schema_migracao (versao, descricao, aplicada_em) VALUES (:v, :d, :em)"),
+                    {'v': versao, 'd': descricao, 'em': datetime.utcnow()}
+                )
+        except SQLAlchemyError:
+            if versao in versoes_aplicadas(engine):
+                continue # Outro processo chegou primeiro
+            raise
+        log(f"Migração {versao} aplicada: {descricao}")
+        novas.append(versao)
+
+    return novas
+
+def _esquema(*referenciadas):
+    """
+    MetaData para as tabelas de uma migração, com as tabelas já existentes
+    que elas referenciam (só o id), para as chaves estrangeiras resolverem.
+    """
+    metadata = MetaData()
+    for nome in referenciadas:
+        Table(nome, metadata, Column('id', Integer, primary_key=True))
+    return metadata
+
+def _criar_tabelas(conexao, *tabelas):
+    """Cria as tabelas (com os índices delas) que ainda não existem."""
+    tabelas[0].metadata.create_all(conexao, tables=tabelas)
+
+######################################
+# Migrações
+######################################
+
+@migracao(1, 'Esquema inicial (tabelas dos modelos)')
+def _esquema_inicial(conexao):
+    # Linha de base: as tabelas de antes das migrações, como eram então. Bancos
+    # antigos, criados com db.create_all(), já têm todas elas. Os índices da
+    # busca ficam com a migração 3, e venda.pedido_id com a 6.
+    metadata = MetaData()
+    usuario = Table(
+        'usuario', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('nome', String(100), nullable=False),
+        Column('email', String(100), unique=True, nullable=False),
+        Column('senha', String(200), nullable=False),
+        Column('tipo', String(20)),
+    )
+    produto = Table(
+        'produto', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('nome', String(100), nullable=False),
+        Column('descricao', String(200)),
+        Column('preco', Float, nullable=False),
+        Column('quantidade', Integer),
+        Column('data_cadastro', DateTime),
+    )
+    cliente = Table(
+        'cliente', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('nome', String(100), nullable=False),
+        Column('email', String(100), unique=True),
+        Column('telefone', String(20)),
+        Column('endereco', String(200)),
+        Column('data_cadastro', DateTime),
+    )
+    venda = Table(
+        'venda', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('cliente_id', Integer, ForeignKey('cliente.id')),
+        Column('produto_id', Integer, ForeignKey('produto.id')),
+        Column('quantidade', Integer, nullable=False),
+        Column('data_venda', DateTime),
+        Column('valor_total', Float, nullable=False),
+    )
+    cliente_rfm = Table(
+        'cliente_rfm', metadata,
+        Column('cliente_id', Integer, ForeignKey('cliente.id'), primary_key=True),
+        Column('ultima_compra', DateTime, nullable=False),
+        Column('total_compras', Integer, nullable=False),
+        Column('total_gasto', Float, nullable=False),
+    )
+    _criar_tabelas(conexao, usuario, produto, cliente, venda, cliente_rfm)
+
+@migracao(2, 'Preenche cliente_rfm a partir das vendas existentes')
+def _preencher_cliente_rfm(conexao):
+    vazia = conexao.execute(text("SELECT 1 FROM cliente_rfm LIMIT 1")).first() is None
+    if vazia:
+        conexao.execute(text("""
+            INSERT INTO cliente_rfm (cliente_id, ultima_compra, total_compras, total_gasto)
+            SELECT cliente_id, MAX(data_venda), COUNT(*), SUM(valor_total)
+            FROM venda
+            WHERE cliente_id IS NOT NULL
+            GROUP BY cliente_id
+        """))
+
+@migracao(3, 'Índices da busca de clientes, produtos e vendas')
+def _indices_busca(conexao):
+    for comando in [
+        "CREATE INDEX IF NOT EXISTS ix_produto_nome_lower ON produto (lower(nome))",
+        "CREATE INDEX IF NOT EXISTS ix_cliente_nome_lower ON cliente (lower(nome))",
+        "CREATE INDEX IF NOT EXISTS ix_cliente_email_lower ON cliente (lower(email))",
+        "CREATE INDEX IF NOT EXISTS ix_venda_cliente_id ON venda (cliente_id)",
+        "CREATE INDEX IF NOT EXISTS ix_venda_produto_id ON venda (produto_id)",
+        "CREATE INDEX IF NOT EXISTS ix_venda_data_venda ON venda (data_venda)",
+    ]:
+        conexao.execute(text(comando))
+
+@migracao(4, 'Busca de produtos com FTS5 (somente SQLite)')
+def _busca_produtos_fts(conexao):
+    if conexao.dialect.name != 'sqlite':
+        return
+
+    conexao.execute(text("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS produto_fts USING fts5(
+            nome, descricao, content='produto', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """))
+    conexao.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS produto_fts_ai AFTER INSERT ON produto BEGIN
+            INSERT INTO produto_fts(rowid, nome, descricao) VALUES (new.id, new.nome, new.descricao);
+        END
+    """))
+    conexao.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS produto_fts_ad AFTER DELETE ON produto BEGIN
+            INSERT INTO produto_fts(produto_fts, rowid, nome, descricao)
+            VALUES ('delete', old.id, old.nome, old.descricao);
+        END
+    """))
+    # Só nome/descrição: baixas de estoque a cada venda não mexem no índice
+    conexao.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS produto_fts_au AFTER UPDATE OF nome, descricao ON produto BEGIN
+            INSERT INTO produto_fts(produto_fts, rowid, nome, descricao)
+            VALUES ('delete', old.id, old.nome, old.descricao);
+            INSERT INTO produto_fts(rowid, nome, descricao) VALUES (new.id, new.nome, new.descricao);
+        END
+    """))
+    # Indexa os produtos que já estavam cadastrados
+    conexao.execute(text("INSERT INTO produto_fts(produto_fts) VALUES ('rebuild')"))
+
+@migracao(5, 'Índices compostos de venda (RFM, mais vendidos e gráfico)')
+def _indices_compostos_venda(conexao):
+    for comando in INDICES_COMPOSTOS_VENDA:
+        conexao.execute(text(comando))
+    # Os índices simples viraram prefixo dos compostos e só custariam escrita
+    for indice in ['ix_venda_cliente_id', 'ix_venda_produto_id', 'ix_venda_data_venda']:
+        conexao.execute(text(f"DROP INDEX IF EXISTS {indice}"))
+
+INDICES_COMPOSTOS_VENDA = [
+    # RFM por cliente e vendas de um cliente em ordem de data
+    "CREATE INDEX IF NOT EXISTS ix_venda_cliente_data ON venda (cliente_id, data_venda)",
+    # Mais vendidos (soma de quantidade por produto) sem ler a tabela
+    "CREATE INDEX IF NOT EXISTS ix_venda_produto_quantidade ON venda (produto_id, quantidade)",
+    # Gráfico de receita por dia: filtro de data + soma do valor só pelo índice
+    "CREATE INDEX IF NOT EXISTS ix_venda_data_valor ON venda (data_venda, valor_total)",
+]
+
+@migracao(6, 'Pedidos: tabela pedido e venda.pedido_id (cada venda antiga vira um pedido)')
+def _pedidos(conexao):
+    from sqlalchemy import inspect
+
+    pedido = Table(
+        'pedido', _esquema('cliente'),
+        Column('id', Integer, primary_key=True),
+        Column('cliente_id', Integer, ForeignKey('cliente.id')),
+        Column('data_pedido', DateTime),
+        Column('valor_total', Float, nullable=False),
+        Index('ix_pedido_cliente_data', 'cliente_id', 'data_pedido'),
+        Index('ix_pedido_data_valor', 'data_pedido', 'valor_total'),
+    )
+    _criar_tabelas(conexao, pedido)
+
+    colunas = {coluna['name'] for coluna in inspect(conexao).get_columns('venda')}
+    if 'pedido_id' not in colunas:
+        conexao.execute(text("ALTER TABLE venda ADD COLUMN pedido_id INTEGER REFERENCES pedido (id)"))
+    conexao.execute(text("CREATE INDEX IF NOT EXISTS ix_venda_pedido ON venda (pedido_id)"))
+
+    # Até aqui cada venda era uma compra de um produto só: vira um pedido com o mesmo id
+    conexao.execute(text("""
+        INSERT INTO pedido (id, cliente_id, data_pedido, valor_total)
+        SELECT id, cliente_id, data_venda, valor_total
+        FROM venda
+        WHERE pedido_id IS NULL
+    """))
+    conexao.execute(text("UPDATE venda SET pedido_id = id WHERE pedido_id IS NULL"))
+    if conexao.dialect.name == 'postgresql':
+        # Os ids foram inseridos à mão: a sequência precisa continuar depois deles
+        conexao.execute(text(
+            "SELECT setval(pg_get_serial_sequence('pedido', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM pedido"
+        ))
+
+@migracao(7, 'Fila de saída de emails (email_saida)')
+def _fila_emails(conexao):
+    email_saida = Table(
+        'email_saida', MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('destinatarios', Text, nullable=False),
+        Column('assunto', String(300), nullable=False),
+        Column('html', Text, nullable=False),
+        Column('status', String(20), nullable=False),
+        Column('tentativas', Integer, nullable=False),
+        Column('proxima_tentativa', DateTime, nullable=False),
+        Column('reserva', String(32), index=True),
+        Column('erro', String(500)),
+        Column('criado_em', DateTime),
+        Column('enviado_em', DateTime),
+        Index('ix_email_saida_status_proxima', 'status', 'proxima_tentativa'),
+    )
+    _criar_tabelas(conexao, email_saida)
+
+@migracao(8, 'Campanhas de recomendação em lote (campanha)')
+def _campanhas(conexao):
+    campanha = Table(
+        'campanha', MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('segmento', String(50)),
+        Column('pasta_simulacao', String(300)),
+        Column('status', String(20), nullable=False),
+        Column('total_clientes', Integer, nullable=False),
+        Column('processados', Integer, nullable=False),
+        Column('enfileirados', Integer, nullable=False),
+        Column('ultimo_cliente_id', Integer, nullable=False),
+        Column('criada_em', DateTime),
+        Column('concluida_em', DateTime),
+    )
+    _criar_tabelas(conexao, campanha)
+
+@migracao(9, 'Cache compartilhado de recomendações (cache_recomendacao)')
+def _cache_recomendacoes(conexao):
+    cache_recomendacao = Table(
+        'cache_recomendacao', MetaData(),
+        Column('cliente_id', Integer, primary_key=True),
+        Column('motor', String(20), primary_key=True),
+        Column('valor', Text, nullable=False),
+        Column('expira_em', DateTime, nullable=False),
+    )
+    _criar_tabelas(conexao, cache_recomendacao)
+
+@migracao(10, 'Totais de vendas por produto (produto_vendas e produto_vendas_dia)')
+def _vendas_produtos(conexao):
+    metadata = _esquema('produto')
+    produto_vendas = Table(
+        'produto_vendas', metadata,
+        Column('produto_id', Integer, ForeignKey('produto.id'), primary_key=True),
+        Column('total_quantidade', Integer, nullable=False),
+        Column('total_receita', Float, nullable=False),
+        Column('ultima_venda', DateTime, nullable=False),
+    )
+    produto_vendas_dia = Table(
+        'produto_vendas_dia', metadata,
+        Column('dia', Date, primary_key=True),
+        Column('produto_id', Integer, ForeignKey('produto.id'), primary_key=True),
+        Column('quantidade', Integer, nullable=False),
+        Column('receita', Float, nullable=False),
+    )
+    _criar_tabelas(conexao, produto_vendas, produto_vendas_dia)
+    if conexao.execute(text("SELECT 1 FROM produto_vendas LIMIT 1")).first() is None:
+        dia = "date(data_venda)" if conexao.dialect.name == 'sqlite' else "CAST(data_venda AS DATE)"
+        conexao.execute(text("""
+            INSERT INTO produto_vendas (produto_id, total_quantidade, total_receita, ultima_venda)
+            SELECT produto_id, SUM(quantidade), SUM(valor_total), MAX(data_venda)
+            FROM venda
+            WHERE produto_id IS NOT NULL
+            GROUP BY produto_id
+        """))
+        conexao.execute(text(f"""
+            INSERT INTO produto_vendas_dia (dia, produto_id, quantidade, receita)
+            SELECT {dia}, produto_id, SUM(quantidade), SUM(valor_total)
+            FROM venda
+            WHERE produto_id IS NOT NULL
+            GROUP BY {dia}, produto_id
+        """))
+
+# Relativo a este arquivo, não ao diretório de onde o app foi iniciado
+FAQ_INICIAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'faq.json')
+
+def _perguntas_iniciais_faq(caminho=FAQ_INICIAL_PATH):
+    """Lista de (pergunta, resposta) do faq.json, na ordem do arquivo."""
+    with open(caminho, encoding='utf-8') as arquivo:
+        return [(item['pergunta'], item['resposta']) for item in json.load(arquivo)]
+
+@migracao(11, 'FAQ no banco (pergunta_faq), com as perguntas do faq.json')
+def _faq(conexao):
+    pergunta_faq = Table(
+        'pergunta_faq', MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('pergunta', Text, nullable=False),
+        Column('resposta', Text, nullable=False),
+        Column('atualizado_em', DateTime, nullable=False, index=True),
+    )
+    _criar_tabelas(conexao, pergunta_faq)
+    if conexao.execute(text("SELECT 1 FROM pergunta_faq LIMIT 1")).first() is None:
+        agora = datetime.utcnow()
+        conexao.execute(pergunta_faq.insert(), [
+            {'pergunta': pergunta, 'resposta': resposta, 'atualizado_em': agora}
+            for pergunta, resposta in _perguntas_iniciais_faq()
+        ])
+
+@migracao(12, 'Segmento da classificação gravado por cliente (cliente.segmento)')
+def _segmento_cliente(conexao):
+    # A coluna é preenchida pelo próximo `flask treinar-classificacao` (ou
+    # `flask atualizar-segmentos`); até lá, /clientes classifica na hora
+    from sqlalchemy import inspect
+
+    colunas = {coluna['name'] for coluna in inspect(conexao).get_columns('cliente')}
+    if 'segmento' not in colunas:
+        conexao.execute(text("ALTER TABLE cliente ADD COLUMN segmento VARCHAR(20)"))
+    conexao.execute(text("CREATE INDEX IF NOT EXISTS ix_cliente_segmento ON cliente (segmento, id)"))
+
+@migracao(13, 'Busca de clientes sem acentos (cliente.nome_busca e cliente.email_busca)')
+def _busca_clientes_sem_acentos(conexao):
+    # O lower() do SQLite só conhece ASCII: "ânge" não achava "Ângela". As
+    # colunas novas guardam nome/email já normalizados (models.normalizar_busca)
+    from sqlalchemy import inspect
+    from models import normalizar_busca
+
+    colunas = {coluna['name'] for coluna in inspect(conexao).get_columns('cliente')}
+    for coluna in ['nome_busca', 'email_busca']:
+        if coluna not in colunas:
+            conexao.execute(text(f"ALTER TABLE cliente ADD COLUMN {coluna} VARCHAR(100)"))
+
+    ultimo_id = 0
+    while True:
+        linhas = conexao.execute(
+            text("SELECT id, nome, email FROM cliente WHERE id > :ultimo ORDER BY id LIMIT 10000"),
+            {'ultimo': ultimo_id}
+        ).all()
+        if not linhas:
+            break
+        conexao.execute(
+            text("UPDATE cliente SET nome_busca = :nome, email_busca = :email WHERE id = :id"),
+            [{'id': id_, 'nome': normalizar_busca(nome), 'email': normalizar_busca(email)} for id_, nome, email in linhas]
+        )
+        ultimo_id = linhas[-1].id
+
+    conexao.execute(text("CREATE INDEX IF NOT EXISTS ix_cliente_nome_busca ON cliente (nome_busca)"))
+    conexao.execute(text("CREATE INDEX IF NOT EXISTS ix_cliente_email_busca ON cliente (email_busca)"))
+    # Substituídos pelos índices acima
+    conexao.execute(text("DROP INDEX IF EXISTS ix_cliente_nome_lower"))
+    conexao.execute(text("DROP INDEX IF EXISTS ix_cliente_email_lower"))
+
+@migracao(14, 'Limite de taxa de emails compartilhado entre processos (email_limite)')
+def _limite_emails(conexao):
+    email_limite = Table(
+        'email_limite', MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('proximo_envio', Float, nullable=False),
+    )
+    _criar_tabelas(conexao, email_limite)
+    conexao.execute(email_limite.insert().values(id=1, proximo_envio=0.0))
@@ -0,0 +1,280 @@
+# Modelos do banco de dados.
+#
+# Ficam fora do app.py para que os engines, os scripts de benchmark e os
+# workers usem os modelos sem criar o app Flask: com um app, a sessão padrão
+# é db.session (create_app em app.py chama db.init_app); sem app, use uma
+# Session do SQLAlchemy sobre criar_engine().
+
+import os
+import sqlite3
+import threading
+import unicodedata
+from datetime import datetime
+from flask_sqlalchemy import SQLAlchemy
+from flask_login import UserMixin
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import validates
+from werkzeug.security import check_password_hash
+
+# Mesmo caminho que o Flask-SQLAlchemy usa para 'sqlite:///papelaria.db' (pasta instance/)
+PASTA_INSTANCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+URL_BANCO_PADRAO = 'sqlite:///papelaria.db'
+
+db = SQLAlchemy()
+
+def url_banco():
+    """URL do banco: DATABASE_URL ou o papelaria.db padrão."""
+    return os.getenv('DATABASE_URL', URL_BANCO_PADRAO)
+
+def criar_engine(url=None):
+    """
+    Engine do SQLAlchemy sem app Flask (workers, jobs em lote, benchmarks).
+    Caminhos SQLite relativos são resolvidos na pasta instance/, como no app.
+    """
+    url = url or url_banco()
+    if url.startswith('sqlite:///') and not url.startswith('sqlite:////') and url != 'sqlite:///:memory:':
+        os.makedirs(PASTA_INSTANCE, exist_ok=True)
+        url = 'sqlite:///' + os.path.join(PASTA_INSTANCE, url[len('sqlite:///'):])
+    return create_engine(url)
+
+def normalizar_busca(texto):
+    """
+    Texto como é comparado na busca: minúsculas e sem acentos ('Ângela' ->
+    'angela'). O lower() do SQLite só conhece ASCII, então a forma normalizada
+    é calculada aqui e gravada em colunas próprias.
+    """
+    if texto is None:
+        return None
+    decomposto = unicodedata.normalize('NFKD', texto)
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).casefold()
+
+def sessao_padrao(sessao=None):
+    """A sessão informada ou, sem ela, db.session (precisa de um app context)."""
+    return sessao if sessao is not None else db.session
+
+class PorBanco:
+    """
+    Um objeto por engine (banco), criado por 'fabrica(engine)' no primeiro
+    uso: caches e threads do processo não misturam bancos quando várias
+    instâncias do app (com bancos diferentes) rodam no mesmo processo.
+    """
+    def __init__(self, fabrica):
+        self.fabrica = fabrica
+        self._lock = threading.Lock()
+        self._objetos = {}
+
+    def obter(self, engine):
+        with self._lock:
+            objeto = self._objetos.get(engine)
+            if objeto is None:
+                objeto = self._objetos[engine] = self.fabrica(engine)
+            return objeto
+
+    def todos(self):
+        with self._lock:
+            return list(self._objetos.values())
+
+@event.listens_for(Engine, 'connect')
+def configurar_sqlite(conexao_dbapi, registro):
+    """
+    Com vários workers no mesmo arquivo SQLite: WAL deixa as leituras rodarem
+    enquanto outro processo grava, e busy_timeout faz a conexão esperar o lock
+    em vez de falhar na hora com "database is locked".
+    """
+    if isinstance(conexao_dbapi, sqlite3.Connection):
+        cursor = conexao_dbapi.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+
+######################################
+# Usuários
+######################################
+class Usuario(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(100), unique=True, nullable=False)
+    senha = db.Column(db.String(200), nullable=False)
+    tipo = db.Column(db.String(20), default='funcionario')
+
+    def verificar_senha(self, senha):
+        return check_password_hash(self.senha, senha)
+
+######################################
+# Modelos do Negócio
+######################################
+class Produto(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(100), nullable=False)
+    descricao = db.Column(db.String(200))
+    preco = db.Column(db.Float, nullable=False)
+    quantidade = db.Column(db.Integer, default=0)
+    data_cadastro = db.Column(db.DateTime, default=datetime.utcnow)
+
+db.Index('ix_produto_nome_lower', db.func.lower(Produto.nome))
+
+class Cliente(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(100), unique=True)
+    telefone = db.Column(db.String(20))
+    endereco = db.Column(db.String(200))
+    data_cadastro = db.Column(db.DateTime, default=datetime.utcnow)
+    # Segmento da classificação, gravado a cada treino (classification_engine.atualizar_segmentos);
+    # None até o primeiro cálculo depois do cadastro
+    segmento = db.Column(db.String(20))
+    # Nome e email em normalizar_busca, para a busca por prefixo (search_engine.py);
+    # preenchidos sempre que nome ou email mudam pelo ORM
+    nome_busca = db.Column(db.String(100))
+    email_busca = db.Column(db.String(100))
+
+    @validates('nome', 'email')
+    def _atualizar_busca(self, campo, valor):
+        setattr(self, f'{campo}_busca', normalizar_busca(valor))
+        return valor
+
+# Índices para a busca por prefixo de nome/email (ver search_engine.py)
+db.Index('ix_cliente_nome_busca', Cliente.nome_busca)
+db.Index('ix_cliente_email_busca', Cliente.email_busca)
+# Listagem e campanhas por segmento, na ordem de id (paginação por chave)
+db.Index('ix_cliente_segmento', Cliente.segmento, Cliente.id)
+
+class Pedido(db.Model):
+    """
+    Uma compra do cliente (um "carrinho"). Cada produto comprado é uma linha
+    em 'venda' apontando para o pedido; valor_total é a soma das linhas.
+    """
+    __table_args__ = (
+        db.Index('ix_pedido_cliente_data', 'cliente_id', 'data_pedido'),
+        db.Index('ix_pedido_data_valor', 'data_pedido', 'valor_total'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'))
+    data_pedido = db.Column(db.DateTime, default=datetime.utcnow)
+    valor_total = db.Column(db.Float, nullable=False)
+
+    cliente = db.relationship('Cliente', backref='pedidos')
+
+class Venda(db.Model):
+    """Linha de um pedido: um produto, a quantidade e o valor da linha."""
+    # Índices compostos para os caminhos mais usados (ver migração 5 em migrations.py)
+    __table_args__ = (
+        db.Index('ix_venda_cliente_data', 'cliente_id', 'data_venda'),
+        db.Index('ix_venda_produto_quantidade', 'produto_id', 'quantidade'),
+        db.Index('ix_venda_data_valor', 'data_venda', 'valor_total'),
+        db.Index('ix_venda_pedido', 'pedido_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    pedido_id = db.Column(db.Integer, db.ForeignKey('pedido.id'))
+    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'))
+    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'))
+    quantidade = db.Column(db.Integer, nullable=False)
+    data_venda = db.Column(db.DateTime, default=datetime.utcnow)
+    valor_total = db.Column(db.Float, nullable=False)
+    
+    cliente = db.relationship('Cliente', backref='vendas')
+    produto = db.relationship('Produto', backref='vendas')
+    pedido = db.relationship('Pedido', backref='itens')
+
+class ClienteRFM(db.Model):
+    """
+    Agregado RFM por cliente, atualizado junto com cada venda.
+    Evita varrer a tabela 'venda' inteira para classificar ou treinar.
+    """
+    __tablename__ = 'cliente_rfm'
+    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'), primary_key=True)
+    ultima_compra = db.Column(db.DateTime, nullable=False)
+    total_compras = db.Column(db.Integer, nullable=False, default=0)
+    total_gasto = db.Column(db.Float, nullable=False, default=0.0)
+
+class ProdutoVendas(db.Model):
+    """
+    Total vendido por produto (todas as vendas), atualizado junto com cada
+    pedido. Evita agrupar a tabela 'venda' inteira para achar os mais vendidos.
+    """
+    __tablename__ = 'produto_vendas'
+    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), primary_key=True)
+    total_quantidade = db.Column(db.Integer, nullable=False, default=0)
+    total_receita = db.Column(db.Float, nullable=False, default=0.0)
+    ultima_venda = db.Column(db.DateTime, nullable=False)
+
+class ProdutoVendasDia(db.Model):
+    """Vendas por produto e dia, para os mais vendidos de uma janela (ex.: últimos 7 dias)."""
+    __tablename__ = 'produto_vendas_dia'
+    dia = db.Column(db.Date, primary_key=True)
+    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), primary_key=True)
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+    receita = db.Column(db.Float, nullable=False, default=0.0)
+
+class EmailSaida(db.Model):
+    """
+    Fila de saída de emails. As rotas só gravam aqui; o envio é feito pelo
+    worker de emails (email_engine.py), fora da requisição.
+    status: 'pendente' -> 'enviando' -> 'enviado' ou 'falhou'.
+    """
+    __tablename__ = 'email_saida'
+    __table_args__ = (
+        db.Index('ix_email_saida_status_proxima', 'status', 'proxima_tentativa'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    destinatarios = db.Column(db.Text, nullable=False) # Separados por vírgula
+    assunto = db.Column(db.String(300), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pendente')
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    proxima_tentativa = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    reserva = db.Column(db.String(32), index=True)
+    erro = db.Column(db.String(500))
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    enviado_em = db.Column(db.DateTime)
+
+class EmailLimite(db.Model):
+    """
+    Linha única (id=1) com o horário (segundos desde a época) a partir do qual
+    o próximo email pode sair. Todos os processos que enviam pelo mesmo banco
+    reservam os horários aqui (LimiteTaxa, em email_engine.py).
+    """
+    __tablename__ = 'email_limite'
+    id = db.Column(db.Integer, primary_key=True)
+    proximo_envio = db.Column(db.Float, nullable=False, default=0.0)
+
+class RecomendacaoCache(db.Model):
+    """Cache compartilhado de recomendações (CACHE_RECOMENDACOES=banco, ver recommendation_engine.py)."""
+    __tablename__ = 'cache_recomendacao'
+    cliente_id = db.Column(db.Integer, primary_key=True)
+    motor = db.Column(db.String(20), primary_key=True)
+    valor = db.Column(db.Text, nullable=False) # JSON da resposta
+    expira_em = db.Column(db.DateTime, nullable=False)
+
+class Campanha(db.Model):
+    """
+    Campanha de emails de recomendação em lote (ver campaign_engine.py).
+    Os clientes são percorridos em ordem de id; 'ultimo_cliente_id' marca
+    até onde a campanha chegou, para retomar depois de uma interrupção.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    segmento = db.Column(db.String(50)) # None = todos os clientes
+    pasta_simulacao = db.Column(db.String(300)) # Simulação: grava os emails em disco em vez de enviar
+    status = db.Column(db.String(20), nullable=False, default='em_andamento')
+    total_clientes = db.Column(db.Integer, nullable=False, default=0)
+    processados = db.Column(db.Integer, nullable=False, default=0)
+    enfileirados = db.Column(db.Integer, nullable=False, default=0)
+    ultimo_cliente_id = db.Column(db.Integer, nullable=False, default=0)
+    criada_em = db.Column(db.DateTime, default=datetime.utcnow)
+    concluida_em = db.Column(db.DateTime)
+
+class PerguntaFaq(db.Model):
+    """
+    Pergunta e resposta do FAQ / assistente. 'atualizado_em' muda a cada
+    edição: é por ele que o índice do assistente sabe o que treinar de novo
+    (ver chatbot_config.py).
+    """
+    __tablename__ = 'pergunta_faq'
+    id = db.Column(db.Integer, primary_key=True)
+    pergunta = db.Column(db.Text, nullable=False)
+    resposta = db.Column(db.Text, nullable=False)
+    atualizado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
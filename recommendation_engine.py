@@ -1,116 +1,827 @@
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-from app import db, Venda, Produto  # Importa os modelos do seu app
-from collections import Counter
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from models import db, sessao_padrao, Venda, Produto, PorBanco
+from instrumentation import cronometrado
 
-def get_purchase_matrix():
+# numpy e scipy são importados dentro das funções que os usam: cada venda
+# importa este módulo só para invalidar o cache de recomendações do cliente
+
+class MatrizCompras:
     """
-    Busca os dados de vendas do banco e os transforma em uma matriz
-    [cite_start]onde as linhas são clientes e as colunas são produtos. [cite: 313, 314, 315, 316, 317]
+    Matriz esparsa (CSR) onde as linhas são clientes e as colunas são produtos.
     O valor 1 significa que o cliente comprou o produto.
+    Guarda também os mapas id <-> linha/coluna. Nunca é alterada depois de
+    montada: os mapas e arrays podem ser compartilhados com a próxima versão.
     """
-    # Consulta para pegar pares distintos de (cliente, produto)
-    sales_query = db.session.query(Venda.cliente_id, Venda.produto_id).distinct().all()
-    
-    if not sales_query:
-        return None
+    def __init__(self, matriz, cliente_ids, produto_ids,
+                 indice_cliente=None, indice_produto=None, normalizada=None):
+        self.matriz = matriz
+        self.cliente_ids = cliente_ids
+        self.produto_ids = produto_ids
+        if indice_cliente is None:
+            indice_cliente = {int(cid): i for i, cid in enumerate(cliente_ids)}
+        if indice_produto is None:
+            indice_produto = {int(pid): j for j, pid in enumerate(produto_ids)}
+        self.indice_cliente = indice_cliente
+        self.indice_produto = indice_produto
+        # Linhas com norma L2 = 1: o produto escalar entre linhas é a similaridade de cosseno
+        self.normalizada = _normalizar(matriz) if normalizada is None else normalizada
 
-    df_sales = pd.DataFrame(sales_query, columns=['cliente_id', 'produto_id'])
-    
-    # Usa o crosstab do pandas para criar a matriz cliente-produto
-    user_product_matrix = pd.crosstab(df_sales['cliente_id'], df_sales['produto_id'])
-    
-    return user_product_matrix
+    def produtos_do_cliente(self, linha):
+        """Ids (ordenados) dos produtos comprados pelo cliente da linha informada."""
+        import numpy as np
+
+        inicio, fim = self.matriz.indptr[linha], self.matriz.indptr[linha + 1]
+        return np.sort(self.produto_ids[self.matriz.indices[inicio:fim]])
+
+    def com_novos_pares(self, pares):
+        """
+        Retorna uma NOVA matriz com os pares (cliente_id, produto_id) somados.
+        A matriz atual não é alterada, então quem ainda a estiver lendo não é afetado.
+        Só as linhas dos clientes dos pares são montadas e normalizadas de
+        novo; as demais são copiadas como estão (cópia dos arrays do CSR, sem
+        recalcular nada). Os mapas de ids só são copiados se aparecer um
+        cliente ou produto novo; senão são compartilhados com esta matriz.
+        """
+        import numpy as np
+        from scipy import sparse
+
+        indice_cliente, novos_clientes = self.indice_cliente, []
+        indice_produto, novos_produtos = self.indice_produto, []
+        linhas, colunas = [], []
+        for cliente_id, produto_id in dict.fromkeys(pares): # Sem repetidos, na ordem das vendas
+            if cliente_id not in indice_cliente:
+                if not novos_clientes:
+                    indice_cliente = dict(indice_cliente)
+                indice_cliente[cliente_id] = len(indice_cliente)
+                novos_clientes.append(cliente_id)
+            if produto_id not in indice_produto:
+                if not novos_produtos:
+                    indice_produto = dict(indice_produto)
+                indice_produto[produto_id] = len(indice_produto)
+                novos_produtos.append(produto_id)
+            linhas.append(indice_cliente[cliente_id])
+            colunas.append(indice_produto[produto_id])
+
+        cliente_ids = np.concatenate([self.cliente_ids, novos_clientes]).astype(self.cliente_ids.dtype) \
+            if novos_clientes else self.cliente_ids
+        produto_ids = np.concatenate([self.produto_ids, novos_produtos]).astype(self.produto_ids.dtype) \
+            if novos_produtos else self.produto_ids
+        formato = (len(cliente_ids), len(produto_ids))
+
+        # Linhas tocadas: as compras que já tinham (zeros nas linhas novas) + os pares
+        tocadas, posicao = np.unique(linhas, return_inverse=True)
+        antigas = _linhas_ou_vazias(self.matriz, tocadas, formato[1])
+        novos = sparse.csr_matrix((np.ones(len(linhas)), (posicao, colunas)), shape=antigas.shape)
+        substitutas = (antigas + novos).tocsr()
+        substitutas.data[:] = 1  # Compras repetidas continuam valendo 1
+
+        return MatrizCompras(
+            _trocar_linhas(self.matriz, tocadas, substitutas, formato),
+            cliente_ids, produto_ids, indice_cliente, indice_produto,
+            normalizada=_trocar_linhas(self.normalizada, tocadas, _normalizar(substitutas), formato),
+        )
+
+def _normalizar(matriz):
+    from sklearn.preprocessing import normalize # Só quando a matriz é montada, não ao importar
+    return normalize(matriz, norm='l2', axis=1)
+
+def _com_colunas(matriz, n_colunas):
+    """A mesma matriz CSR com mais colunas (vazias), sem copiar os arrays."""
+    from scipy import sparse
+
+    return sparse.csr_matrix((matriz.data, matriz.indices, matriz.indptr), shape=(matriz.shape[0], n_colunas))
+
+def _linhas_ou_vazias(matriz, linhas, n_colunas):
+    """As linhas informadas da matriz; linhas além do fim (clientes novos) vêm vazias."""
+    from scipy import sparse
+
+    existentes = linhas[linhas < matriz.shape[0]]
+    blocos = [_com_colunas(matriz[existentes], n_colunas)]
+    if len(existentes) < len(linhas):
+        blocos.append(sparse.csr_matrix((len(linhas) - len(existentes), n_colunas)))
+    return sparse.vstack(blocos, format='csr')
+
+def _trocar_linhas(matriz, linhas, substitutas, formato):
+    """
+    Nova matriz CSR com o 'formato' informado: as 'linhas' (ordenadas) vêm de
+    'substitutas', na mesma ordem, e as demais da matriz original. Linhas
+    além do fim da matriz original são sempre tocadas (clientes novos).
+    """
+    import numpy as np
+    from scipy import sparse
+
+    n_antigas = matriz.shape[0]
+    tamanhos = np.zeros(formato[0], dtype=np.int64)
+    tamanhos[:n_antigas] = np.diff(matriz.indptr)
+    tamanhos[linhas] = np.diff(substitutas.indptr)
+    indptr = np.concatenate([[0], np.cumsum(tamanhos)])
+    indices = np.empty(indptr[-1], dtype=matriz.indices.dtype)
+    dados = np.empty(indptr[-1], dtype=matriz.data.dtype)
+
+    def copiar(origem, de, ate, primeira_linha):
+        # Cópia de fatias contíguas: as linhas entre duas tocadas vão de uma vez
+        destino = indptr[primeira_linha]
+        indices[destino:destino + ate - de] = origem.indices[de:ate]
+        dados[destino:destino + ate - de] = origem.data[de:ate]
+
+    inicio = 0
+    for i, linha in enumerate(linhas):
+        fim = min(linha, n_antigas)
+        if fim > inicio:
+            copiar(matriz, matriz.indptr[inicio], matriz.indptr[fim], inicio)
+        copiar(substitutas, substitutas.indptr[i], substitutas.indptr[i + 1], linha)
+        inicio = linha + 1
+    if inicio < n_antigas:
+        copiar(matriz, matriz.indptr[inicio], matriz.indptr[n_antigas], inicio)
+    return sparse.csr_matrix((dados, indices, indptr), shape=formato)
+
+def _construir_matriz(pares):
+    import numpy as np
+    from scipy import sparse
+    import pandas as pd
+
+    df_sales = pd.DataFrame(pares, columns=['cliente_id', 'produto_id'])
+    cliente_ids, linhas = np.unique(df_sales['cliente_id'].to_numpy(), return_inverse=True)
+    produto_ids, colunas = np.unique(df_sales['produto_id'].to_numpy(), return_inverse=True)
+
+    matriz = sparse.csr_matrix(
+        (np.ones(len(df_sales)), (linhas, colunas)),
+        shape=(len(cliente_ids), len(produto_ids))
+    )
+    matriz.data[:] = 1
+    return MatrizCompras(matriz, cliente_ids, produto_ids)
+
+# Vendas podem ficar visíveis fora da ordem dos ids (no PostgreSQL, duas
+# compras simultâneas podem fazer commit na ordem inversa à dos ids da
+# sequência). Um id que falta abaixo do maior já lido fica pendente e é
+# procurado de novo a cada leitura, até aparecer ou passar deste tempo
+# (transação desfeita: o id nunca vai existir).
+ATRASO_MAXIMO_VENDA = 60 # segundos
+# Ao montar a matriz, só os ids desta faixa abaixo do maior contam como pendentes
+JANELA_PENDENTES = 1000
+# A matriz é remontada do zero depois deste tempo: pega exclusões feitas
+# por outros workers e qualquer venda que tenha escapado das pendentes
+INTERVALO_RECONSTRUCAO = 600 # segundos
+
+class EstadoMatriz:
+    """Matriz, maior id de venda lido e ids pendentes ({id: monotonic de quando faltou})."""
+    def __init__(self, matriz=None, ultimo_venda_id=0, pendentes=None, montada_em=None):
+        self.matriz = matriz
+        self.ultimo_venda_id = ultimo_venda_id
+        self.pendentes = pendentes or {}
+        self.montada_em = montada_em
+
+class CacheMatrizCompras:
+    """
+    Mantém a matriz de compras em memória, por processo.
+    Guarda o maior id de venda já aplicado: a cada leitura só as vendas novas
+    (id maior que esse) e as pendentes (ids que faltavam abaixo dele, ver
+    ATRASO_MAXIMO_VENDA) são buscadas e somadas à matriz, sem reconstruí-la.
+    Como a consulta olha a tabela, vendas feitas por outros workers também entram.
+    A cada INTERVALO_RECONSTRUCAO a matriz é montada de novo.
+
+    As consultas e a montagem rodam fora do lock, que só protege a troca do
+    estado: uma consulta lenta não segura as outras leituras. O estado novo
+    só é gravado se o atual ainda for aquele de onde ele partiu (uma
+    invalidação ou outra thread no meio descarta a troca).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._estado = EstadoMatriz()
+
+    def invalidar(self):
+        """Descarta a matriz; a próxima leitura a reconstrói do banco."""
+        with self._lock:
+            self._estado = EstadoMatriz()
+
+    def obter(self, sessao):
+        with self._lock:
+            estado = self._estado
+
+        agora = time.monotonic()
+        if estado.montada_em is None or agora - estado.montada_em > INTERVALO_RECONSTRUCAO:
+            novo = self._construir(sessao, agora)
+        else:
+            novo = self._aplicar_novas_vendas(estado, sessao, agora)
+            if novo is estado:
+                return estado.matriz
+
+        with self._lock:
+            if self._estado is estado:
+                self._estado = novo
+        return novo.matriz
+
+    def _construir(self, sessao, agora):
+        ultimo_id = sessao.query(db.func.max(Venda.id)).scalar()
+        if ultimo_id is None:
+            return EstadoMatriz(montada_em=agora)
+
+        # Consulta para pegar pares distintos de (cliente, produto)
+        pares = sessao.query(Venda.cliente_id, Venda.produto_id).filter(
+            Venda.id <= ultimo_id,
+            Venda.cliente_id.isnot(None),
+            Venda.produto_id.isnot(None)
+        ).distinct().all()
+
+        inicio_janela = max(ultimo_id - JANELA_PENDENTES, 0)
+        presentes = {vid for (vid,) in sessao.query(Venda.id).filter(Venda.id > inicio_janela)}
+        pendentes = {vid: agora for vid in range(inicio_janela + 1, ultimo_id) if vid not in presentes}
+
+        return EstadoMatriz(_construir_matriz(pares) if pares else None, ultimo_id, pendentes, agora)
+
+    def _aplicar_novas_vendas(self, estado, sessao, agora):
+        pendentes = {vid: desde for vid, desde in estado.pendentes.items()
+                     if agora - desde <= ATRASO_MAXIMO_VENDA}
+        filtro = Venda.id > estado.ultimo_venda_id
+        if pendentes:
+            filtro = db.or_(filtro, Venda.id.in_(list(pendentes)))
+        novas = sessao.query(Venda.id, Venda.cliente_id, Venda.produto_id).filter(filtro).order_by(Venda.id).all()
+
+        if not novas and len(pendentes) == len(estado.pendentes):
+            return estado
+
+        ultimo_id = max([estado.ultimo_venda_id] + [v.id for v in novas])
+        lidos = {v.id for v in novas}
+        for vid in lidos:
+            pendentes.pop(vid, None)
+        # Ids pulados entre o maior anterior e o novo: ainda podem aparecer
+        for vid in range(estado.ultimo_venda_id + 1, ultimo_id):
+            if vid not in lidos:
+                pendentes[vid] = agora
+
+        matriz = estado.matriz
+        pares = [(v.cliente_id, v.produto_id) for v in novas
+                 if v.cliente_id is not None and v.produto_id is not None]
+        if pares:
+            # Sem matriz ainda (só havia vendas sem cliente/produto): monta com os pares
+            matriz = matriz.com_novos_pares(pares) if matriz is not None else _construir_matriz(pares)
+        return EstadoMatriz(matriz, ultimo_id, pendentes, estado.montada_em)
+
+_caches_matriz = PorBanco(lambda engine: CacheMatrizCompras())
+
+def invalidar_matriz_compras():
+    """Força a reconstrução da matriz de compras na próxima recomendação."""
+    for cache in _caches_matriz.todos():
+        cache.invalidar()
+
+def get_purchase_matrix(sessao=None):
+    """
+    Retorna a matriz de compras cliente x produto (MatrizCompras) do cache
+    do processo, ou None se ainda não houver vendas.
+    [cite_start]As linhas são clientes e as colunas são produtos. [cite: 313, 314, 315, 316, 317]
+    """
+    sessao = sessao_padrao(sessao)
+    return _caches_matriz.obter(sessao.get_bind()).obter(sessao)
+
+def _escolher_vizinhos(sims, ids, k):
+    """
+    Ids dos 'k' maiores valores de 'sims', do maior para o menor; empates
+    ficam com o menor id primeiro. Usa argpartition em vez de ordenar tudo.
+    O desempate por id é intencional: o sort_values do pandas usado antes
+    (quicksort, não estável) devolvia os empatados numa ordem arbitrária.
+    """
+    import numpy as np
+
+    # Valor do k-ésimo maior; tudo acima dele entra, os empatados com ele
+    # entram em ordem de id até completar 'k'
+    limiar = sims[np.argpartition(-sims, k - 1)[k - 1]]
+    acima = np.flatnonzero(sims > limiar)
+    empatados = np.flatnonzero(sims == limiar)
+    faltam = k - len(acima)
+    if faltam < len(empatados):
+        empatados = empatados[np.argpartition(ids[empatados], faltam - 1)[:faltam]]
+    escolhidos = np.concatenate([acima, empatados])
+
+    ordem = np.lexsort((ids[escolhidos], -sims[escolhidos]))
+    return ids[escolhidos[ordem]].tolist()
+
+def vizinhos_mais_proximos(matrix, client_id, k):
+    """
+    Retorna os ids dos 'k' clientes mais similares (cosseno) ao cliente, do
+    mais para o menos similar; empates ficam com o menor id primeiro.
+    Calcula só a linha do cliente (uma linha esparsa vezes a matriz normalizada
+    transposta) e usa argpartition, sem montar a matriz cliente x cliente.
+    """
+    import numpy as np
+
+    linha = matrix.indice_cliente[client_id]
+    normalizada = matrix.normalizada
+    similaridades = (normalizada @ normalizada[linha].T).toarray().ravel()
+
+    # O próprio cliente nunca é vizinho de si mesmo
+    candidatos = np.delete(np.arange(len(similaridades)), linha)
+    if len(candidatos) == 0:
+        return []
+    k = min(k, len(candidatos))
+    return _escolher_vizinhos(similaridades[candidatos], matrix.cliente_ids[candidatos], k)
+
+# Limite de células (linhas do bloco x clientes) da matriz densa de
+# similaridades calculada de uma vez no modo em lote (~40 MB em float64)
+MAX_CELULAS_BLOCO = 5_000_000
+
+def vizinhos_em_lote(matrix, client_ids, k):
+    """
+    Mesmo resultado de vizinhos_mais_proximos para vários clientes, mas com
+    uma multiplicação esparsa por bloco de clientes em vez de uma por cliente.
+    Retorna {cliente_id: [ids dos vizinhos]}; clientes fora da matriz não aparecem.
+    """
+    import numpy as np
+
+    normalizada = matrix.normalizada
+    n_clientes = len(matrix.cliente_ids)
+    k = min(k, n_clientes - 1)
+    linhas = [matrix.indice_cliente[cid] for cid in client_ids if cid in matrix.indice_cliente]
+    if k < 1:
+        return {int(matrix.cliente_ids[linha]): [] for linha in linhas}
+
+    vizinhos = {}
+    tamanho_bloco = max(1, MAX_CELULAS_BLOCO // n_clientes)
+    for inicio in range(0, len(linhas), tamanho_bloco):
+        bloco = linhas[inicio:inicio + tamanho_bloco]
+        similaridades = (normalizada[bloco] @ normalizada.T).toarray()
+        for i, linha in enumerate(bloco):
+            sims = similaridades[i]
+            # O próprio cliente nunca é vizinho de si mesmo: fica abaixo de qualquer outro
+            sims[linha] = -np.inf
+            vizinhos[int(matrix.cliente_ids[linha])] = _escolher_vizinhos(sims, matrix.cliente_ids, k)
+    return vizinhos
 
 # versão 1: simples, sem KNN
-def recommend_for_client(client_id, n=3):
+def recommend_for_client(client_id, n=3, sessao=None):
     """
     Recomenda 'n' produtos para um cliente específico com base no cliente mais similar.
     [cite_start]Esta é a implementação do requisito básico. [cite: 410, 411, 413]
     """
-    matrix = get_purchase_matrix()
+    import numpy as np
+
+    sessao = sessao_padrao(sessao)
+    matrix = get_purchase_matrix(sessao)
     
     # Retorna uma lista vazia se não houver dados ou se o cliente não tiver compras
-    if matrix is None or client_id not in matrix.index:
+    if matrix is None or client_id not in matrix.indice_cliente:
         return []
 
-    # [cite_start]Calcula a similaridade de cosseno entre todos os clientes [cite: 397, 398]
-    client_similarity = cosine_similarity(matrix)
-    sim_df = pd.DataFrame(client_similarity, index=matrix.index, columns=matrix.index)
-
-    # Encontra os clientes mais parecidos com o cliente alvo
-    similar_clients = sim_df[client_id].drop(client_id).sort_values(ascending=False)
+    # [cite_start]Encontra o cliente mais parecido (o "vizinho" mais próximo) pela similaridade de cosseno [cite: 397, 398, 411]
+    similar_clients = vizinhos_mais_proximos(matrix, client_id, k=1)
     
     # Se não houver outros clientes para comparar, retorna lista vazia
-    if similar_clients.empty:
+    if not similar_clients:
         return []
 
-    # [cite_start]Pega o ID do cliente mais parecido (o "vizinho" mais próximo) [cite: 411]
-    closest_client_id = similar_clients.index[0]
+    closest_client_id = similar_clients[0]
 
     # Pega os produtos que o vizinho comprou
-    vizinho_comprou = matrix.loc[closest_client_id]
+    vizinho_comprou = matrix.produtos_do_cliente(matrix.indice_cliente[closest_client_id])
     
     # Pega os produtos que o cliente alvo já comprou
-    alvo_comprou = matrix.loc[client_id]
+    alvo_comprou = matrix.produtos_do_cliente(matrix.indice_cliente[client_id])
     
-    # Identifica os produtos que o vizinho comprou (valor 1) e o alvo não (valor 0)
-    recommended_product_ids = vizinho_comprou[(vizinho_comprou == 1) & (alvo_comprou == 0)].index.tolist()
+    # Identifica os produtos que o vizinho comprou e o alvo não
+    recommended_product_ids = np.setdiff1d(vizinho_comprou, alvo_comprou).tolist()
 
     # Busca os objetos de Produto no banco de dados e retorna os 'n' primeiros
-    recommended_products = Produto.query.filter(Produto.id.in_(recommended_product_ids)).limit(n).all()
+    recommended_products = sessao.query(Produto).filter(Produto.id.in_(recommended_product_ids)).limit(n).all()
     
     return recommended_products
 
-# versão 2: complexa, utiliza comparação com mais de um vizinho 
-def recommend_for_client_knn(client_id, k=3, n=3):
+def recomendar_ids_knn(matrix, client_id, k=3, n=3):
     """
-    Recomenda produtos com base nos 'k' vizinhos mais próximos.
-    [cite_start]Esta é a implementação do RECURSO EXTRA. [cite: 469, 451]
+    Núcleo do KNN: devolve os ids dos 'n' produtos mais frequentes entre os
+    'k' vizinhos que o cliente ainda não comprou. Não consulta o banco.
     """
-    matrix = get_purchase_matrix()
-    if matrix is None or client_id not in matrix.index:
+    if matrix is None or client_id not in matrix.indice_cliente:
         return []
 
-    client_similarity = cosine_similarity(matrix)
-    sim_df = pd.DataFrame(client_similarity, index=matrix.index, columns=matrix.index)
-
     # 1. Encontra os 'k' vizinhos mais próximos
-    similar_clients = sim_df[client_id].drop(client_id).sort_values(ascending=False)
-    if similar_clients.empty:
+    top_k_neighbors_ids = vizinhos_mais_proximos(matrix, client_id, k)
+    return _produtos_dos_vizinhos(matrix, client_id, top_k_neighbors_ids, n)
+
+def recomendar_ids_knn_lote(matrix, client_ids, k=3, n=3):
+    """
+    recomendar_ids_knn para vários clientes numa passada só pela matriz
+    (ver vizinhos_em_lote). Retorna {cliente_id: [ids de produtos]}; clientes
+    sem compras não aparecem.
+    """
+    if matrix is None:
+        return {}
+    return {
+        client_id: _produtos_dos_vizinhos(matrix, client_id, vizinhos, n)
+        for client_id, vizinhos in vizinhos_em_lote(matrix, client_ids, k).items()
+    }
+
+def _produtos_dos_vizinhos(matrix, client_id, top_k_neighbors_ids, n):
+    import numpy as np
+
+    if not top_k_neighbors_ids:
         return []
-    top_k_neighbors_ids = similar_clients.head(k).index
 
     # 2. Coleta todos os produtos que os vizinhos compraram e o alvo não
-    alvo_comprou = matrix.loc[client_id]
+    alvo_comprou = matrix.produtos_do_cliente(matrix.indice_cliente[client_id])
     recommended_product_ids = []
     
     for neighbor_id in top_k_neighbors_ids:
-        vizinho_comprou = matrix.loc[neighbor_id]
-        new_products = vizinho_comprou[(vizinho_comprou == 1) & (alvo_comprou == 0)].index.tolist()
+        vizinho_comprou = matrix.produtos_do_cliente(matrix.indice_cliente[neighbor_id])
+        new_products = np.setdiff1d(vizinho_comprou, alvo_comprou).tolist()
         recommended_product_ids.extend(new_products)
 
     # 3. Conta a frequência dos produtos e pega os mais populares
-    if not recommended_product_ids:
-        return []
-    
     product_counts = Counter(recommended_product_ids)
-    most_common_product_ids = [pid for pid, count in product_counts.most_common(n)]
+    return [int(pid) for pid, count in product_counts.most_common(n)]
+
+# versão 2: complexa, utiliza comparação com mais de um vizinho 
+@cronometrado('recomendacao_knn')
+def recommend_for_client_knn(client_id, k=3, n=3, sessao=None):
+    """
+    Recomenda produtos com base nos 'k' vizinhos mais próximos.
+    [cite_start]Esta é a implementação do RECURSO EXTRA. [cite: 469, 451]
+    """
+    sessao = sessao_padrao(sessao)
+    most_common_product_ids = recomendar_ids_knn(get_purchase_matrix(sessao), client_id, k, n)
+    if not most_common_product_ids:
+        return []
 
     # 4. Retorna os 'n' produtos mais populares
-    recommended_products = Produto.query.filter(Produto.id.in_(most_common_product_ids)).all()
+    recommended_products = sessao.query(Produto).filter(Produto.id.in_(most_common_product_ids)).all()
     
     return recommended_products
 
-def get_best_sellers(n=5):
+# versão 3: item a item, usa um índice de similaridade pré-calculado
+# Relativo a este arquivo, não ao diretório de onde o app (ou o
+# `flask construir-indice-itens`) foi iniciado: quem grava e quem lê usam o mesmo
+INDICE_ITENS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'indice_itens.npz')
+TOP_N_ITENS = 20
+BLOCO_PRODUTOS = 1000
+
+class IndiceItens:
     """
-    Busca os 'n' produtos mais vendidos com base na quantidade total em Vendas.
+    Para cada produto, os 'top_n' produtos mais comprados junto com ele
+    (similaridade de cosseno entre as colunas da matriz de compras).
+    'vizinhos' guarda posições em 'produto_ids' (-1 = sem vizinho) e
+    'scores' a similaridade correspondente.
     """
-    best_sellers = db.session.query(
-        Produto,
-        db.func.sum(Venda.quantidade).label('total_vendido')
-    ).join(Venda).group_by(Produto.id).order_by(db.desc('total_vendido')).limit(n).all()
-    
+    def __init__(self, produto_ids, vizinhos, scores):
+        self.produto_ids = produto_ids
+        self.vizinhos = vizinhos
+        self.scores = scores
+        self.posicao = {int(pid): i for i, pid in enumerate(produto_ids)}
+
+def construir_indice_itens(matrix, top_n=TOP_N_ITENS):
+    """
+    Monta o IndiceItens a partir da matriz de compras. Calcula a similaridade
+    produto x produto em blocos de linhas para limitar a memória.
+    """
+    import numpy as np
+    from sklearn.preprocessing import normalize
+
+    colunas = normalize(matrix.matriz.tocsc(), norm='l2', axis=0).tocsc()
+    transposta = colunas.T.tocsr()
+    n_produtos = colunas.shape[1]
+
+    vizinhos = np.full((n_produtos, top_n), -1, dtype=np.int32)
+    scores = np.zeros((n_produtos, top_n), dtype=np.float32)
+
+    for inicio in range(0, n_produtos, BLOCO_PRODUTOS):
+        bloco = (transposta[inicio:inicio + BLOCO_PRODUTOS] @ colunas).tocsr()
+        for i in range(bloco.shape[0]):
+            produto = inicio + i
+            ini, fim = bloco.indptr[i], bloco.indptr[i + 1]
+            cols, vals = bloco.indices[ini:fim], bloco.data[ini:fim]
+
+            # Um produto não é vizinho de si mesmo
+            outros = cols != produto
+            cols, vals = cols[outros], vals[outros]
+
+            if len(vals) > top_n:
+                selecao = np.argpartition(-vals, top_n - 1)[:top_n]
+                cols, vals = cols[selecao], vals[selecao]
+            ordem = np.lexsort((cols, -vals))
+            vizinhos[produto, :len(ordem)] = cols[ordem]
+            scores[produto, :len(ordem)] = vals[ordem]
+
+    return IndiceItens(np.asarray(matrix.produto_ids, dtype=np.int64), vizinhos, scores)
+
+def salvar_indice_itens(indice, caminho=INDICE_ITENS_PATH):
+    """Grava o índice em .npz (sem compressão) e troca o arquivo de forma atômica."""
+    import numpy as np
+
+    temporario = caminho + '.tmp'
+    with open(temporario, 'wb') as arquivo:
+        np.savez(arquivo, produto_ids=indice.produto_ids, vizinhos=indice.vizinhos, scores=indice.scores)
+    os.replace(temporario, caminho)
+
+class CacheIndiceItens:
+    """
+    Carrega o índice do disco uma vez por processo e recarrega sozinho
+    quando o arquivo é substituído (ex.: pela reconstrução noturna).
+    """
+    def __init__(self, caminho=INDICE_ITENS_PATH):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._indice = None
+        self._mtime = None
+
+    def obter(self):
+        import numpy as np
+
+        try:
+            mtime = os.path.getmtime(self.caminho)
+        except OSError:
+            return None # Índice ainda não foi construído
+
+        with self._lock:
+            if self._indice is None or mtime != self._mtime:
+                with np.load(self.caminho) as dados:
+                    self._indice = IndiceItens(dados['produto_ids'], dados['vizinhos'], dados['scores'])
+                self._mtime = mtime
+            return self._indice
+
+_cache_indice_itens = CacheIndiceItens()
+
+def recomendar_ids_itens(indice, comprados, n=3):
+    """
+    Núcleo do item a item: soma os scores dos vizinhos de cada produto já
+    comprado e devolve os ids dos 'n' melhores que o cliente ainda não tem.
+    É só consulta e soma sobre o índice; não há cálculo de matriz.
+    """
+    import numpy as np
+
+    if indice is None:
+        return []
+
+    linhas = [indice.posicao[int(pid)] for pid in comprados if int(pid) in indice.posicao]
+    if not linhas:
+        return []
+
+    vizinhos = indice.vizinhos[linhas].ravel()
+    scores = indice.scores[linhas].ravel()
+    validos = vizinhos >= 0
+    totais = np.bincount(vizinhos[validos], weights=scores[validos], minlength=len(indice.produto_ids))
+    totais[linhas] = 0 # Não recomenda o que o cliente já comprou
+
+    candidatos = np.flatnonzero(totais > 0)
+    if len(candidatos) == 0:
+        return []
+    ordem = np.lexsort((indice.produto_ids[candidatos], -totais[candidatos]))
+    return indice.produto_ids[candidatos[ordem[:n]]].tolist()
+
+@cronometrado('recomendacao_itens')
+def recommend_for_client_itens(client_id, n=3, sessao=None):
+    """
+    Recomenda produtos parecidos com os que o cliente já comprou, usando o
+    índice item a item gravado em disco (ver construir_indice_itens).
+    """
+    sessao = sessao_padrao(sessao)
+    matrix = get_purchase_matrix(sessao)
+    if matrix is None or client_id not in matrix.indice_cliente:
+        return []
+
+    comprados = matrix.produtos_do_cliente(matrix.indice_cliente[client_id])
+    product_ids = recomendar_ids_itens(_cache_indice_itens.obter(), comprados, n)
+    if not product_ids:
+        return []
+
+    # Mantém a ordem do índice (mais similar primeiro)
+    recommended_products = sessao.query(Produto).filter(Produto.id.in_(product_ids)).all()
+    recommended_products.sort(key=lambda p: product_ids.index(p.id))
+    return recommended_products
+
+def reconstruir_indice_itens(caminho=INDICE_ITENS_PATH, top_n=TOP_N_ITENS, sessao=None):
+    """
+    Reconstrói o índice item a item a partir da tabela 'venda' e grava em disco.
+    Feito para rodar fora do horário de pico (ex.: todas as noites).
+    Retorna o número de produtos no índice.
+    """
+    invalidar_matriz_compras()
+    matrix = get_purchase_matrix(sessao)
+    if matrix is None:
+        return 0
+    indice = construir_indice_itens(matrix, top_n)
+    salvar_indice_itens(indice, caminho)
+    return len(indice.produto_ids)
+
+# ==========================================================
+# Cache de recomendações por cliente
+# ==========================================================
+# Guarda a resposta de /recomendar/cliente/<id> por (cliente, motor).
+# Backend escolhido por CACHE_RECOMENDACOES:
+# - memoria (padrão): LRU + TTL no próprio processo (um worker só);
+# - banco: tabela 'cache_recomendacao', compartilhada entre os workers do gunicorn;
+# - desligado: sem cache.
+# Uma venda invalida só o cliente que comprou; mudanças no catálogo limpam
+# tudo. Recomendações de outros clientes que mudam indiretamente (o cliente
+# é vizinho deles) expiram pelo TTL (CACHE_RECOMENDACOES_TTL, em segundos).
+# Todos os backends recebem a sessão de quem chama; só o de banco a usa.
+
+TTL_RECOMENDACOES = 600
+LIMITE_RECOMENDACOES = 10_000
+
+class CacheRecomendacoesMemoria:
+    """LRU com validade, por processo."""
+    nome = 'memoria'
+
+    def __init__(self, ttl=TTL_RECOMENDACOES, limite=LIMITE_RECOMENDACOES):
+        self.ttl = ttl
+        self.limite = limite
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()
+
+    def obter(self, cliente_id, motor, sessao):
+        chave = (cliente_id, motor)
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            expira_em, valor = item
+            if expira_em <= time.monotonic():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    def guardar(self, cliente_id, motor, valor, sessao):
+        with self._lock:
+            self._itens[(cliente_id, motor)] = (time.monotonic() + self.ttl, valor)
+            self._itens.move_to_end((cliente_id, motor))
+            while len(self._itens) > self.limite:
+                self._itens.popitem(last=False)
+
+    def invalidar_cliente(self, cliente_id, sessao):
+        with self._lock:
+            for chave in [chave for chave in self._itens if chave[0] == cliente_id]:
+                del self._itens[chave]
+
+    def limpar(self, sessao):
+        with self._lock:
+            self._itens.clear()
+
+    def tamanho(self, sessao):
+        return len(self._itens)
+
+class CacheRecomendacoesBanco:
+    """
+    Cache na tabela 'cache_recomendacao': todos os workers leem e invalidam
+    as mesmas entradas. Grava numa conexão própria, fora da transação da
+    requisição. Entradas vencidas são apagadas de tempos em tempos.
+    """
+    nome = 'banco'
+
+    def __init__(self, ttl=TTL_RECOMENDACOES):
+        self.ttl = ttl
+        self._gravacoes = 0
+
+    def obter(self, cliente_id, motor, sessao):
+        valor = sessao.execute(db.text("""
+            SELECT valor FROM cache_recomendacao
+            WHERE cliente_id = :cliente AND motor = :motor AND expira_em > :agora
+        """), {'cliente': cliente_id, 'motor': motor, 'agora': datetime.utcnow()}).scalar()
+        return json.loads(valor) if valor is not None else None
+
+    def guardar(self, cliente_id, motor, valor, sessao):
+        agora = datetime.utcnow()
+        with sessao.get_bind().begin() as conexao:
+            conexao.execute(db.text("""
+                INSERT INTO cache_recomendacao (cliente_id, motor, valor, expira_em)
+                VALUES (:cliente, :motor, :valor, :expira_em)
+                ON CONFLICT (cliente_id, motor) DO UPDATE
+                SET valor = excluded.valor, expira_em = excluded.expira_em
+            """), {'cliente': cliente_id, 'motor': motor, 'valor': json.dumps(valor),
+                   'expira_em': agora + timedelta(seconds=self.ttl)})
+            self._gravacoes += 1
+            if self._gravacoes % 100 == 0:
+                conexao.execute(db.text("DELETE FROM cache_recomendacao WHERE expira_em <= :agora"), {'agora': agora})
+
+    def invalidar_cliente(self, cliente_id, sessao):
+        with sessao.get_bind().begin() as conexao:
+            conexao.execute(db.text("DELETE FROM cache_recomendacao WHERE cliente_id = :cliente"), {'cliente': cliente_id})
+
+    def limpar(self, sessao):
+        with sessao.get_bind().begin() as conexao:
+            conexao.execute(db.text("DELETE FROM cache_recomendacao"))
+
+    def tamanho(self, sessao):
+        return sessao.execute(db.text("SELECT COUNT(*) FROM cache_recomendacao")).scalar()
+
+class CacheRecomendacoesDesligado:
+    nome = 'desligado'
+
+    def obter(self, cliente_id, motor, sessao):
+        return None
+
+    def guardar(self, cliente_id, motor, valor, sessao):
+        pass
+
+    def invalidar_cliente(self, cliente_id, sessao):
+        pass
+
+    def limpar(self, sessao):
+        pass
+
+    def tamanho(self, sessao):
+        return 0
+
+BACKENDS_CACHE_RECOMENDACOES = {
+    'memoria': CacheRecomendacoesMemoria,
+    'banco': CacheRecomendacoesBanco,
+    'desligado': CacheRecomendacoesDesligado,
+}
+
+class EstatisticasCache:
+    """Contadores de acertos e falhas do cache neste processo."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def registrar(self, acerto):
+        with self._lock:
+            if acerto:
+                self.acertos += 1
+            else:
+                self.falhas += 1
+
+def _criar_cache_recomendacoes():
+    nome = os.getenv('CACHE_RECOMENDACOES', 'memoria')
+    if nome not in BACKENDS_CACHE_RECOMENDACOES:
+        raise ValueError(f"CACHE_RECOMENDACOES inválido: {nome}")
+    if nome == 'desligado':
+        return CacheRecomendacoesDesligado()
+    return BACKENDS_CACHE_RECOMENDACOES[nome](ttl=int(os.getenv('CACHE_RECOMENDACOES_TTL', TTL_RECOMENDACOES)))
+
+_caches_recomendacoes = PorBanco(lambda engine: _criar_cache_recomendacoes())
+_estatisticas_recomendacoes = EstatisticasCache()
+
+def _calcular_recomendacao(client_id, motor, sessao):
+    # Tenta obter recomendações personalizadas primeiro
+    if motor == 'itens':
+        produtos_recomendados = recommend_for_client_itens(client_id=client_id, sessao=sessao)
+    else:
+        produtos_recomendados = recommend_for_client_knn(client_id=client_id, sessao=sessao)
+
+    # Se a lista de recomendações personalizadas estiver vazia...
+    if not produtos_recomendados:
+        # ...busque os produtos mais vendidos como um fallback.
+        produtos_recomendados = get_best_sellers(n=3, sessao=sessao) # Pega os 3 mais vendidos
+        tipo_recomendacao = 'fallback'
+    else:
+        tipo_recomendacao = 'personalizada'
+
+    return {
+        'tipo': tipo_recomendacao,
+        'motor': motor,
+        'produtos': [{'id': p.id, 'nome': p.nome, 'preco': p.preco} for p in produtos_recomendados]
+    }
+
+def recomendacao_para_cliente(client_id, motor='knn', sessao=None):
+    """
+    Resposta de /recomendar/cliente/<id> ({'tipo', 'motor', 'produtos'}),
+    vinda do cache quando possível. 'motor' é 'knn' ou 'itens'.
+    """
+    sessao = sessao_padrao(sessao)
+    cache = _caches_recomendacoes.obter(sessao.get_bind())
+    resultado = cache.obter(client_id, motor, sessao)
+    _estatisticas_recomendacoes.registrar(acerto=resultado is not None)
+    if resultado is None:
+        resultado = _calcular_recomendacao(client_id, motor, sessao)
+        cache.guardar(client_id, motor, resultado, sessao)
+    return resultado
+
+def invalidar_recomendacoes_cliente(cliente_id, sessao=None):
+    """Descarta as recomendações em cache de um cliente (ex.: após uma compra dele)."""
+    sessao = sessao_padrao(sessao)
+    _caches_recomendacoes.obter(sessao.get_bind()).invalidar_cliente(cliente_id, sessao)
+
+def invalidar_recomendacoes(sessao=None):
+    """Descarta todas as recomendações em cache (ex.: após mudar o catálogo)."""
+    sessao = sessao_padrao(sessao)
+    _caches_recomendacoes.obter(sessao.get_bind()).limpar(sessao)
+
+def estatisticas_cache_recomendacoes(sessao=None):
+    sessao = sessao_padrao(sessao)
+    cache = _caches_recomendacoes.obter(sessao.get_bind())
+    acertos = _estatisticas_recomendacoes.acertos
+    falhas = _estatisticas_recomendacoes.falhas
+    return {
+        'backend': cache.nome,
+        'acertos': acertos,
+        'falhas': falhas,
+        'taxa_acerto': acertos / (acertos + falhas) if acertos + falhas else None,
+        'entradas': cache.tamanho(sessao),
+        'pid': os.getpid() # Contadores são por processo (worker)
+    }
+
+def get_best_sellers(n=5, dias=None, sessao=None):
+    """
+    Busca os 'n' produtos mais vendidos com base na quantidade total vendida,
+    lendo os totais por produto já calculados (sales_engine.mais_vendidos).
+    Com 'dias', considera só os últimos 'dias' dias (ex.: dias=7).
+    """
+    from sales_engine import mais_vendidos
+
     # A consulta retorna uma lista de tuplas (Objeto Produto, total_vendido)
     # Nós queremos apenas a lista de objetos Produto.
-    return [produto for produto, total in best_sellers]
\ No newline at end of file
+    return [produto for produto, total in mais_vendidos(n, dias=dias, sessao=sessao)]
@@ -0,0 +1,220 @@
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.exc import OperationalError
+from models import db, sessao_padrao, Cliente, Produto, Pedido, Venda, ProdutoVendas, ProdutoVendasDia
+from classification_engine import atualizar_rfm_cliente, reclassificar_cliente
+
+# Tentativas quando o SQLite responde "database is locked" (outro worker gravando)
+TENTATIVAS_BANCO_OCUPADO = 6
+ESPERA_INICIAL = 0.02 # segundos; dobra a cada tentativa, com um pouco de aleatoriedade
+
+class EstoqueInsuficiente(ValueError):
+    """Algum item do pedido pede mais unidades do que há em estoque."""
+    def __init__(self, produtos):
+        self.produtos = produtos
+        nomes = ', '.join(produto.nome for produto in produtos)
+        super().__init__(f"Estoque insuficiente: {nomes}")
+
+def agrupar_itens(itens):
+    """
+    Normaliza os itens do carrinho [(produto_id, quantidade), ...]: converte
+    para int, soma linhas repetidas do mesmo produto e mantém a ordem.
+    Levanta ValueError para carrinho vazio ou quantidade menor que 1.
+    """
+    quantidades = {}
+    for produto_id, quantidade in itens:
+        produto_id, quantidade = int(produto_id), int(quantidade)
+        if quantidade < 1:
+            raise ValueError("A quantidade deve ser pelo menos 1.")
+        quantidades[produto_id] = quantidades.get(produto_id, 0) + quantidade
+    if not quantidades:
+        raise ValueError("O pedido não tem itens.")
+    return quantidades
+
+def _banco_ocupado(erro):
+    return 'database is locked' in str(erro.orig) or 'database is busy' in str(erro.orig)
+
+def registrar_pedido(cliente_id, itens, sessao=None):
+    """
+    Registra um pedido com todos os itens numa única transação:
+    baixa o estoque de todos os produtos com um único UPDATE condicional
+    (CASE por produto), grava as linhas com um insert em lote, atualiza o
+    agregado RFM, recalcula o segmento gravado do cliente e faz um único commit.
+
+    'itens' é uma lista de (produto_id, quantidade). Levanta ValueError
+    (ou EstoqueInsuficiente) sem gravar nada se algum item for inválido.
+    Se o banco estiver ocupado por outro processo, tenta de novo algumas
+    vezes, esperando cada vez mais. Usa 'sessao' (ou db.session) e faz
+    commit nela. Retorna o Pedido gravado.
+    """
+    sessao = sessao_padrao(sessao)
+    quantidades = agrupar_itens(itens)
+    cliente_id = int(cliente_id)
+
+    for tentativa in range(TENTATIVAS_BANCO_OCUPADO):
+        try:
+            pedido = _gravar_pedido(sessao, cliente_id, quantidades)
+            break
+        except OperationalError as e:
+            sessao.rollback()
+            if not _banco_ocupado(e) or tentativa == TENTATIVAS_BANCO_OCUPADO - 1:
+                raise
+            time.sleep(ESPERA_INICIAL * 2 ** tentativa * random.uniform(0.5, 1.5))
+        except Exception:
+            sessao.rollback()
+            raise
+
+    # Depois do commit: as recomendações guardadas do cliente não valem mais
+    from recommendation_engine import invalidar_recomendacoes_cliente
+    invalidar_recomendacoes_cliente(cliente_id, sessao)
+    return pedido
+
+def _gravar_pedido(sessao, cliente_id, quantidades):
+    cliente = sessao.get(Cliente, cliente_id)
+    if cliente is None:
+        raise ValueError("Cliente não encontrado.")
+
+    produtos = {p.id: p for p in sessao.query(Produto).filter(Produto.id.in_(quantidades)).all()}
+    faltando = [produto_id for produto_id in quantidades if produto_id not in produtos]
+    if faltando:
+        raise ValueError(f"Produto não encontrado: {', '.join(map(str, faltando))}")
+
+    # Checagem rápida com o estoque lido agora; quem decide é o UPDATE abaixo
+    sem_estoque = [produtos[pid] for pid, qtd in quantidades.items() if (produtos[pid].quantidade or 0) < qtd]
+    if sem_estoque:
+        raise EstoqueInsuficiente(sem_estoque)
+
+    agora = datetime.utcnow()
+    linhas = [
+        {
+            'cliente_id': cliente_id,
+            'produto_id': produto_id,
+            'quantidade': quantidade,
+            'valor_total': float(produtos[produto_id].preco) * quantidade,
+            'data_venda': agora
+        }
+        for produto_id, quantidade in quantidades.items()
+    ]
+
+    # Baixa de estoque atômica: só altera os produtos que ainda têm a quantidade
+    # pedida no momento do UPDATE. Se outro worker vendeu antes, alguma linha
+    # fica de fora e o pedido inteiro é desfeito (não vende além do estoque).
+    pedida = db.case(quantidades, value=Produto.id)
+    resultado = sessao.execute(
+        db.update(Produto)
+        .where(Produto.id.in_(quantidades), Produto.quantidade >= pedida)
+        .values(quantidade=Produto.quantidade - pedida)
+        .execution_options(synchronize_session=False)
+    )
+    if resultado.rowcount != len(quantidades):
+        sessao.rollback()
+        atuais = sessao.query(Produto).filter(Produto.id.in_(quantidades)).all()
+        raise EstoqueInsuficiente([p for p in atuais if (p.quantidade or 0) < quantidades[p.id]])
+
+    pedido = Pedido(
+        cliente_id=cliente_id,
+        data_pedido=agora,
+        valor_total=sum(linha['valor_total'] for linha in linhas)
+    )
+    sessao.add(pedido)
+    sessao.flush() # Gera o id do pedido para as linhas
+
+    for linha in linhas:
+        linha['pedido_id'] = pedido.id
+    sessao.execute(db.insert(Venda), linhas)
+
+    # Agregados na mesma transação: RFM (o pedido conta como uma compra) e mais vendidos
+    atualizar_rfm_cliente(cliente_id, pedido.valor_total, agora, sessao)
+    atualizar_vendas_produtos(linhas, sessao)
+    # O segmento muda com a compra: recalculado com o RFM já atualizado, no
+    # mesmo commit, para o cliente continuar nos filtros e campanhas por segmento
+    cliente.segmento = reclassificar_cliente(cliente_id, sessao)
+    sessao.commit()
+    return pedido
+
+# ==========================================================
+# Agregado de vendas por produto (tabelas produto_vendas e produto_vendas_dia)
+# ==========================================================
+
+def atualizar_vendas_produtos(linhas, sessao=None):
+    """
+    Soma as linhas de venda ({'produto_id', 'quantidade', 'valor_total',
+    'data_venda'}) aos totais por produto e por produto/dia, com um upsert em
+    lote em cada tabela. Não faz commit: roda na transação do pedido.
+    """
+    sessao = sessao_padrao(sessao)
+    sessao.execute(db.text("""
+        INSERT INTO produto_vendas (produto_id, total_quantidade, total_receita, ultima_venda)
+        VALUES (:produto_id, :quantidade, :valor_total, :data_venda)
+        ON CONFLICT (produto_id) DO UPDATE SET
+            total_quantidade = produto_vendas.total_quantidade + excluded.total_quantidade,
+            total_receita = produto_vendas.total_receita + excluded.total_receita,
+            ultima_venda = CASE WHEN excluded.ultima_venda > produto_vendas.ultima_venda
+                                THEN excluded.ultima_venda ELSE produto_vendas.ultima_venda END
+    """).bindparams(db.bindparam('data_venda', type_=db.DateTime)), linhas)
+    sessao.execute(db.text("""
+        INSERT INTO produto_vendas_dia (dia, produto_id, quantidade, receita)
+        VALUES (:dia, :produto_id, :quantidade, :valor_total)
+        ON CONFLICT (dia, produto_id) DO UPDATE SET
+            quantidade = produto_vendas_dia.quantidade + excluded.quantidade,
+            receita = produto_vendas_dia.receita + excluded.receita
+    """).bindparams(db.bindparam('dia', type_=db.Date)), [dict(linha, dia=linha['data_venda'].date()) for linha in linhas])
+
+def reconstruir_vendas_produtos(sessao=None):
+    """
+    Recria produto_vendas e produto_vendas_dia do zero a partir de 'venda'
+    e faz commit. Retorna o número de produtos com vendas.
+    """
+    sessao = sessao_padrao(sessao)
+    dia = "date(data_venda)" if sessao.get_bind().dialect.name == 'sqlite' else "CAST(data_venda AS DATE)"
+    sessao.execute(db.text("DELETE FROM produto_vendas"))
+    sessao.execute(db.text("DELETE FROM produto_vendas_dia"))
+    sessao.execute(db.text("""
+        INSERT INTO produto_vendas (produto_id, total_quantidade, total_receita, ultima_venda)
+        SELECT produto_id, SUM(quantidade), SUM(valor_total), MAX(data_venda)
+        FROM venda
+        WHERE produto_id IS NOT NULL
+        GROUP BY produto_id
+    """))
+    sessao.execute(db.text(f"""
+        INSERT INTO produto_vendas_dia (dia, produto_id, quantidade, receita)
+        SELECT {dia}, produto_id, SUM(quantidade), SUM(valor_total)
+        FROM venda
+        WHERE produto_id IS NOT NULL
+        GROUP BY {dia}, produto_id
+    """))
+    sessao.commit()
+    return sessao.execute(db.text("SELECT COUNT(*) FROM produto_vendas")).scalar()
+
+def mais_vendidos(n=5, dias=None, inicio=None, fim=None, por='quantidade', sessao=None):
+    """
+    Os 'n' produtos mais vendidos, como lista de (Produto, total), lidos dos
+    agregados (sem varrer 'venda').
+    - sem janela: totais de todas as vendas (produto_vendas);
+    - dias=7: últimos 7 dias, incluindo hoje (UTC);
+    - inicio/fim (datas, fim excluído): janela qualquer.
+    'por' é 'quantidade' ou 'receita'. Empates ficam com o menor id.
+    """
+    sessao = sessao_padrao(sessao)
+    if dias is not None:
+        fim = datetime.utcnow().date() + timedelta(days=1)
+        inicio = fim - timedelta(days=dias)
+
+    if inicio is None and fim is None:
+        total = ProdutoVendas.total_quantidade if por == 'quantidade' else ProdutoVendas.total_receita
+        query = sessao.query(Produto, total).join(ProdutoVendas, ProdutoVendas.produto_id == Produto.id)
+    else:
+        # Só as linhas de produto/dia da janela: cresce com o tamanho da janela, não com o histórico
+        coluna = ProdutoVendasDia.quantidade if por == 'quantidade' else ProdutoVendasDia.receita
+        total = db.func.sum(coluna)
+        subconsulta = sessao.query(ProdutoVendasDia.produto_id, total.label('total'))
+        if inicio is not None:
+            subconsulta = subconsulta.filter(ProdutoVendasDia.dia >= inicio)
+        if fim is not None:
+            subconsulta = subconsulta.filter(ProdutoVendasDia.dia < fim)
+        subconsulta = subconsulta.group_by(ProdutoVendasDia.produto_id).subquery()
+        total = subconsulta.c.total
+        query = sessao.query(Produto, total).join(subconsulta, subconsulta.c.produto_id == Produto.id)
+
+    return query.order_by(total.desc(), Produto.id).limit(n).all()
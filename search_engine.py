@@ -0,0 +1,106 @@
+import re
+from datetime import datetime, timedelta
+from models import db, sessao_padrao, normalizar_busca, Cliente, Produto, Venda
+
+LIMITE_PADRAO = 10
+LIMITE_MAXIMO = 50
+
+# Maior caractere do BMP: o intervalo [prefixo, prefixo + FIM_PREFIXO) cobre todos os textos que começam com o prefixo
+FIM_PREFIXO = '\uffff'
+
+def _comeca_com(expressao, prefixo):
+    """
+    Filtro de prefixo escrito como intervalo (>= prefixo e < prefixo + '\\uffff'),
+    que o banco resolve com o índice da coluna, ao contrário de LIKE.
+    """
+    return db.and_(expressao >= prefixo, expressao < prefixo + FIM_PREFIXO)
+
+def buscar_clientes(termo, limite=LIMITE_PADRAO, sessao=None):
+    """
+    Clientes cujo nome ou email começa com 'termo', sem diferenciar maiúsculas
+    nem acentos ("ânge" e "ange" acham "Ângela"): compara com as colunas
+    normalizadas nome_busca/email_busca, indexadas.
+    """
+    prefixo = normalizar_busca(termo.strip())
+    if not prefixo:
+        return []
+
+    return sessao_padrao(sessao).query(Cliente).filter(db.or_(
+        _comeca_com(Cliente.nome_busca, prefixo),
+        _comeca_com(Cliente.email_busca, prefixo)
+    )).order_by(Cliente.nome_busca).limit(limite).all()
+
+# ==========================================================
+# Busca de produtos (FTS5 no SQLite)
+# ==========================================================
+# A tabela 'produto_fts' e os triggers que a sincronizam com 'produto'
+# são criados pela migração 4 (migrations.py).
+
+def _consulta_fts(termo):
+    """Transforma o texto digitado em consulta FTS5: cada palavra vira um prefixo ("pal"*)."""
+    palavras = re.findall(r'\w+', termo, flags=re.UNICODE)
+    return ' '.join(f'"{palavra}"*' for palavra in palavras)
+
+def buscar_produtos(termo, limite=LIMITE_PADRAO, somente_em_estoque=False, sessao=None):
+    """
+    Produtos cujo nome ou descrição contém todas as palavras de 'termo'
+    (como prefixo), do mais relevante para o menos relevante.
+    """
+    consulta = _consulta_fts(termo)
+    if not consulta:
+        return []
+
+    sessao = sessao_padrao(sessao)
+    if sessao.get_bind().dialect.name == 'sqlite':
+        sql = """
+            SELECT p.id
+            FROM produto_fts
+            JOIN produto p ON p.id = produto_fts.rowid
+            WHERE produto_fts MATCH :consulta
+        """
+        if somente_em_estoque:
+            sql += " AND p.quantidade > 0"
+        sql += " ORDER BY produto_fts.rank LIMIT :limite"
+        ids = [linha.id for linha in sessao.execute(db.text(sql), {'consulta': consulta, 'limite': limite})]
+        if not ids:
+            return []
+        produtos = sessao.query(Produto).filter(Produto.id.in_(ids)).all()
+        produtos.sort(key=lambda p: ids.index(p.id))
+        return produtos
+
+    # Outros bancos: cada palavra precisa aparecer no nome ou na descrição
+    query = sessao.query(Produto)
+    for palavra in re.findall(r'\w+', termo, flags=re.UNICODE):
+        padrao = f'%{palavra}%'
+        query = query.filter(db.or_(Produto.nome.ilike(padrao), Produto.descricao.ilike(padrao)))
+    if somente_em_estoque:
+        query = query.filter(Produto.quantidade > 0)
+    return query.order_by(Produto.nome).limit(limite).all()
+
+# ==========================================================
+# Filtros de vendas
+# ==========================================================
+
+def filtrar_vendas(query, args):
+    """
+    Aplica os filtros opcionais ?cliente_id=, ?produto_id=, ?de=AAAA-MM-DD e
+    ?ate=AAAA-MM-DD (incluído) a uma consulta de Venda.
+    Levanta ValueError para valores inválidos.
+    """
+    if args.get('cliente_id'):
+        query = query.filter(Venda.cliente_id == int(args['cliente_id']))
+    if args.get('produto_id'):
+        query = query.filter(Venda.produto_id == int(args['produto_id']))
+    if args.get('de'):
+        query = query.filter(Venda.data_venda >= datetime.strptime(args['de'], '%Y-%m-%d'))
+    if args.get('ate'):
+        query = query.filter(Venda.data_venda < datetime.strptime(args['ate'], '%Y-%m-%d') + timedelta(days=1))
+    return query
+
+def limite_da_requisicao(args):
+    """Lê ?limite= da URL, entre 1 e LIMITE_MAXIMO."""
+    try:
+        limite = int(args.get('limite', LIMITE_PADRAO))
+    except ValueError:
+        limite = LIMITE_PADRAO
+    return max(1, min(limite, LIMITE_MAXIMO))